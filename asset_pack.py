@@ -0,0 +1,241 @@
+# asset_pack.py (テンプレート/アイコン/フェスオーバーレイを「描画サイズの生RGBA」で1ファイルにまとめる)
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+
+# ==========================
+# ★ フォーマット
+# ==========================
+#   MAGIC(8) | FORMAT_VERSION(u32) | manifest長(u32) | manifest(JSON) | パディング | 生RGBAデータ...
+#   manifest["entries"][name] = {"offset", "length", "size": [w, h], "mode"}
+#   （build_pack で作った pack のみ）manifest["sources"][path] = {"sha256", "size", "mtime_ns"}
+MAGIC = b"SPL3PACK"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII")
+ALIGN = 16
+
+ASSET_PACK_PATH = os.getenv("ASSET_PACK_PATH", ".cache/assets.pack")
+
+
+def sprite_key(path: str, size) -> str:
+    """
+    リサイズ済みスプライトのエントリ名（例: icon/AREA.png@45x45）
+    """
+    return f"{os.path.normpath(path)}@{int(size[0])}x{int(size[1])}"
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _spec_hash(spec) -> str:
+    """
+    spec（エントリ名 → (元ファイル, サイズ)）そのもののハッシュ。座標変更でサイズが変わったら作り直す。
+    """
+    norm = {name: [os.path.normpath(src), list(size) if size else None] for name, (src, size) in spec.items()}
+    return hashlib.sha256(json.dumps(norm, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ==========================
+# ★ 書き込み
+# ==========================
+def write_raw_pack(pack_path: str, images, meta=None):
+    """
+    images: {エントリ名: PIL.Image} を生バイトのまま1ファイルに書き出す。
+    meta はそのまま manifest に入る（読み込み側で AssetPack.manifest から参照する）。
+    """
+    blobs = []
+    entries = {}
+    offset = 0
+
+    for name, img in sorted(images.items()):
+        raw = img.tobytes()
+        entries[name] = {
+            "offset": offset,
+            "length": len(raw),
+            "size": list(img.size),
+            "mode": img.mode,
+        }
+        blobs.append(raw)
+        pad = (-len(raw)) % ALIGN
+        if pad:
+            blobs.append(b"\0" * pad)
+        offset += len(raw) + pad
+
+    manifest = dict(meta or {})
+    manifest["formatVersion"] = FORMAT_VERSION
+    manifest["entries"] = entries
+
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    head = HEADER.pack(MAGIC, FORMAT_VERSION, len(manifest_bytes)) + manifest_bytes
+    head += b"\0" * ((-len(head)) % ALIGN)
+
+    out_dir = os.path.dirname(pack_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    # ★書き込み途中のファイルを他プロセスが mmap しないよう、一時ファイル → rename
+    tmp_path = f"{pack_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(head)
+        for b in blobs:
+            f.write(b)
+    os.replace(tmp_path, pack_path)
+
+    return manifest, len(head) + offset
+
+
+def build_pack(pack_path: str, spec):
+    """
+    spec: {エントリ名: (元画像パス, (w, h) or None)} から asset pack を作る。
+    size=None は元サイズのまま。各画像は convert("RGBA") → resize() 済みの生バイトで保存するので、
+    読み込み側はデコードもリサイズもせずにそのまま貼れる。
+    """
+    sources = {}
+    decoded = {}
+    images = {}
+    entry_sources = {}
+
+    for name, (src, size) in sorted(spec.items()):
+        src = os.path.normpath(src)
+        if src not in decoded:
+            decoded[src] = Image.open(src).convert("RGBA")
+            st = os.stat(src)
+            sources[src] = {"sha256": _sha256_file(src), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        images[name] = decoded[src] if size is None else decoded[src].resize((int(size[0]), int(size[1])))
+        entry_sources[name] = src
+
+    spec_hash = _spec_hash(spec)
+    version = hashlib.sha256(
+        json.dumps({"specHash": spec_hash, "sources": {k: v["sha256"] for k, v in sources.items()}},
+                   sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+    manifest, total = write_raw_pack(pack_path, images, {
+        "specHash": spec_hash,
+        "sources": sources,
+        "entrySources": entry_sources,
+        "version": version,
+    })
+
+    print(f"[INFO] asset pack built: {pack_path} entries={len(images)} bytes={total} version={version}")
+    return manifest
+
+
+# ==========================
+# ★ 読み込み（mmap）
+# ==========================
+class AssetPack:
+    """
+    asset pack を mmap して、エントリを PIL.Image として返す。
+    返す画像は mmap 上のバッファをそのまま参照する読み取り専用画像なので、
+    描画先にする場合は .copy() すること（貼り付け元/マスクとしてはそのまま使える）。
+    """
+
+    def __init__(self, pack_path: str):
+        self.path = pack_path
+        self._file = open(pack_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = None
+        self._images = {}
+
+        magic, fmt, manifest_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"unsupported asset pack: {pack_path} (magic={magic!r} format={fmt})")
+
+        start = HEADER.size
+        self.manifest = json.loads(self._mm[start:start + manifest_len].decode("utf-8"))
+        self._data_start = start + manifest_len + ((-(start + manifest_len)) % ALIGN)
+        self._view = memoryview(self._mm)
+
+    @property
+    def version(self) -> str:
+        return self.manifest.get("version", "")
+
+    @property
+    def entries(self):
+        return self.manifest.get("entries", {})
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def image(self, name: str) -> Image.Image:
+        img = self._images.get(name)
+        if img is None:
+            e = self.entries[name]
+            off = self._data_start + e["offset"]
+            buf = self._view[off:off + e["length"]]
+            img = Image.frombuffer(e["mode"], tuple(e["size"]), buf, "raw", e["mode"], 0, 1)
+            self._images[name] = img
+        return img
+
+    def is_stale(self, spec) -> bool:
+        """
+        spec が変わった / 元画像のチェックサムが変わった / 元画像が増減した場合に True。
+        サイズと mtime が同じファイルはハッシュ計算を省略する。
+        """
+        if self.manifest.get("specHash") != _spec_hash(spec):
+            return True
+
+        sources = self.manifest.get("sources", {})
+        wanted = {os.path.normpath(src) for (src, _) in spec.values()}
+        if wanted != set(sources):
+            return True
+
+        for src, info in sources.items():
+            try:
+                st = os.stat(src)
+            except OSError:
+                return True
+            if st.st_size == info.get("size") and st.st_mtime_ns == info.get("mtime_ns"):
+                continue
+            if _sha256_file(src) != info.get("sha256"):
+                return True
+        return False
+
+    def close(self):
+        self._images.clear()
+        try:
+            if self._view is not None:
+                self._view.release()
+        except Exception:
+            pass
+        try:
+            self._mm.close()
+        except Exception:
+            pass
+        self._file.close()
+
+
+def ensure_pack(pack_path: str, spec) -> AssetPack:
+    """
+    asset pack を開く。無い/壊れている/古い場合は作り直してから開く。
+    """
+    pack = None
+    if os.path.exists(pack_path):
+        try:
+            pack = AssetPack(pack_path)
+        except Exception as e:
+            print(f"[WARN] asset pack open failed (rebuild): {pack_path} err={e}")
+            pack = None
+
+    if pack is not None and not pack.is_stale(spec):
+        return pack
+
+    if pack is not None:
+        print(f"[INFO] asset pack is stale (rebuild): {pack_path}")
+        pack.close()
+
+    build_pack(pack_path, spec)
+    return AssetPack(pack_path)
@@ -0,0 +1,89 @@
+# bench/incremental_check.py (差分描画の確認：画像取得に失敗した枠が次の実行で描き直されるか)
+#
+#   python bench/incremental_check.py                    # bench/fixtures/normal で確認
+#   python bench/incremental_check.py --fixture fest --fail /stage/
+#
+# 1. URL に --fail を含む画像の取得を失敗させて差分描画する（画像の欠けた枠が記録されること）
+# 2. 取得を戻して同じ入力でもう一度差分描画する（欠けた枠が描き直され、全体描画と一致すること）
+# どちらかが満たされなければ exit 1。
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import http_cassette  # noqa: E402
+import spl3_schedule_ver0 as g  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", type=str, default="normal", help="Replay bench/fixtures/<name>")
+    parser.add_argument("--fail", type=str, default="/weapon/", help="Fail image fetches whose URL contains this")
+    parser.add_argument("--workers", type=int, default=1, help="Render threads (column-parallel when > 1)")
+    return parser.parse_args()
+
+
+def failing_fetch(fetch, pattern):
+    def _fetch(url):
+        if pattern in url:
+            raise OSError(f"injected fetch failure: {url}")
+        return fetch(url)
+    return _fetch
+
+
+def make_plan(fetched):
+    fest_slots = g.check_fest_slots(fetched["schedule"]["fest_open"])
+    return g.build_render_plan(fetched["schedule"], fetched["now"], fest_slots)
+
+
+def main():
+    args = parse_args()
+    g.session = http_cassette.CassetteSession(os.path.join(ROOT, "bench", "fixtures", args.fixture), "replay")
+    g.init_asset_pack(g.asset_pack.ASSET_PACK_PATH)
+    fetched = g.prefetch_all(now_keys=["regular"])
+
+    # 期待値：取得に成功した全体描画
+    full = g.FEST_BASE_CACHE.get(make_plan(fetched)["fest_slots"])
+    g.render_plan(full, make_plan(fetched))
+
+    ok = True
+    with tempfile.TemporaryDirectory() as state_dir:
+        # 1. 画像取得を失敗させる
+        fetch = g.fetch_image_rgba
+        g.fetch_image_rgba = failing_fetch(fetch, args.fail)
+        try:
+            plan = make_plan(fetched)
+            g.IncrementalRenderer(state_dir, args.workers).render(plan)
+        finally:
+            g.fetch_image_rgba = fetch
+
+        failed = sorted(uid for uid, n in plan["asset_errors"].items() if n)
+        with open(os.path.join(state_dir, "state.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)["units"]
+        unmarked = [uid for uid in failed if saved[uid]["fp"] is not None]
+        print(f"[CHECK] injected failures: units={len(failed)} unmarked={unmarked}")
+        if not failed or unmarked:
+            ok = False
+
+        # 2. 取得を戻して同じ入力で描く → 欠けた枠が描き直されて全体描画と同じになる
+        renderer = g.IncrementalRenderer(state_dir, args.workers)
+        plan = make_plan(fetched)
+        out = renderer.render(plan)
+        identical = out.tobytes() == full.tobytes()
+        print(f"[CHECK] recovery: {renderer.last_stats} identical={identical} "
+              f"asset_errors={g.asset_error_count(plan)}")
+        if not identical or renderer.last_stats.get("rendered", 0) < len(failed):
+            ok = False
+
+    print(f"[CHECK] {'OK' if ok else 'NG'}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# bench/make_fixtures.py (ベンチマーク用のカセットを作る：通常 / フェス / トリカラ / ビッグラン)
+#
+#   python bench/make_fixtures.py            # bench/fixtures/<name>/ を作り直す
+#
+# 本物の API を記録したカセット（HTTP_CASSETTE_MODE=record）をそのまま bench/fixtures/<name>/ に
+# 置いてもよい。ここで作るのは、ネット無しでいつでも同じ入力を作れる合成データ。
+# ステージ/ブキ名は実在のもの、画像は URL から決まる色のダミー PNG。時刻は FIXTURE_NOW に固定。
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+
+import http_cassette  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+FIXTURES = ["normal", "fest", "tricolor", "bigrun"]
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+FIXTURE_BOUNDARY = datetime.datetime(2026, 10, 17, 9, 0, tzinfo=JST)
+FIXTURE_NOW = FIXTURE_BOUNDARY + datetime.timedelta(minutes=5)
+SLOTS = 12
+
+API = "https://spla3.yuu26.com/api"
+IMG = "https://fixtures.invalid"
+MODE_PATHS = {
+    "regular": "regular",
+    "open": "bankara-open",
+    "challenge": "bankara-challenge",
+    "xmatch": "x",
+    "salmon": "coop-grouping",
+    "fest_open": "fest",
+    "fest_challenge": "fest-challenge",
+}
+AGGREGATE_KEYS = {
+    "regular": "regular",
+    "open": "bankara_open",
+    "challenge": "bankara_challenge",
+    "xmatch": "x",
+    "fest_open": "fest",
+    "fest_challenge": "fest_challenge",
+}
+
+RULES = [("AREA", "ガチエリア"), ("LOFT", "ガチヤグラ"), ("GOAL", "ガチホコバトル"), ("CLAM", "ガチアサリ")]
+STAGES = ["ユノハナ大渓谷", "ゴンズイ地区", "ヤガラ市場", "マテガイ放水路",
+          "ナメロウ金属", "クサヤ温泉", "ヒラメが丘団地", "マサバ海峡大橋"]
+WEAPONS = ["モップリン", "ジムワイパー", "ボールドマーカー", "スパッタリー"]
+BOSSES = ["Q29vcEVuZW15LTIz", "Q29vcEVuZW15LTI0", "Q29vcEVuZW15LTI1", "Q29vcEVuZW15LTMw"]
+
+
+def _stage(i):
+    i %= len(STAGES)
+    return {"id": i, "name": STAGES[i], "image": f"{IMG}/stage/{i}.png"}
+
+
+def _slot_times(k):
+    start = FIXTURE_BOUNDARY + datetime.timedelta(hours=2 * k)
+    return start.isoformat(), (start + datetime.timedelta(hours=2)).isoformat()
+
+
+def build_schedules(name):
+    """
+    モード → results(list) を作る（spla3 API の schedule と同じ形）
+    """
+    fest = name in ("fest", "tricolor")
+    out = {}
+
+    for mi, mode in enumerate(["regular", "open", "challenge", "xmatch"]):
+        results = []
+        for k in range(SLOTS):
+            st, et = _slot_times(k)
+            if mode == "regular":
+                rule = {"key": "TURF_WAR", "name": "ナワバリバトル"}
+            else:
+                key, label = RULES[(k + mi) % len(RULES)]
+                rule = {"key": key, "name": label}
+            hidden = fest and mode != "regular"
+            results.append({
+                "start_time": st, "end_time": et,
+                "rule": None if hidden else rule,
+                "stages": None if hidden else [_stage(k * 2 + mi), _stage(k * 2 + mi + 3)],
+                "is_fest": False,
+            })
+        out[mode] = results
+
+    for mode in ["fest_open", "fest_challenge"]:
+        results = []
+        for k in range(SLOTS):
+            st, et = _slot_times(k)
+            on = fest and k < 6
+            tricolor = on and name == "tricolor" and mode == "fest_open" and k % 2 == 0
+            results.append({
+                "start_time": st, "end_time": et,
+                "rule": {"key": "TURF_WAR", "name": "ナワバリバトル"} if on else None,
+                "stages": [_stage(k + 5), _stage(k + 6)] if on else None,
+                "is_fest": on,
+                "is_tricolor": tricolor,
+                "tricolor_stages": [_stage(k + 2)] if tricolor else None,
+            })
+        out[mode] = results
+
+    salmon = []
+    first = FIXTURE_BOUNDARY - datetime.timedelta(hours=10)
+    for k in range(5):
+        st = first + datetime.timedelta(hours=40 * k)
+        et = st + datetime.timedelta(hours=40)
+        big_run = name == "bigrun" and k == 0
+        if big_run:
+            weapons = [{"name": "ランダム", "image": f"{IMG}/weapon/random.png"} for _ in range(4)]
+        else:
+            weapons = [{"name": WEAPONS[(k + j) % 4], "image": f"{IMG}/weapon/{(k + j) % 4}.png"} for j in range(4)]
+        salmon.append({
+            "start_time": st.isoformat(), "end_time": et.isoformat(),
+            "boss": {"id": BOSSES[k % len(BOSSES)], "name": "boss"},
+            "stage": _stage(k), "weapons": weapons, "is_big_run": big_run,
+        })
+    out["salmon"] = salmon
+    return out
+
+
+def _png(url):
+    h = hashlib.md5(url.encode("utf-8")).digest()
+    alpha = 120 if "/weapon/" in url else 255
+    img = Image.new("RGBA", (128, 72), (h[0], h[1], h[2], 255))
+    for x in range(0, 128, 8):
+        for y in range(72):
+            img.putpixel((x, y), (h[3], h[4], h[5], alpha))
+    buf = BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class _Response:
+    def __init__(self, url, body, content_type):
+        self.url = url
+        self.content = body
+        self.status_code = 200
+        self.reason = "OK"
+        self.encoding = "utf-8" if content_type == "application/json" else None
+        self.headers = {"Content-Type": content_type}
+
+
+class FixtureSession:
+    """
+    build_schedules() の内容を spla3 API と同じ URL で返す（カセット記録用）
+    """
+
+    def __init__(self, schedules):
+        self.schedules = schedules
+        self.headers = {}
+
+    def get(self, url, params=None, **kwargs):
+        if url.startswith(IMG):
+            return _Response(url, _png(url), "image/png")
+        if url == f"{API}/schedule":
+            body = {"result": {agg: self.schedules[mode] for mode, agg in AGGREGATE_KEYS.items()}}
+        else:
+            mode_path, kind = url[len(API) + 1:].rsplit("/", 1)
+            mode = {v: k for k, v in MODE_PATHS.items()}[mode_path]
+            results = self.schedules[mode]
+            body = {"results": results[:1] if kind == "now" else results}
+        return _Response(url, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json")
+
+
+def image_urls(schedules):
+    urls = set()
+    for results in schedules.values():
+        for item in results:
+            for st in (item.get("stages") or []) + (item.get("tricolor_stages") or []) + [item.get("stage") or {}]:
+                if st and st.get("image"):
+                    urls.add(st["image"])
+            for w in item.get("weapons") or []:
+                urls.add(w["image"])
+    return sorted(urls)
+
+
+def make_fixture(name):
+    out_dir = os.path.join(FIXTURES_DIR, name)
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    schedules = build_schedules(name)
+    cassette = http_cassette.CassetteSession(out_dir, "record", inner=FixtureSession(schedules),
+                                             recorded_at=FIXTURE_NOW)
+    urls = [f"{API}/schedule"]
+    for path in MODE_PATHS.values():
+        urls += [f"{API}/{path}/schedule", f"{API}/{path}/now"]
+    for url in urls + image_urls(schedules):
+        cassette.get(url)
+    print(f"[INFO] fixture {name}: {len(urls)} api + {len(image_urls(schedules))} images → {out_dir}")
+
+
+def main():
+    for name in FIXTURES:
+        make_fixture(name)
+
+
+if __name__ == "__main__":
+    main()
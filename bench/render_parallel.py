@@ -0,0 +1,76 @@
+# bench/render_parallel.py (逐次描画と列並列描画の時間比較)
+#
+#   python bench/render_parallel.py --workers 5 --repeat 20
+#   python bench/render_parallel.py --cold      # 毎回画像キャッシュを空にして（画像取得込みで）計測
+#   python bench/render_parallel.py --fixture tricolor   # bench/fixtures のカセットで（ネット無しで）計測
+#
+# スケジュールは最初に1回だけ取得し、描画だけを繰り返し計測する。
+# 並列描画の結果が逐次描画とピクセル単位で一致することも確認する。
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import http_cassette  # noqa: E402
+import spl3_schedule_ver0 as g  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=5, help="Parallel render threads")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed renders per mode")
+    parser.add_argument("--cold", action="store_true", help="Clear the image cache before every render")
+    parser.add_argument("--fixture", type=str, default="", help="Replay bench/fixtures/<name> instead of the live API")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected latency per replayed request")
+    return parser.parse_args()
+
+
+def time_render(plan, workers, repeat, cold):
+    times = []
+    out = None
+    for _ in range(repeat):
+        if cold:
+            g.IMAGE_CACHE_RGBA.clear()
+        base = g.FEST_BASE_CACHE.get(plan["fest_slots"])
+        t0 = time.perf_counter()
+        g.render_plan(base, plan, workers)
+        times.append(time.perf_counter() - t0)
+        out = base
+    return times, out
+
+
+def main():
+    args = parse_args()
+    if args.fixture:
+        g.session = http_cassette.CassetteSession(os.path.join(ROOT, "bench", "fixtures", args.fixture), "replay",
+                                                  latency_ms=args.latency_ms)
+
+    g.init_asset_pack(g.asset_pack.ASSET_PACK_PATH)
+    fetched = g.prefetch_all(now_keys=["regular"])
+    fest_slots = g.check_fest_slots(fetched["schedule"]["fest_open"])
+    plan = g.build_render_plan(fetched["schedule"], fetched["now"], fest_slots)
+
+    # 1回目は画像取得/ラベル生成が入るので計測から外す
+    g.render_plan(g.FEST_BASE_CACHE.get(fest_slots), plan)
+
+    seq, seq_img = time_render(plan, 1, args.repeat, args.cold)
+    par, par_img = time_render(plan, args.workers, args.repeat, args.cold)
+
+    identical = seq_img.tobytes() == par_img.tobytes()
+    seq_ms = statistics.median(seq) * 1000
+    par_ms = statistics.median(par) * 1000
+
+    print(f"[BENCH] sequential median={seq_ms:.1f}ms min={min(seq) * 1000:.1f}ms")
+    print(f"[BENCH] parallel   median={par_ms:.1f}ms min={min(par) * 1000:.1f}ms workers={args.workers}")
+    print(f"[BENCH] speed-up x{seq_ms / par_ms:.2f} cpu={os.cpu_count()} cold={args.cold} identical={identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
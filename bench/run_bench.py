@@ -0,0 +1,229 @@
+# bench/run_bench.py (描画パイプラインのベンチマーク：main() 通し + ホットな関数単体)
+#
+#   python bench/run_bench.py                                  # 計測して .cache/bench/latest.json に書く
+#   python bench/run_bench.py --save-baseline                  # 計測結果を bench/baseline.json として保存
+#   python bench/run_bench.py --threshold 0.2                  # baseline より 20% 以上遅い項目があれば exit 1
+#
+# 入力は bench/fixtures/<name>/ のカセット（HTTP 再生・時刻固定）なので、ネット無しで毎回同じ入力になる。
+# e2e は描画キャッシュ/差分描画を切って毎回描く（描画キャッシュに当たった場合は e2e/<name>/render_cache_hit）。
+# 結果の各項目は median_ms / min_ms / runs。baseline と比べた ratio（今回 / baseline の median）も書く。
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import http_cassette  # noqa: E402
+import image_encode  # noqa: E402
+import spl3_schedule_ver0 as gen  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+FIXTURES = ["normal", "fest", "tricolor", "bigrun"]
+DEFAULT_OUT = os.path.join(".cache", "bench", "latest.json")
+DEFAULT_BASELINE = os.path.join("bench", "baseline.json")
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.15"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", type=str, default=",".join(FIXTURES), help="Comma separated fixture names")
+    parser.add_argument("--e2e-runs", type=int, default=5, help="main() runs per fixture (after the first)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing rounds per micro benchmark")
+    parser.add_argument("--out", type=str, default=DEFAULT_OUT, help="Result JSON path")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Baseline JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD,
+                        help="Allowed slowdown vs baseline (0.15 = +15%%) before failing")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the result as the baseline")
+    parser.add_argument("--no-fail", action="store_true", help="Report regressions without a non-zero exit")
+    return parser.parse_args()
+
+
+def use_fixture(name):
+    gen.session = http_cassette.CassetteSession(os.path.join(FIXTURES_DIR, name), "replay")
+    gen.REQUEST_MEMO.reset()
+
+
+def _stat(times):
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 4),
+        "min_ms": round(min(times) * 1000, 4),
+        "runs": len(times),
+    }
+
+
+# ==========================
+# ★ main() 通し
+# ==========================
+def _time_main(argv, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            gen.main(argv)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def bench_e2e(name, runs, tmp_dir):
+    use_fixture(name)
+    gen.IMAGE_CACHE_RGBA.clear()
+
+    # ディスクに残るキャッシュ（ラベル/フェス下地/描画結果）は fixture ごとに tmp_dir に置く。
+    # リポジトリの .cache を使うと、前回のベンチや普段の実行の結果で「描かずに済む」計測になる。
+    cache_dir = os.path.join(tmp_dir, name)
+    caches = (gen.LABEL_CACHE, gen.FEST_BASE_CACHE)
+    gen.LABEL_CACHE = gen.LabelCache(os.path.join(cache_dir, "labels.pack"))
+    gen.FEST_BASE_CACHE = gen.FestBaseCache(os.path.join(cache_dir, "fest_base"))
+
+    out = os.path.join(tmp_dir, f"{name}.png")
+    os.environ["SCHEDULE_JSON"] = os.path.join(tmp_dir, f"{name}.json")
+    try:
+        # 描画キャッシュ・差分描画なし = 毎回ちゃんと描いてエンコードする
+        times = _time_main(["--output", out, "--render-cache", "", "--incremental", ""], runs + 1)
+
+        # 描画キャッシュに当たった場合（描画/エンコードを省く）は別項目にする
+        hit_argv = ["--output", out, "--render-cache", os.path.join(cache_dir, "render"), "--incremental", ""]
+        _time_main(hit_argv, 1)
+        hit_times = _time_main(hit_argv, max(runs, 1))
+    finally:
+        gen.LABEL_CACHE, gen.FEST_BASE_CACHE = caches
+
+    # 1回目（画像取得/デコード・ラベル/下地の生成あり）と2回目以降（プロセス内キャッシュあり）を分けて出す
+    return {
+        f"e2e/{name}/first": _stat(times[:1]),
+        f"e2e/{name}/warm": _stat(times[1:] or times[:1]),
+        f"e2e/{name}/render_cache_hit": _stat(hit_times),
+    }
+
+
+# ==========================
+# ★ 関数単体
+# ==========================
+def _micro(fn, repeat):
+    timer = timeit.Timer(fn)
+    with contextlib.redirect_stdout(io.StringIO()):
+        number, _ = timer.autorange()
+        rounds = timer.repeat(repeat=repeat, number=number)
+    return _stat([t / number for t in rounds])
+
+
+def bench_micro(name, repeat):
+    use_fixture(name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetched = gen.prefetch_all(now_keys=["regular"])
+        sched, nows = fetched["schedule"], fetched["now"]
+        fest_slots = gen.check_fest_slots(sched["fest_open"])
+        plan = gen.build_render_plan(sched, nows, fest_slots)
+        base = gen.FEST_BASE_CACHE.get(fest_slots)
+        gen.render_plan(base, plan)  # 画像/ラベルを温める
+
+    timeline = gen.build_timeline_from_regular(plan["regular"])
+    draw = ImageDraw.Draw(base)
+    box = gen.COORDS_TABLE["open"]["now"]["stage0_name"]
+    stage_name = ((plan["open"][0] or {}).get("stages") or [{}])[0].get("name") or "ユノハナ大渓谷"
+    weapons = [w.get("name", "") for w in (plan["salmon"][0] or {}).get("weapons") or []][:4]
+    weapon_rank = plan["weapon_rank"]
+
+    cases = {
+        "align_results_to_timeline": lambda: gen.align_results_to_timeline(sched["open"], timeline),
+        "render_versus_mode": lambda: gen.render_versus_mode(base, "open", plan["open"], fest_slots=fest_slots),
+        "render_salmon_mode": lambda: gen.render_salmon_mode(base, plan["salmon"], weapon_rank),
+        "draw_text_with_bg": lambda: gen.draw_text_with_bg(draw, box, stage_name, gen.FONT_STAGE_NOW,
+                                                           bg_fill=gen.MODE_COLORS["open"], base=base),
+        "evaluate_salmon_rank": lambda: gen.evaluate_salmon_rank(weapons, weapon_rank),
+        "png_encode": lambda: base.save(io.BytesIO(), "PNG"),
+        "encode_to_budget": lambda: image_encode.encode_to_budget(base, 150 * 1024),
+    }
+    return {f"micro/{name}/{fn_name}": _micro(fn, repeat) for fn_name, fn in cases.items()}
+
+
+# ==========================
+# ★ baseline 比較
+# ==========================
+def compare(metrics, baseline, threshold):
+    regressions = []
+    for key, cur in metrics.items():
+        base = (baseline.get("metrics") or {}).get(key)
+        if not base or not base.get("median_ms"):
+            continue
+        ratio = cur["median_ms"] / base["median_ms"]
+        cur["baseline_median_ms"] = base["median_ms"]
+        cur["ratio"] = round(ratio, 4)
+        if ratio > 1 + threshold:
+            regressions.append(key)
+    return regressions
+
+
+def _write_json(path, data):
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def main():
+    args = parse_args()
+    names = [n.strip() for n in args.fixtures.split(",") if n.strip()]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        gen.init_asset_pack(gen.asset_pack.ASSET_PACK_PATH)
+
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in names:
+            metrics.update(bench_e2e(name, args.e2e_runs, tmp_dir))
+        for name in names:
+            metrics.update(bench_micro(name, args.repeat))
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(metrics, baseline, args.threshold)
+
+    result = {
+        "meta": {
+            "createdAt": datetime.datetime.now(gen.JST).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "machine": platform.machine(),
+            "cpuCount": os.cpu_count(),
+            "fixtures": names,
+            "threshold": args.threshold,
+            "baseline": args.baseline if baseline else None,
+        },
+        "metrics": metrics,
+        "regressions": regressions,
+    }
+    _write_json(args.out, result)
+    if args.save_baseline:
+        _write_json(args.baseline, {"meta": result["meta"], "metrics": metrics})
+
+    for key in sorted(metrics):
+        m = metrics[key]
+        ratio = f" x{m['ratio']:.2f}" if "ratio" in m else ""
+        flag = "  ← REGRESSION" if key in regressions else ""
+        print(f"[BENCH] {key:<48} median={m['median_ms']:9.3f}ms min={m['min_ms']:9.3f}ms{ratio}{flag}")
+    print(f"[INFO] ベンチ結果: {args.out}" + (f" / baseline: {args.baseline}" if args.save_baseline else ""))
+
+    if regressions and not args.no_fail:
+        print(f"[ERR] baseline より {args.threshold:.0%} 以上遅い項目: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# http_cassette.py (HTTP の記録/再生：ネット無しで同じ入力のまま描画を再現・計測する)
+#
+#   HTTP_CASSETTE_MODE=record HTTP_CASSETTE_DIR=cassettes/20261017 python spl3_schedule_ver0.py
+#   HTTP_CASSETTE_MODE=replay HTTP_CASSETTE_DIR=cassettes/20261017 python spl3_schedule_ver0.py
+#   HTTP_CASSETTE_LATENCY_MS=80 …                # 再生時に1リクエストごとに遅延を入れる
+#
+# 記録したカセットは index.json（キー → ステータス/ヘッダ/本文ファイル）と bodies/ の本文で構成する。
+# キーは「メソッド + URL + クエリ（cache-bust の _ は除く）」なので、毎回変わる cache-bust 値に関係なく再生できる。
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlsplit, parse_qsl, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "").strip().lower()   # "" / record / replay
+CASSETTE_DIR = os.getenv("HTTP_CASSETTE_DIR", ".cache/cassette")
+CASSETTE_LATENCY_MS = float(os.getenv("HTTP_CASSETTE_LATENCY_MS", "0"))
+CASSETTE_MODES = ("record", "replay")
+IGNORED_PARAMS = {"_"}  # cache-bust
+INDEX_NAME = "index.json"
+
+
+class CassetteMiss(requests.ConnectionError):
+    """
+    replay 中にカセットに無いリクエストが来た（= ネットには出ない）
+    """
+
+
+def request_key(method, url, params=None):
+    """
+    メソッド + URL + クエリ（cache-bust 除外・ソート済み）
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS]
+    for k, v in (params or {}).items():
+        if k not in IGNORED_PARAMS:
+            query.append((k, str(v)))
+    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+    return f"{method.upper()} {url}"
+
+
+def _body_name(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24] + ".bin"
+
+
+def _make_response(key, entry, body):
+    resp = requests.Response()
+    resp.status_code = int(entry.get("status", 200))
+    resp._content = body
+    resp.headers = CaseInsensitiveDict(entry.get("headers") or {})
+    resp.url = entry.get("url") or key.split(" ", 1)[1]
+    resp.encoding = entry.get("encoding")
+    resp.reason = entry.get("reason", "")
+    return resp
+
+
+class CassetteSession:
+    """
+    requests.Session の get() だけを差し替える薄いラッパー。
+    - record: 本物の session で取得し、本文/ステータス/ヘッダをカセットに保存してから返す
+    - replay: カセットから返す（ネットには一切出ない。無いものは CassetteMiss）
+    同じキーを何度も取得した場合（鮮度ポーリングなど）は最後の応答が残る。
+    """
+
+    def __init__(self, cassette_dir, mode, inner=None, latency_ms=0.0, recorded_at=None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.dir = cassette_dir
+        self.mode = mode
+        self.inner = inner
+        self.latency = max(0.0, float(latency_ms)) / 1000.0
+        self.headers = inner.headers if inner is not None else CaseInsensitiveDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        self._index = {"recordedAt": None, "entries": {}}
+        index_path = os.path.join(self.dir, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+        elif mode == "replay":
+            raise FileNotFoundError(f"cassette not found: {index_path}")
+
+        # record: 記録時刻を固定したい場合（フィクスチャ作成など）
+        if recorded_at is not None:
+            self._index["recordedAt"] = recorded_at.isoformat()
+
+    @property
+    def recorded_at(self):
+        """
+        記録した時刻（replay 時の「今」に使う）。無ければ None。
+        """
+        v = self._index.get("recordedAt")
+        return datetime.datetime.fromisoformat(v) if v else None
+
+    def mount(self, prefix, adapter):
+        if self.inner is not None:
+            self.inner.mount(prefix, adapter)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+    def get(self, url, params=None, **kwargs):
+        key = request_key("GET", url, params)
+        if self.mode == "replay":
+            return self._replay(key)
+        return self._record(key, url, params, **kwargs)
+
+    def _replay(self, key):
+        entry = self._index["entries"].get(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            raise CassetteMiss(f"not in cassette: {key}")
+
+        with open(os.path.join(self.dir, "bodies", entry["body"]), "rb") as f:
+            body = f.read()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.hits += 1
+        return _make_response(key, entry, body)
+
+    def _record(self, key, url, params, **kwargs):
+        resp = self.inner.get(url, params=params, **kwargs)
+
+        body_name = _body_name(key)
+        body_dir = os.path.join(self.dir, "bodies")
+        os.makedirs(body_dir, exist_ok=True)
+        with open(os.path.join(body_dir, body_name), "wb") as f:
+            f.write(resp.content)
+
+        with self._lock:
+            if self._index.get("recordedAt") is None:
+                self._index["recordedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            self._index["entries"][key] = {
+                "url": getattr(resp, "url", None),
+                "status": resp.status_code,
+                "reason": getattr(resp, "reason", "") or "",
+                "headers": dict(resp.headers),
+                "encoding": getattr(resp, "encoding", None),
+                "body": body_name,
+            }
+            self.recorded += 1
+            self._write_index()
+        return resp
+
+    def _write_index(self):
+        path = os.path.join(self.dir, INDEX_NAME)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def report(self):
+        print(f"[INFO] http cassette({self.mode}): dir={self.dir} hits={self.hits} misses={self.misses} "
+              f"recorded={self.recorded} entries={len(self._index['entries'])}")
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def wrap_session(session, mode=None, cassette_dir=None, latency_ms=None):
+    """
+    HTTP_CASSETTE_MODE が record / replay なら session をカセットで包んで返す（それ以外はそのまま）
+    """
+    mode = CASSETTE_MODE if mode is None else mode
+    if not mode or mode == "off":
+        return session
+    cassette = CassetteSession(
+        cassette_dir or CASSETTE_DIR,
+        mode,
+        inner=session if mode == "record" else None,
+        latency_ms=CASSETTE_LATENCY_MS if latency_ms is None else latency_ms,
+    )
+    print(f"[INFO] http cassette: mode={mode} dir={cassette.dir}")
+    return cassette
@@ -0,0 +1,385 @@
+# image_encode.py (出力画像のエンコード：RGB化 / パレット化 / PNG圧縮レベル / WebP・JPEG)
+#
+#   info = image_encode.save_image(base, "Thumbnail/Thumbnail.png", alpha="drop", colors=256, compress_level=9)
+#   python image_encode.py Thumbnail/Thumbnail.png          # 候補の設定ごとに サイズ/時間/PSNR を比べる
+#   infos = image_encode.save_outputs(base, "Thumbnail/Thumbnail.png", variants=["x", "bluesky"])
+#                                                           # 本体 + 投稿先ごとの版を1回でまとめて並列エンコード
+#
+# 既定（OUTPUT_* 未設定）は従来どおり「RGBA の PNG・圧縮レベル 6」= base.save(path) と同じバイト列。
+# 各エンコードは 形式/モード/色数/PSNR/バイト数/時間 を info に入れて返す（ログにも出す）。
+import io
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageChops, ImageColor, ImageStat
+
+
+# ==========================
+# ★ 設定（既定値は環境変数で変えられる）
+# ==========================
+FORMATS = {".png": "png", ".webp": "webp", ".jpg": "jpeg", ".jpeg": "jpeg"}
+PIL_FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG"}
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+ALPHA_MODES = ("keep", "drop")
+
+DEFAULT_OPTIONS = {
+    "format": os.getenv("OUTPUT_FORMAT", ""),                              # "" = 出力パスの拡張子から
+    "alpha": os.getenv("OUTPUT_ALPHA", "keep"),                            # keep / drop（RGB で書く）
+    "colors": int(os.getenv("OUTPUT_COLORS", "0")),                        # PNG パレット色数（0 = しない）
+    "min_psnr": float(os.getenv("OUTPUT_MIN_PSNR", "38")),                 # パレット化の画質下限（dB）
+    "compress_level": int(os.getenv("OUTPUT_PNG_COMPRESS_LEVEL", "6")),    # PNG zlib レベル 0-9
+    "quality": int(os.getenv("OUTPUT_QUALITY", "90")),                     # WebP / JPEG
+    "lossless": os.getenv("OUTPUT_WEBP_LOSSLESS", "") == "1",              # WebP ロスレス
+    "background": os.getenv("OUTPUT_BACKGROUND", "#ffffff"),               # alpha=drop で半透明画素を載せる色
+}
+
+
+# 投稿先ごとの版（形式/サイズ上限/画質）。OUTPUT_VARIANTS="x,bluesky,misskey" で出す版を選ぶ。
+VARIANT_PROFILES = {
+    "x": {"format": "png", "alpha": "drop", "colors": 256, "compress_level": 9, "max_bytes": 5 * 1024 * 1024},
+    "bluesky": {"format": "jpeg", "quality": 90, "max_bytes": 950 * 1024},
+    "misskey": {"format": "png", "alpha": "drop", "compress_level": 9},
+}
+OUTPUT_VARIANTS = os.getenv("OUTPUT_VARIANTS", "")
+EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+# サイズ上限つきエンコード（encode_to_budget）の探索範囲
+BUDGET_QUALITY_MAX = int(os.getenv("BUDGET_QUALITY_MAX", "92"))
+BUDGET_QUALITY_MIN = int(os.getenv("BUDGET_QUALITY_MIN", "55"))
+BUDGET_SCALES = [0.95, 0.9, 0.85, 0.8, 0.75, 0.7, 0.65, 0.6, 0.55, 0.5]
+
+
+def format_from_path(path, default="png"):
+    return FORMATS.get(os.path.splitext(path or "")[1].lower(), default)
+
+
+def content_type(fmt):
+    return CONTENT_TYPES.get(fmt, "application/octet-stream")
+
+
+def psnr(a, b):
+    """
+    2枚（同じサイズ/モード）の PSNR(dB)。完全一致は inf。
+    """
+    stat = ImageStat.Stat(ImageChops.difference(a, b))
+    mse = sum(stat.sum2) / (len(stat.sum2) * a.size[0] * a.size[1])
+    return math.inf if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+def translucent_pixels(img):
+    """
+    alpha < 255 の画素数（alpha が無ければ 0）
+    """
+    if "A" not in img.getbands():
+        return 0
+    return sum(img.getchannel("A").histogram()[:255])
+
+
+def flatten(img, background="#ffffff"):
+    """
+    RGB にする。全画素が不透明なら alpha を捨てるだけ（画素は変わらない）。
+    半透明の画素（貼ったアイコンの縁など）があれば background の上に合成して、見た目を保つ。
+    """
+    if img.mode == "RGB":
+        return img
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    if translucent_pixels(img) == 0:
+        return img.convert("RGB")
+    canvas = Image.new("RGBA", img.size, ImageColor.getrgb(background)[:3] + (255,))
+    canvas.alpha_composite(img)
+    return canvas.convert("RGB")
+
+
+def quantize(img, colors, min_psnr):
+    """
+    適応パレット（FASTOCTREE・ディザ無し）にする。PSNR が min_psnr 未満なら (None, psnr)。
+    """
+    pal = img.quantize(colors=colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    score = psnr(img, pal.convert(img.mode))
+    if score < min_psnr:
+        return None, score
+    return pal, score
+
+
+def encode_image(img, path=None, **opts):
+    """
+    img をエンコードして (bytes, info) を返す。opts は DEFAULT_OPTIONS のキー（省略分は既定値）。
+    """
+    o = dict(DEFAULT_OPTIONS)
+    o.update({k: v for k, v in opts.items() if v is not None})
+    fmt = (o["format"] or format_from_path(path)).lower()
+    if fmt not in PIL_FORMATS:
+        raise ValueError(f"unknown image format: {fmt}")
+    if o["alpha"] not in ALPHA_MODES:
+        raise ValueError(f"unknown alpha mode: {o['alpha']}")
+
+    t0 = time.perf_counter()
+    info = {"format": fmt, "contentType": content_type(fmt), "size": list(img.size)}
+
+    # JPEG は alpha を持てないので常に RGB
+    out = img
+    if o["alpha"] == "drop" or fmt == "jpeg":
+        info["translucent"] = translucent_pixels(img)
+        out = flatten(img, o["background"])
+
+    params = {}
+    if fmt == "png":
+        params["compress_level"] = int(o["compress_level"])
+        info["compressLevel"] = params["compress_level"]
+        if o["colors"] > 0:
+            pal, score = quantize(out, int(o["colors"]), o["min_psnr"])
+            info["psnr"] = round(score, 2) if math.isfinite(score) else None
+            if pal is None:
+                print(f"[WARN] パレット化は画質下限未満（PSNR {score:.1f}dB < {o['min_psnr']}dB）→ フルカラーのまま")
+            else:
+                out = pal
+                info["colors"] = int(o["colors"])
+    elif fmt == "webp" and o["lossless"]:
+        params["lossless"] = True
+        info["lossless"] = True
+    else:
+        params["quality"] = int(o["quality"])
+        info["quality"] = params["quality"]
+        if fmt == "jpeg":
+            params["optimize"] = True
+
+    buf = io.BytesIO()
+    out.save(buf, PIL_FORMATS[fmt], **params)
+    data = buf.getvalue()
+
+    info["mode"] = out.mode
+    info["bytes"] = len(data)
+    info["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return data, info
+
+
+def describe(info):
+    parts = [info["format"], info["mode"]]
+    if "colors" in info:
+        parts.append(f"colors={info['colors']}")
+    if info.get("psnr") is not None:
+        parts.append(f"psnr={info['psnr']:.1f}dB")
+    if "compressLevel" in info:
+        parts.append(f"level={info['compressLevel']}")
+    if "quality" in info:
+        parts.append(f"q={info['quality']}")
+    if info.get("lossless"):
+        parts.append("lossless")
+    if info.get("scale", 1.0) != 1.0:
+        parts.append(f"scale={info['scale']}")
+    if "encodes" in info:
+        parts.append(f"encodes={info['encodes']}")
+    if info.get("translucent"):
+        parts.append(f"flattened={info['translucent']}px")
+    return f"{' '.join(parts)} → {info['bytes'] / 1024:.1f}KB ({info['ms']:.0f}ms)"
+
+
+def encode_to_budget(img, max_bytes, fmt="jpeg", q_max=None, q_min=None, scales=None, **opts):
+    """
+    max_bytes 以下に収まる、いちばん画質の高い WebP/JPEG を (bytes, info) で返す。すべてメモリ上。
+
+    候補は「等倍で q_max → q_min」のあとに「q_min のまま BUDGET_SCALES の順に縮小」と並べ、
+    大きい順（≒画質の高い順）に並んでいるものとして、収まる最初の候補を二分探索する
+    （エンコード回数は log2(候補数) + 1 程度）。RGB 化・縮小は1回ずつで使い回す。
+    どれも収まらなければ最小の候補を info["fits"]=False で返す。
+    """
+    q_max = BUDGET_QUALITY_MAX if q_max is None else int(q_max)
+    q_min = BUDGET_QUALITY_MIN if q_min is None else int(q_min)
+    scales = BUDGET_SCALES if scales is None else scales
+    if fmt not in ("jpeg", "webp"):
+        raise ValueError(f"encode_to_budget: lossy format only: {fmt}")
+
+    t0 = time.perf_counter()
+    alpha = "drop" if fmt == "jpeg" else opts.get("alpha")
+    src = flatten(img, opts.get("background") or DEFAULT_OPTIONS["background"]) if alpha == "drop" else img
+    opts = {k: v for k, v in opts.items() if k not in ("format", "quality", "lossless", "alpha")}
+    ladder = [(1.0, q) for q in range(q_max, q_min - 1, -1)] + [(s, q_min) for s in scales]
+
+    resized = {1.0: src}
+    tried = {}
+
+    def encode(i):
+        if i not in tried:
+            scale, q = ladder[i]
+            if scale not in resized:
+                size = (max(1, round(src.size[0] * scale)), max(1, round(src.size[1] * scale)))
+                resized[scale] = src.resize(size, Image.LANCZOS)
+            tried[i] = encode_image(resized[scale], format=fmt, quality=q, alpha=alpha, lossless=False, **opts)
+        return tried[i]
+
+    # まず最高画質（たいていこれで収まる）
+    best = 0 if len(encode(0)[0]) <= max_bytes else None
+    if best is None:
+        lo, hi = 1, len(ladder) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if len(encode(mid)[0]) <= max_bytes:
+                best, hi = mid, mid - 1
+            else:
+                lo = mid + 1
+
+    fits = best is not None
+    data, info = encode(best if fits else len(ladder) - 1)
+    info = dict(info)
+    info.update({
+        "scale": ladder[best if fits else -1][0],
+        "maxBytes": max_bytes,
+        "fits": fits,
+        "encodes": len(tried),
+        "ms": round((time.perf_counter() - t0) * 1000, 3),
+    })
+    if not fits:
+        print(f"[WARN] 上限 {max_bytes / 1024:.0f}KB に収まりません（最小 {len(data) / 1024:.1f}KB）")
+    return data, info
+
+
+def encode_capped(img, path=None, max_bytes=0, **opts):
+    """
+    encode_image と同じ。max_bytes を超えたら WebP/JPEG は encode_to_budget で収まるものを探す。
+    """
+    data, info = encode_image(img, path, **opts)
+    if not max_bytes or len(data) <= max_bytes:
+        return data, info
+    if info["format"] == "png" or info.get("lossless"):
+        print(f"[WARN] {info['format']} が上限 {max_bytes / 1024:.0f}KB を超えています（{len(data) / 1024:.1f}KB）")
+        return data, info
+
+    opts = {k: v for k, v in opts.items() if k not in ("format", "quality")}
+    return encode_to_budget(img, max_bytes, fmt=info["format"], q_max=info["quality"] - 1, **opts)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_image(img, path, max_bytes=0, **opts):
+    """
+    エンコードして path に書く（一時ファイル → rename）。info を返す。
+    """
+    data, info = encode_capped(img, path, max_bytes=max_bytes, **opts)
+    if format_from_path(path, default="") not in ("", info["format"]):
+        print(f"[WARN] 出力パスの拡張子と形式が違います: {path} ({info['format']})")
+
+    _write_atomic(path, data)
+    info["path"] = path
+    print(f"[INFO] encode: {describe(info)}")
+    return info
+
+
+# ==========================
+# ★ 本体 + 投稿先ごとの版を1回で出す
+# ==========================
+def parse_variants(names):
+    out = []
+    for name in [n.strip() for n in (names or "").split(",") if n.strip()]:
+        if name not in VARIANT_PROFILES:
+            print(f"[WARN] 未定義の出力版: {name}（{', '.join(VARIANT_PROFILES)}）")
+            continue
+        out.append(name)
+    return out
+
+
+def variant_path(output_path, name, out_dir=None):
+    """
+    Thumbnail/Thumbnail.png + bluesky → Thumbnail/Thumbnail_bluesky.jpg（out_dir があればそこに）
+    """
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    ext = EXTENSIONS[VARIANT_PROFILES[name]["format"]]
+    return os.path.join(out_dir or os.path.dirname(output_path), f"{stem}_{name}{ext}")
+
+
+def save_outputs(img, output_path, variants=(), out_dir=None, workers=None, **opts):
+    """
+    同じキャンバスから 本体（output_path・opts）と各版（VARIANT_PROFILES）をスレッドで並列に書く。
+    RGB 化（alpha の合成）は版の間で1回だけ。{"main": info, 版名: info, ...} を返す。
+    """
+    jobs = [("main", output_path, opts)]
+    for name in variants:
+        jobs.append((name, variant_path(output_path, name, out_dir), VARIANT_PROFILES[name]))
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    # 既定の背景で RGB にするものは変換済みの画像を共有する
+    rgb = None
+    translucent = 0
+    if any(o.get("alpha") == "drop" or o.get("format") == "jpeg" for _, _, o in jobs[1:]):
+        translucent = translucent_pixels(img)
+        rgb = flatten(img, DEFAULT_OPTIONS["background"])
+
+    def run(job):
+        key, path, o = job
+        if key != "main" and rgb is not None and (o.get("alpha") == "drop" or o.get("format") == "jpeg"):
+            info = save_image(rgb, path, **o)
+            info["translucent"] = translucent
+            return key, info
+        return key, save_image(img, path, **o)
+
+    if len(jobs) == 1:
+        return dict([run(jobs[0])])
+    with ThreadPoolExecutor(max_workers=workers or len(jobs)) as pool:
+        return dict(pool.map(run, jobs))
+
+
+def variants_manifest(infos):
+    """
+    schedule.json に書く版の一覧（ファイル名は schedule.json / 本体画像と同じディレクトリ基準）
+    """
+    return {
+        key: {"file": os.path.basename(info["path"]), "contentType": info["contentType"], "bytes": info["bytes"]}
+        for key, info in infos.items()
+        if key != "main"
+    }
+
+
+def pick_variant(image_path, schedule, name):
+    """
+    投稿側：schedule.json の imageVariants に name の版があり、image_path と同じ場所に
+    同じサイズで存在すればその (path, content_type)。無ければ image_path そのもの。
+    """
+    entry = ((schedule or {}).get("imageVariants") or {}).get(name) if isinstance(schedule, dict) else None
+    if entry:
+        path = os.path.join(os.path.dirname(image_path or ""), entry.get("file", ""))
+        if os.path.isfile(path) and os.path.getsize(path) == entry.get("bytes"):
+            print(f"[INFO] 投稿用の画像版を使用: {path} ({entry.get('contentType')})")
+            return path, entry.get("contentType") or content_type(format_from_path(path))
+        print(f"[WARN] 画像版 {name} が見つからない/サイズ不一致 → 本体画像を使用: {path}")
+    return image_path, content_type(format_from_path(image_path))
+
+
+# ==========================
+# ★ 設定の比較（python image_encode.py IMAGE）
+# ==========================
+CANDIDATES = [
+    {"format": "png"},
+    {"format": "png", "alpha": "drop"},
+    {"format": "png", "alpha": "drop", "compress_level": 9},
+    {"format": "png", "alpha": "drop", "colors": 256},
+    {"format": "png", "alpha": "drop", "colors": 256, "compress_level": 9},
+    {"format": "webp", "quality": 90},
+    {"format": "webp", "lossless": True},
+    {"format": "jpeg", "quality": 90},
+]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python image_encode.py IMAGE")
+        sys.exit(2)
+
+    img = Image.open(sys.argv[1])
+    img.load()
+    for opts in CANDIDATES:
+        _, info = encode_image(img, **opts)
+        print(f"[INFO] {describe(info)}")
+
+
+if __name__ == "__main__":
+    main()
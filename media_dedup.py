@@ -0,0 +1,111 @@
+# media_dedup.py (投稿画像の重複アップロード回避：エンコード済みバイト列のハッシュで前回の結果を使い回す)
+#
+#   d = media_dedup.digest(img_bytes)                     # {"sha256": ..., "md5": ...}
+#   hit = media_dedup.STORE.get("bluesky", did, d["sha256"])
+#   media_dedup.STORE.put("bluesky", did, d["sha256"], {"blob": blob})
+#
+# 同じローテーション内の毎時投稿は画像が変わらないことが多いので、アップロードを丸ごと省ける。
+# - Bluesky: 前回の uploadBlob の blob 参照（前回の投稿から参照されているので残っている）
+# - X      : 前回の media_id（expires_after_secs まで）
+# - Misskey: サーバ側の drive/files/find-by-hash（md5）で探すので、ここには保存しない
+# 保存先は MEDIA_DEDUP_PATH（Actions では cache で実行間に引き継ぐ）。MEDIA_DEDUP=0 で無効。
+import hashlib
+import json
+import os
+import threading
+import time
+
+MEDIA_DEDUP = os.getenv("MEDIA_DEDUP", "1") != "0"
+MEDIA_DEDUP_PATH = os.getenv("MEDIA_DEDUP_PATH", ".cache/media_dedup.json")
+MAX_ENTRIES = int(os.getenv("MEDIA_DEDUP_MAX_ENTRIES", "32"))   # 投稿先 + アカウントごと
+EXPIRY_MARGIN_SEC = 300                                         # 期限がこれ未満しか残っていなければ使わない
+
+
+def digest(data):
+    return {"sha256": hashlib.sha256(data).hexdigest(), "md5": hashlib.md5(data).hexdigest()}
+
+
+def account_key(*parts):
+    """
+    アカウントを表すキー（トークン等をそのまま保存しないようにハッシュにする）
+    """
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class MediaStore:
+    """
+    {platform: {account: {sha256: entry}}} を JSON ファイルに持つ。スレッドから同時に使ってよい。
+    entry には savedAt と（期限があれば）expiresAt が入る。
+    """
+
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self._data = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        self._data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                print(f"[WARN] media dedup: 読み込みに失敗（作り直します）: {e}")
+        return self._data
+
+    def _save(self):
+        out_dir = os.path.dirname(self.path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, platform, account, sha256):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._load().get(platform, {}).get(account, {}).get(sha256)
+            expires = (entry or {}).get("expiresAt")
+            if entry is None or (expires is not None and expires - time.time() < EXPIRY_MARGIN_SEC):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, platform, account, sha256, entry, ttl_sec=None):
+        if not self.enabled:
+            return
+        entry = dict(entry, savedAt=time.time())
+        if ttl_sec:
+            entry["expiresAt"] = entry["savedAt"] + float(ttl_sec)
+        try:
+            with self._lock:
+                items = self._load().setdefault(platform, {}).setdefault(account, {})
+                items[sha256] = entry
+                # 古いものから捨てる
+                for key in sorted(items, key=lambda k: items[k].get("savedAt", 0))[:-MAX_ENTRIES]:
+                    del items[key]
+                self._save()
+        except Exception as e:
+            print(f"[WARN] media dedup: 保存に失敗: {e}")
+
+    def drop(self, platform, account, sha256):
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                items = self._load().get(platform, {}).get(account, {})
+                if items.pop(sha256, None) is not None:
+                    self._save()
+        except Exception as e:
+            print(f"[WARN] media dedup: 削除に失敗: {e}")
+
+
+STORE = MediaStore(MEDIA_DEDUP_PATH, enabled=MEDIA_DEDUP)
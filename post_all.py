@@ -0,0 +1,196 @@
+# post_all.py (1回だけ描画して X / Bluesky / Misskey に並列で投稿する)
+#
+#   python post_all.py                                  # 描画 → 3か所に同時投稿 → 結果一覧
+#   python post_all.py --posters bluesky,misskey        # 投稿先を絞る
+#   python post_all.py --no-render                      # 既存の画像/schedule.json をそのまま投稿
+#
+# 各投稿スクリプトの main() を別スレッドで呼ぶ。sys.exit(1) や例外はその投稿先の失敗として扱い、
+# 他の投稿先は止めない。投稿先ごとにタイムアウト（POST_TIMEOUT_<NAME>）があり、過ぎたら待たずに結果を確定する。
+# タイムアウトした投稿先は取り消し（poster_http.check_cancelled で投稿 API の前に止まる）、
+# そのスレッドが残っている間は（daemon の次のローテーションでも）同じ投稿先を始めない。
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+
+import poster_http
+import run_metrics
+import spl3_schedule_ver0 as gen
+
+
+# ==========================
+# ★ 設定
+# ==========================
+POSTERS = os.getenv("POSTERS", "x,bluesky,misskey")
+POSTER_MODULES = {
+    "x": "post_x",
+    "bluesky": "post_bluesky",
+    "misskey": "post_misskey",
+}
+
+POST_TIMEOUT_SEC = float(os.getenv("POST_TIMEOUT_SEC", "120"))
+POST_TIMEOUTS = {
+    # X は投稿前に数秒待つ + レート制限で待つことがあるので長め
+    "x": float(os.getenv("POST_TIMEOUT_X", "180")),
+    "bluesky": float(os.getenv("POST_TIMEOUT_BLUESKY", str(POST_TIMEOUT_SEC))),
+    "misskey": float(os.getenv("POST_TIMEOUT_MISSKEY", str(POST_TIMEOUT_SEC))),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default="/tmp/Thumbnail.png", help="Output image path")
+    parser.add_argument(
+        "--schedule-json",
+        type=str,
+        default=os.getenv("SCHEDULE_JSON", "/tmp/schedule.json"),
+        help="Output schedule.json path (passed to the posters)",
+    )
+    parser.add_argument("--posters", type=str, default=POSTERS, help="Comma separated: x,bluesky,misskey")
+    parser.add_argument("--no-render", action="store_true", help="Post the existing image / schedule.json")
+    parser.add_argument("--render-workers", type=int, default=gen.RENDER_WORKERS)
+    return parser.parse_args()
+
+
+def load_posters(names):
+    posters = {}
+    for name in [n.strip() for n in names.split(",") if n.strip()]:
+        if name not in POSTER_MODULES:
+            print(f"[WARN] 未対応の投稿先: {name}")
+            continue
+        try:
+            posters[name] = importlib.import_module(POSTER_MODULES[name])
+        except Exception as e:
+            print(f"[ERR] 投稿モジュールの読み込みに失敗: {name}: {e}")
+    return posters
+
+
+# ==========================
+# ★ 描画（1回だけ）
+# ==========================
+def render_once(args, variants):
+    """
+    spl3_schedule_ver0 の main() で 本体画像 + 投稿先ごとの版 + schedule.json を書く。
+    古い出力を投稿しないよう、先に消してから描画し、出来ていなければ False。
+    """
+    for path in (args.output, args.schedule_json):
+        if os.path.exists(path):
+            os.remove(path)
+
+    os.environ["SCHEDULE_JSON"] = args.schedule_json
+    argv = ["--output", args.output, "--render-workers", str(args.render_workers)]
+    if variants:
+        argv += ["--variants", ",".join(variants)]
+    gen.main(argv)
+
+    ok = os.path.exists(args.output) and os.path.exists(args.schedule_json)
+    if not ok:
+        print(f"[ERR] 描画結果がありません: {args.output} / {args.schedule_json}")
+    return ok
+
+
+# ==========================
+# ★ 並列投稿
+# ==========================
+# 投稿先 → 実行中のスレッド（タイムアウト後も終わるまで残る）
+_ACTIVE = {}
+
+
+def _run_poster(name, module, result, cancel):
+    t0 = time.perf_counter()
+    poster_http.set_cancel_event(cancel)
+    try:
+        module.main()
+        result.update(status="ok")
+    except poster_http.PostCancelled as e:
+        result.update(status="cancelled", detail=str(e))
+    except SystemExit as e:
+        if e.code in (None, 0):
+            result.update(status="ok")
+        else:
+            result.update(status="failed", detail=f"exit {e.code}")
+    except Exception as e:
+        result.update(status="failed", detail=repr(e))
+    result["sec"] = round(time.perf_counter() - t0, 3)
+
+
+def run_posters(posters, image_path, schedule_json, timeouts=None):
+    """
+    posters（名前 → モジュール）を同時に投稿する。{name: {"status", "sec", "detail"?}} を返す。
+    status は ok / failed / timeout / skipped。タイムアウトしたスレッドは daemon なので終了を待たず、
+    取り消しだけ伝える（投稿 API の前なら投稿しない）。前回のスレッドがまだ動いている投稿先は skipped。
+    """
+    timeouts = dict(POST_TIMEOUTS, **(timeouts or {}))
+
+    results = {}
+    for name in posters:
+        prev = _ACTIVE.get(name)
+        if prev is not None and prev.is_alive():
+            print(f"[WARN] {name}: 前回の投稿がまだ終わっていないのでスキップ")
+            results[name] = {"status": "skipped", "sec": 0.0, "detail": "前回の投稿が実行中"}
+    posters = {name: module for name, module in posters.items() if name not in results}
+
+    # 投稿スクリプトは main() の先頭でパスを読む（実行中の前回スレッドが無いことは上で確認済み）
+    os.environ["IMAGE_PATH"] = image_path
+    os.environ["SCHEDULE_JSON"] = schedule_json
+
+    threads = {}
+    cancels = {}
+    for name, module in posters.items():
+        results[name] = {"status": "running"}
+        cancels[name] = threading.Event()
+        th = threading.Thread(target=_run_poster, args=(name, module, results[name], cancels[name]),
+                              name=f"post-{name}", daemon=True)
+        th.start()
+        threads[name] = th
+        _ACTIVE[name] = th
+
+    t0 = time.monotonic()
+    for name, th in threads.items():
+        limit = timeouts.get(name, POST_TIMEOUT_SEC)
+        th.join(max(0.0, limit - (time.monotonic() - t0)))
+        if th.is_alive():
+            cancels[name].set()
+            results[name] = {"status": "timeout", "sec": round(time.monotonic() - t0, 3),
+                             "detail": f"{limit:g}s を超えました（取り消し済み）"}
+    return results
+
+
+def print_summary(results):
+    print("[INFO] ===== 投稿結果 =====")
+    for name, r in results.items():
+        detail = f" {r['detail']}" if r.get("detail") else ""
+        tag = "INFO" if r["status"] == "ok" else "ERR"
+        print(f"[{tag}] {name:<8} {r['status']:<7} {r.get('sec', 0):6.1f}s{detail}")
+
+
+def main():
+    args = parse_args()
+    posters = load_posters(args.posters)
+    if not posters:
+        print("[ERR] 投稿先がありません")
+        sys.exit(1)
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    if not args.no_render and not render_once(args, list(posters)):
+        sys.exit(1)
+
+    # 描画側の run_report.json とは別に、投稿全体の結果を run_report_post_all.json に残す
+    metrics = run_metrics.RunMetrics("post_all")
+    with metrics.span("post", posters=",".join(posters)):
+        results = run_posters(posters, args.output, args.schedule_json)
+    metrics.set_info(results=results)
+    metrics.write_report(run_metrics.report_path(args.schedule_json, "post_all"))
+
+    print_summary(results)
+    if any(r["status"] != "ok" for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,17 @@
 import os
 import sys
 import json
-import requests
+import base64
+import time
 from datetime import datetime
 import pytz
 from PIL import Image  # 圧縮用
 
+import image_encode
+import media_dedup
+import poster_http
+import run_metrics
+
 
 # ==============================
 # ★追加：ルール名短縮（Misskeyと同じ）
@@ -235,34 +241,205 @@ def build_post_text(now_jst: datetime) -> str:
     )
 
 
-def bluesky_request(url, method="POST", headers=None, json=None, data=None):
+# ==============================
+# ★ 計測（run_report_bluesky.json）
+# ==============================
+METRICS = run_metrics.RunMetrics("bluesky")
+
+
+def write_run_report():
+    path = run_metrics.report_path(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"), "bluesky")
+    METRICS.write_report(path)
+
+
+class BlueskyAuthError(Exception):
+    """
+    トークンが失効/無効（401、または ExpiredToken / InvalidToken）
+    """
+
+
+def _is_auth_error(res):
+    if res.status_code == 401:
+        return True
     try:
-        res = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
-            json=json,
-            data=data
-        )
+        error = (res.json() or {}).get("error")
+    except ValueError:
+        return False
+    return error in ("ExpiredToken", "InvalidToken")
+
+
+def bluesky_request(url, method="POST", headers=None, json=None, data=None, exit_on_error=True, idempotent=False,
+                    raise_auth_error=False):
+    """
+    idempotent=True の処理（ログイン・画像アップロード）は poster_http が失敗/5xx を再送する。
+    exit_on_error=False のときは sys.exit しない：エラー応答なら None を返し、通信の例外はそのまま投げる
+    （例外は「サーバ側で処理されたか分からない」ので、呼び出し側で再送しない判断ができるように）
+    raise_auth_error=True なら、認証エラーの応答は BlueskyAuthError を投げる（ログインし直す判断用）
+    """
+    try:
+        with METRICS.span("api", endpoint=url.rsplit("/", 1)[-1]) as sp:
+            res = poster_http.request(
+                method,
+                url,
+                headers=headers,
+                json=json,
+                data=data,
+                idempotent=idempotent
+            )
+            sp["status"] = res.status_code
 
         if res.status_code not in (200, 201):
             print(f"[ERROR] Bluesky API error ({url}) → {res.status_code}")
             print(res.text)
+            if raise_auth_error and _is_auth_error(res):
+                raise BlueskyAuthError(res.status_code)
+            if not exit_on_error:
+                return None
             sys.exit(1)
 
         return res.json() if res.text else {}
 
+    except BlueskyAuthError:
+        raise
     except Exception as e:
         print(f"[ERROR] Bluesky request 失敗: {url} → {repr(e)}")
+        if not exit_on_error:
+            raise
         sys.exit(1)
 
 
+# =========================================================
+# ログインセッションの保存/再利用（毎回のパスワードログインを避ける）
+# =========================================================
+BSKY_XRPC = "https://bsky.social/xrpc"
+BSKY_SESSION_PATH = os.getenv("BSKY_SESSION_PATH", ".cache/bsky_session.json")
+BSKY_SESSION_MIN_TTL_SEC = float(os.getenv("BSKY_SESSION_MIN_TTL_SEC", "300"))  # 残りがこれ未満なら refresh
+
+
+def _jwt_exp(token):
+    """
+    JWT の exp（UNIX 秒）。読めなければ None（署名は検証しない：期限の目安に使うだけ）
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload)).get("exp"))
+    except Exception:
+        return None
+
+
+def _token_ttl(token):
+    exp = _jwt_exp(token or "")
+    return None if exp is None else exp - time.time()
+
+
+def load_bluesky_session(handle):
+    if not BSKY_SESSION_PATH or not os.path.exists(BSKY_SESSION_PATH):
+        return None
+    try:
+        with open(BSKY_SESSION_PATH, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except Exception as e:
+        print(f"[WARN] 保存済みセッションの読み込みに失敗: {e}")
+        return None
+    # 別アカウントの保存分は使わない
+    if saved.get("identifier") != handle:
+        return None
+    return saved
+
+
+def save_bluesky_session(handle, session):
+    if not BSKY_SESSION_PATH:
+        return
+    try:
+        out_dir = os.path.dirname(BSKY_SESSION_PATH)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        data = {
+            "identifier": handle,
+            "did": session.get("did"),
+            "handle": session.get("handle"),
+            "accessJwt": session.get("accessJwt"),
+            "refreshJwt": session.get("refreshJwt"),
+        }
+        tmp_path = f"{BSKY_SESSION_PATH}.tmp{os.getpid()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, BSKY_SESSION_PATH)
+    except Exception as e:
+        print(f"[WARN] セッションの保存に失敗: {e}")
+
+
+def clear_bluesky_session():
+    if BSKY_SESSION_PATH and os.path.exists(BSKY_SESSION_PATH):
+        os.remove(BSKY_SESSION_PATH)
+
+
+def login_bluesky(handle, password):
+    """
+    パスワードでログイン（createSession）して保存する
+    """
+    print("[INFO] Bluesky にログイン中...")
+    session = bluesky_request(
+        f"{BSKY_XRPC}/com.atproto.server.createSession",
+        json={"identifier": handle, "password": password},
+        idempotent=True
+    )
+    save_bluesky_session(handle, session)
+    return session
+
+
+def refresh_bluesky_session(handle, saved):
+    """
+    refreshJwt で refreshSession（refreshJwt も新しくなるので保存し直す）。失敗したら None。
+    """
+    ttl = _token_ttl(saved.get("refreshJwt"))
+    if ttl is not None and ttl <= 0:
+        return None
+    try:
+        session = bluesky_request(
+            f"{BSKY_XRPC}/com.atproto.server.refreshSession",
+            headers={"Authorization": f"Bearer {saved.get('refreshJwt')}"},
+            exit_on_error=False,
+        )
+    except Exception:
+        return None
+    if not session or not session.get("accessJwt"):
+        return None
+    save_bluesky_session(handle, session)
+    return session
+
+
+def get_bluesky_session(handle, password):
+    """
+    保存済みの accessJwt が十分残っていればそのまま、期限が近ければ refreshSession、
+    どちらも駄目ならパスワードでログイン。戻り値の "reused" は保存分を使ったかどうか。
+    """
+    saved = load_bluesky_session(handle)
+    if saved and saved.get("accessJwt") and saved.get("did"):
+        ttl = _token_ttl(saved["accessJwt"])
+        if ttl is not None and ttl >= BSKY_SESSION_MIN_TTL_SEC:
+            print(f"[INFO] 保存済みセッションを再利用（残り {ttl / 60:.0f} 分）")
+            return dict(saved, reused=True)
+
+        print("[INFO] アクセストークンの期限が近いので refreshSession")
+        session = refresh_bluesky_session(handle, saved)
+        if session:
+            return dict(session, reused=True)
+        print("[WARN] refreshSession に失敗 → パスワードでログイン")
+
+    return dict(login_bluesky(handle, password), reused=False)
+
+
 # =========================================================
 # Bluesky画像サイズ制限対策（BlobTooLarge）
 # =========================================================
 def ensure_bluesky_upload_image(image_path: str, max_bytes: int = 950 * 1024):
     """
     Returns: (upload_path, content_type)
+    上限を超える場合は image_encode.encode_to_budget で「上限内でいちばん高画質な JPEG」を
+    メモリ上で探し、見つかったものだけを *_bsky.jpg に1回書く。
     """
     if not image_path or not os.path.exists(image_path):
         return (image_path, "image/png")
@@ -271,39 +448,23 @@ def ensure_bluesky_upload_image(image_path: str, max_bytes: int = 950 * 1024):
     print(f"[INFO] Original image size: {size/1024:.2f}KB")
 
     if size <= max_bytes:
-        ext = os.path.splitext(image_path)[1].lower()
-        if ext in (".jpg", ".jpeg"):
-            return (image_path, "image/jpeg")
-        return (image_path, "image/png")
+        return (image_path, image_encode.content_type(image_encode.format_from_path(image_path)))
 
     base, _ = os.path.splitext(image_path)
     out_path = base + "_bsky.jpg"
 
     try:
-        img = Image.open(image_path).convert("RGB")
-    except Exception as e:
-        print(f"[WARN] PIL open failed; upload original as-is. err={e}")
-        return (image_path, "image/png")
-
-    for q in [85, 80, 75, 70, 65, 60, 55]:
-        try:
-            img.save(out_path, format="JPEG", quality=q, optimize=True, progressive=True)
-            new_size = os.path.getsize(out_path)
-            print(f"[INFO] Compress try q={q}: {new_size/1024:.2f}KB")
-            if new_size <= max_bytes:
-                return (out_path, "image/jpeg")
-        except Exception as e:
-            print(f"[WARN] JPEG save failed q={q}: {e}")
-
-    try:
-        w, h = img.size
-        img2 = img.resize((int(w * 0.95), int(h * 0.95)))
-        img2.save(out_path, format="JPEG", quality=55, optimize=True, progressive=True)
-        new_size = os.path.getsize(out_path)
-        print(f"[WARN] Forced resize: {new_size/1024:.2f}KB")
+        img = Image.open(image_path)
+        img.load()
+        with METRICS.span("encode_to_budget", max_bytes=max_bytes) as sp:
+            data, info = image_encode.encode_to_budget(img, max_bytes, fmt="jpeg")
+            sp.update(info)
+        with open(out_path, "wb") as f:
+            f.write(data)
+        print(f"[INFO] Compressed: {image_encode.describe(info)}")
         return (out_path, "image/jpeg")
     except Exception as e:
-        print(f"[WARN] Forced resize failed; upload original as-is. err={e}")
+        print(f"[WARN] Compress failed; upload original as-is. err={e}")
         return (image_path, "image/png")
 
 
@@ -315,12 +476,8 @@ def post_to_bluesky(image_path, text):
         print("[ERROR] Bluesky の認証情報が不足しています（BSKY_USER / BSKY_PASS）")
         sys.exit(1)
 
-    # ===== ① ログイン =====
-    print("[INFO] Bluesky にログイン中...")
-    session = bluesky_request(
-        "https://bsky.social/xrpc/com.atproto.server.createSession",
-        json={"identifier": HANDLE, "password": PASSWORD}
-    )
+    # ===== ① ログイン（保存済みセッションがあれば再利用）=====
+    session = get_bluesky_session(HANDLE, PASSWORD)
 
     access_jwt = session.get("accessJwt")
     did = session.get("did")
@@ -332,60 +489,108 @@ def post_to_bluesky(image_path, text):
 
     print(f"[INFO] ログイン成功: DID = {did}")
 
-    # ===== ② 画像アップロード =====
-    blob = None
-    upload_path, content_type = ensure_bluesky_upload_image(image_path)
-
-    if upload_path and os.path.exists(upload_path):
-        print(f"[INFO] 画像アップロード中 → {upload_path} ({content_type})")
-        with open(upload_path, "rb") as f:
-            img_bytes = f.read()
+    def authed_request(url, headers=None, allow_fail=False, **kwargs):
+        """
+        保存済みのトークンが失効していた（サーバ側で無効化など）場合は、1回だけログインし直して再送する。
+        ログインし直すのは認証エラー（401 / ExpiredToken / InvalidToken）の応答のときだけ。
+        それ以外のエラー（使い回した blob が無い等）や通信の例外（投稿済みかもしれない）では再ログインしない。
+        allow_fail=True ならエラー応答で sys.exit せず None を返す。
+        """
+        nonlocal session, access_jwt, did
+        try:
+            return bluesky_request(url, headers=dict(headers or {}, Authorization=f"Bearer {access_jwt}"),
+                                   exit_on_error=not allow_fail, raise_auth_error=bool(session.get("reused")),
+                                   **kwargs)
+        except BlueskyAuthError:
+            print("[WARN] 保存済みセッションが無効 → パスワードでログインし直して再送")
+        except Exception:
+            sys.exit(1)
 
-        upload_res = bluesky_request(
-            "https://bsky.social/xrpc/com.atproto.repo.uploadBlob",
-            headers={
-                "Authorization": f"Bearer {access_jwt}",
-                "Content-Type": content_type
-            },
-            data=img_bytes
+        clear_bluesky_session()
+        session = dict(login_bluesky(HANDLE, PASSWORD), reused=False)
+        access_jwt, did = session.get("accessJwt"), session.get("did")
+        return bluesky_request(url, headers=dict(headers or {}, Authorization=f"Bearer {access_jwt}"),
+                               exit_on_error=not allow_fail, **kwargs)
+
+    def upload_blob(img_bytes, content_type, sha256):
+        upload_res = authed_request(
+            f"{BSKY_XRPC}/com.atproto.repo.uploadBlob",
+            headers={"Content-Type": content_type},
+            data=img_bytes,
+            idempotent=True
         )
-
         blob = upload_res.get("blob")
         if blob:
             print("[INFO] 画像アップロード成功")
+            media_dedup.STORE.put("bluesky", did, sha256, {"blob": blob})
         else:
             print("[WARN] 画像アップロード応答に blob がありません（画像なし投稿で続行）")
+        return blob
+
+    # ===== ② 画像アップロード（前回と同じ画像なら blob を使い回す）=====
+    blob = None
+    reused_blob = False
+    img_bytes = content_type = sha256 = None
+    with METRICS.span("encode"):
+        upload_path, content_type = ensure_bluesky_upload_image(image_path)
+
+    if upload_path and os.path.exists(upload_path):
+        with open(upload_path, "rb") as f:
+            img_bytes = f.read()
+        sha256 = media_dedup.digest(img_bytes)["sha256"]
+
+        cached = media_dedup.STORE.get("bluesky", did, sha256)
+        if cached and cached.get("blob"):
+            blob = cached["blob"]
+            reused_blob = True
+            print(f"[INFO] 前回と同じ画像 → アップロードを省略（blob を再利用）sha256={sha256[:12]}")
+        else:
+            print(f"[INFO] 画像アップロード中 → {upload_path} ({content_type})")
+            blob = upload_blob(img_bytes, content_type, sha256)
     else:
         print(f"[WARN] 画像が見つかりません → {upload_path}")
 
     # ===== ③ レコード作成 =====
-    record = {
-        "$type": "app.bsky.feed.post",
-        "text": text,
-        "langs": ["ja"],
-        "createdAt": datetime.now(pytz.utc).isoformat().replace("+00:00", "Z")
-    }
-
-    if blob:
-        record["embed"] = {
-            "$type": "app.bsky.embed.images",
-            "images": [{"image": blob, "alt": "スプラトゥーン3 スケジュール画像"}]
+    def build_payload(blob):
+        record = {
+            "$type": "app.bsky.feed.post",
+            "text": text,
+            "langs": ["ja"],
+            "createdAt": datetime.now(pytz.utc).isoformat().replace("+00:00", "Z")
         }
 
-    payload = {
-        "repo": did,
-        "collection": "app.bsky.feed.post",
-        "record": record
-    }
+        if blob:
+            record["embed"] = {
+                "$type": "app.bsky.embed.images",
+                "images": [{"image": blob, "alt": "スプラトゥーン3 スケジュール画像"}]
+            }
+
+        return {
+            "repo": did,
+            "collection": "app.bsky.feed.post",
+            "record": record
+        }
 
     # ===== ④ 投稿 =====
     print("[INFO] Bluesky に投稿中...")
-    bluesky_request(
-        "https://bsky.social/xrpc/com.atproto.repo.createRecord",
-        headers={"Authorization": f"Bearer {access_jwt}"},
-        json=payload
+    poster_http.check_cancelled("createRecord")
+    res = authed_request(
+        f"{BSKY_XRPC}/com.atproto.repo.createRecord",
+        json=build_payload(blob),
+        allow_fail=reused_blob
     )
 
+    # 使い回した blob がサーバに残っていなかった（前回の投稿が消された等）→ アップロードし直して1回だけ再送
+    if res is None:
+        print("[WARN] 再利用した blob で投稿できませんでした → 画像をアップロードし直して再送")
+        media_dedup.STORE.drop("bluesky", did, sha256)
+        blob = upload_blob(img_bytes, content_type, sha256)
+        poster_http.check_cancelled("createRecord")
+        authed_request(
+            f"{BSKY_XRPC}/com.atproto.repo.createRecord",
+            json=build_payload(blob)
+        )
+
     print("[SUCCESS] Bluesky 投稿成功！")
     print("[INFO] 投稿文:\n" + text)
 
@@ -399,7 +604,14 @@ def main():
         text = build_post_text(now)
 
     image_path = os.getenv("IMAGE_PATH", "Thumbnail/Thumbnail.png")
-    post_to_bluesky(image_path, text)
+    # 生成側で作った Bluesky 用の版（上限内の JPEG）があれば、それをそのまま上げる
+    schedule = load_schedule_json(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"))
+    image_path, _ = image_encode.pick_variant(image_path, schedule, "bluesky")
+    METRICS.reset()
+    try:
+        post_to_bluesky(image_path, text)
+    finally:
+        write_run_report()
 
 
 if __name__ == "__main__":
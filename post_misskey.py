@@ -2,10 +2,14 @@
 import os
 import sys
 import json
-import requests
 from datetime import datetime
 import pytz
 
+import image_encode
+import media_dedup
+import poster_http
+import run_metrics
+
 
 # ==============================
 # ★追加：ルール名短縮（Misskey/Bluesky共通で使える）
@@ -248,20 +252,57 @@ def build_post_text(now_jst: datetime) -> str:
     )
 
 
-def misskey_request(url, method="POST", headers=None, data=None, files=None, json=None):
+# ==============================
+# ★ 計測（run_report_misskey.json）
+# ==============================
+METRICS = run_metrics.RunMetrics("misskey")
+
+
+def write_run_report():
+    path = run_metrics.report_path(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"), "misskey")
+    METRICS.write_report(path)
+
+
+def misskey_request(url, method="POST", headers=None, data=None, files=None, json=None, idempotent=False,
+                    exit_on_error=True):
+    """
+    idempotent=True の処理（画像アップロード）は poster_http が失敗/5xx を再送する。
+    exit_on_error=False なら失敗しても sys.exit せず None を返す（省略できる問い合わせ用）。
+    """
     try:
-        res = requests.request(method, url, headers=headers, data=data, files=files, json=json)
+        with METRICS.span("api", endpoint=url.rsplit("/api/", 1)[-1]) as sp:
+            res = poster_http.request(method, url, headers=headers, data=data, files=files, json=json,
+                                      idempotent=idempotent)
+            sp["status"] = res.status_code
         if res.status_code not in (200, 204):
             print(f"[ERROR] Misskey API error: {url}")
             print(f"status={res.status_code}")
             print(res.text)
+            if not exit_on_error:
+                return None
             sys.exit(1)
         return res.json() if res.text else {}
     except Exception as e:
         print(f"[ERROR] Misskey request failed: {repr(e)}")
+        if not exit_on_error:
+            return None
         sys.exit(1)
 
 
+def find_drive_file(api, token, img_bytes):
+    """
+    同じ内容（md5）のファイルが既にドライブにあればその id（drive/files/find-by-hash）。無ければ None。
+    """
+    if not media_dedup.MEDIA_DEDUP:
+        return None
+    md5 = media_dedup.digest(img_bytes)["md5"]
+    found = misskey_request(f"{api}/drive/files/find-by-hash", json={"i": token, "md5": md5},
+                            idempotent=True, exit_on_error=False)
+    if isinstance(found, list) and found and found[0].get("id"):
+        return found[0]["id"]
+    return None
+
+
 def post_to_misskey(image_path, text):
     token = os.getenv("MISSKEY_TOKEN")
     if not token:
@@ -274,21 +315,32 @@ def post_to_misskey(image_path, text):
     # ======== ① 画像アップロード ========
     file_id = None
     if image_path and os.path.exists(image_path):
-        print(f"[INFO] 画像アップロード中 → {image_path}")
-
+        # content-type / ファイル名の拡張子は実際の形式（拡張子）に合わせる
+        fmt = image_encode.format_from_path(image_path)
         with open(image_path, "rb") as f:
-            # 画像形式は png 前提（jpeg化してる場合は content-type を変えてもOK）
-            files = {"file": ("thumbnail.png", f, "image/png")}
+            img_bytes = f.read()
+
+        # 前回と同じ画像がドライブにあればアップロードしない
+        file_id = find_drive_file(MISSKEY_API, token, img_bytes)
+        if file_id:
+            print(f"[INFO] 同じ画像がドライブにあります → アップロードを省略 file_id={file_id}")
+        else:
+            print(f"[INFO] 画像アップロード中 → {image_path}")
+
+            # 再送しても同じ内容を送れるよう、ファイルではなくバイト列で渡す
+            # （再送でドライブに同じ画像が2つできても投稿には影響しない）
+            files = {"file": (f"thumbnail{image_encode.EXTENSIONS[fmt]}", img_bytes, image_encode.content_type(fmt))}
             data = {"i": token}
 
             res = misskey_request(
                 f"{MISSKEY_API}/drive/files/create",
                 data=data,
-                files=files
+                files=files,
+                idempotent=True
             )
 
-        file_id = res.get("id")
-        print(f"[INFO] Misskey 画像アップロード成功 → file_id={file_id}")
+            file_id = res.get("id")
+            print(f"[INFO] Misskey 画像アップロード成功 → file_id={file_id}")
     else:
         print(f"[WARN] 画像ファイルが見つかりません → {image_path}")
 
@@ -304,6 +356,7 @@ def post_to_misskey(image_path, text):
 
     # ======== ③ 投稿 ========
     print("[INFO] Misskey に投稿中...")
+    poster_http.check_cancelled("notes/create")
     post_res = misskey_request(
         f"{MISSKEY_API}/notes/create",
         json=note
@@ -328,7 +381,13 @@ def main():
         text = build_post_text(now)
 
     image_path = os.getenv("IMAGE_PATH", "Thumbnail/Thumbnail.png")
-    post_to_misskey(image_path, text)
+    schedule = load_schedule_json(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"))
+    image_path, _ = image_encode.pick_variant(image_path, schedule, "misskey")
+    METRICS.reset()
+    try:
+        post_to_misskey(image_path, text)
+    finally:
+        write_run_report()
 
 
 if __name__ == "__main__":
@@ -7,6 +7,11 @@ import pytz
 import time
 import random
 
+import image_encode
+import media_dedup
+import poster_http
+import run_metrics
+
 # ==============================
 # ルール短縮（X用）
 # ==============================
@@ -19,6 +24,12 @@ RULE_SHORT_MAP = {
 
 X_MAX = 280
 
+# v1.1 画像アップロード（tweepy.API は毎回 session.close() するので、poster_http の接続プールで直接送る）
+X_UPLOAD_URL = "https://upload.twitter.com/1.1/media/upload.json"
+
+# 計測（run_report_x.json）
+METRICS = run_metrics.RunMetrics("x")
+
 
 def safe_join(items):
     return ",".join([x for x in items if x])
@@ -314,7 +325,33 @@ def print_forbidden_details(e: Exception):
             pass
 
 
-def main():
+def upload_media(auth, image_path, account, sha256):
+    """
+    v1.1 で画像をアップロードして media_id を返す。期限（expires_after_secs）付きで覚えておく。
+    アップロードは再送しても害がないので、失敗/429/5xx は poster_http が再送する。
+    """
+    with open(image_path, "rb") as f:
+        img_bytes = f.read()
+    with METRICS.span("api", endpoint="media_upload") as sp:
+        res = poster_http.request(
+            "POST", X_UPLOAD_URL, auth=auth,
+            files={"media": (os.path.basename(image_path), img_bytes)},
+            idempotent=True,
+        )
+        sp["status"] = res.status_code
+    if res.status_code != 200:
+        raise RuntimeError(f"media/upload status={res.status_code} {res.text[:500]}")
+    media = res.json()
+    media_id = str(media["media_id_string"])
+    print(f"[INFO] 画像アップロード成功 → media_id={media_id}")
+
+    ttl = media.get("expires_after_secs")
+    if ttl:
+        media_dedup.STORE.put("x", account, sha256, {"media_id": media_id}, ttl_sec=ttl)
+    return media_id
+
+
+def post_to_x():
     consumer_key = os.getenv("TWITTER_API_KEY")
     consumer_secret = os.getenv("TWITTER_API_SECRET")
     access_token = os.getenv("TWITTER_ACCESS_TOKEN")
@@ -334,6 +371,8 @@ def main():
     tweet_text = fit_x_text(tweet_text)
 
     image_path = os.getenv("IMAGE_PATH", "post-image/Thumbnail.png")
+    schedule = load_schedule_json(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"))
+    image_path, _ = image_encode.pick_variant(image_path, schedule, "x")
     if not os.path.exists(image_path):
         print(f"[ERROR] 画像ファイルが見つかりません → {image_path}")
         sys.exit(1)
@@ -343,11 +382,18 @@ def main():
         auth = tweepy.OAuth1UserHandler(
             consumer_key, consumer_secret,
             access_token, access_token_secret
-        )
-        api_v1 = tweepy.API(auth)
-        media = api_v1.media_upload(filename=image_path)
-        media_id = str(media.media_id)
-        print(f"[INFO] 画像アップロード成功 → media_id={media_id}")
+        ).apply_auth()
+
+        # 前回と同じ画像で media_id の期限内ならアップロードしない
+        account = media_dedup.account_key(consumer_key, access_token)
+        with open(image_path, "rb") as f:
+            sha256 = media_dedup.digest(f.read())["sha256"]
+        cached = media_dedup.STORE.get("x", account, sha256)
+        if cached:
+            media_id = cached["media_id"]
+            print(f"[INFO] 前回と同じ画像 → アップロードを省略 media_id={media_id}")
+        else:
+            media_id = upload_media(auth, image_path, account, sha256)
     except Exception as e:
         print("[ERROR] 画像アップロード失敗:", repr(e))
         sys.exit(1)
@@ -361,6 +407,8 @@ def main():
             access_token_secret=access_token_secret,
             wait_on_rate_limit=True
         )
+        # 投稿は再送しない（二重投稿になる）。接続プール + タイムアウトだけ付ける
+        client.session = poster_http.session_for("https://api.twitter.com")
 
         # Cloudflare/UA系の回避策（必要なら維持）
         client.session.headers.update({
@@ -370,7 +418,20 @@ def main():
         })
 
         time.sleep(random.uniform(4, 10))
-        resp = client.create_tweet(text=tweet_text, media_ids=[media_id])
+        poster_http.check_cancelled("create_tweet")
+        try:
+            with METRICS.span("api", endpoint="create_tweet"):
+                resp = client.create_tweet(text=tweet_text, media_ids=[media_id])
+        except tweepy.BadRequest:
+            # 使い回した media_id が使えなかった（400 = 投稿されていない）→ アップロードし直して1回だけ再送
+            if not cached:
+                raise
+            print("[WARN] 再利用した media_id で投稿できませんでした → 画像をアップロードし直して再送")
+            media_dedup.STORE.drop("x", account, sha256)
+            media_id = upload_media(auth, image_path, account, sha256)
+            poster_http.check_cancelled("create_tweet")
+            with METRICS.span("api", endpoint="create_tweet"):
+                resp = client.create_tweet(text=tweet_text, media_ids=[media_id])
         tweet_id = resp.data["id"] if resp and resp.data else "unknown"
         print(f"[SUCCESS] 投稿完了 → https://x.com/i/web/status/{tweet_id}")
         print(tweet_text)
@@ -383,5 +444,13 @@ def main():
         sys.exit(1)
 
 
+def main():
+    METRICS.reset()
+    try:
+        post_to_x()
+    finally:
+        METRICS.write_report(run_metrics.report_path(os.getenv("SCHEDULE_JSON", "post-image/schedule.json"), "x"))
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+# poster_http.py (投稿スクリプト共通の HTTP クライアント：ホストごとの接続プール + タイムアウト + リトライ)
+#
+#   res = poster_http.request("POST", url, json=body)                  # 1回だけ（投稿など冪等でない処理）
+#   res = poster_http.request("POST", url, data=img, idempotent=True)  # 失敗/429/5xx はジッタ付きで再送
+#
+# ログイン → 画像アップロード → 投稿 で同じホストへの接続（TLS）を使い回す。
+# どのリクエストにも connect / read のタイムアウトが付くので、相手が固まってもワークフローが止まり続けない。
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# ==========================
+# ★ 設定
+# ==========================
+CONNECT_TIMEOUT_SEC = float(os.getenv("POSTER_CONNECT_TIMEOUT_SEC", "5"))
+READ_TIMEOUT_SEC = float(os.getenv("POSTER_READ_TIMEOUT_SEC", "30"))
+RETRIES = int(os.getenv("POSTER_RETRIES", "3"))              # idempotent=True のときの再送回数
+BACKOFF_SEC = float(os.getenv("POSTER_BACKOFF_SEC", "0.5"))  # 1回目の待ち（2倍ずつ、上限 BACKOFF_MAX_SEC）
+BACKOFF_MAX_SEC = float(os.getenv("POSTER_BACKOFF_MAX_SEC", "8"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# ==========================
+# ★ 投稿の取り消し（post_all / daemon がタイムアウトにした投稿先は、後から投稿しない）
+# ==========================
+class PostCancelled(Exception):
+    """
+    呼び出し元（post_all.run_posters）のタイムアウトで取り消された。投稿はしていない。
+    """
+
+
+_CANCEL = threading.local()
+
+
+def set_cancel_event(event):
+    """
+    このスレッドの投稿を取り消すための Event をつなぐ（post_all が投稿スレッドの先頭で呼ぶ）
+    """
+    _CANCEL.event = event
+
+
+def check_cancelled(what="post"):
+    """
+    投稿（作成 API）や再送の直前に呼ぶ。このスレッドが取り消されていれば PostCancelled。
+    """
+    event = getattr(_CANCEL, "event", None)
+    if event is not None and event.is_set():
+        raise PostCancelled(f"{what}: タイムアウトで取り消されました")
+
+
+class TimeoutSession(requests.Session):
+    """
+    timeout 未指定のリクエストに既定の (connect, read) を付ける Session（tweepy.Client などにも渡せる）
+    """
+
+    def __init__(self, timeout=None):
+        super().__init__()
+        self.default_timeout = timeout or (CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def _backoff(attempt, retry_after=None):
+    """
+    Retry-After（秒）があればそれ、無ければ full jitter の指数バックオフ
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SEC)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_SEC * (2 ** attempt)))
+
+
+class PosterHTTP:
+    """
+    ホスト（scheme + host）ごとに Session を1つ持つ。スレッドから同時に使ってよい。
+    """
+
+    def __init__(self, timeout=None, retries=RETRIES):
+        self.timeout = timeout or (CONNECT_TIMEOUT_SEC, READ_TIMEOUT_SEC)
+        self.retries = retries
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+
+    def session_for(self, url):
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            sess = self._sessions.get(key)
+            if sess is None:
+                sess = TimeoutSession(self.timeout)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                self._sessions[key] = sess
+            return sess
+
+    def request(self, method, url, idempotent=False, retries=None, **kwargs):
+        """
+        idempotent=True なら 接続失敗/タイムアウト/429/5xx を retries 回まで再送する。
+        冪等でないもの（投稿）は、接続そのものが張れなかった（= 送っていない）場合だけ再送する。
+        """
+        retries = self.retries if retries is None else retries
+        sess = self.session_for(url)
+
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                res = sess.request(method, url, **kwargs)
+            except requests.exceptions.ConnectTimeout:
+                if last:
+                    raise
+                wait = _backoff(attempt)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # 送った後の失敗は相手が処理済みかもしれないので、冪等なものだけ再送
+                if last or not idempotent:
+                    raise
+                wait = _backoff(attempt)
+            else:
+                if last or not idempotent or res.status_code not in RETRY_STATUSES:
+                    return res
+                wait = _backoff(attempt, res.headers.get("Retry-After"))
+                res.close()
+
+            with self._lock:
+                self.retried += 1
+            print(f"[WARN] {method} {urlsplit(url).path} 失敗 → {wait:.1f} 秒後に再送（{attempt + 1}/{retries}）")
+            time.sleep(wait)
+            check_cancelled(urlsplit(url).path)
+
+    def close(self):
+        with self._lock:
+            for sess in self._sessions.values():
+                sess.close()
+            self._sessions.clear()
+
+
+# ==========================
+# ★ 既定のクライアント（プロセス内で共有：post_all / daemon でも接続を使い回す）
+# ==========================
+HTTP = PosterHTTP()
+request = HTTP.request
+session_for = HTTP.session_for
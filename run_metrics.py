@@ -0,0 +1,149 @@
+# run_metrics.py (実行ごとの計測：処理ごとの所要時間スパン + キャッシュのカウンタ → run_report.json)
+#
+#   with run_metrics.span("fetch", url=url) as sp:
+#       resp = session.get(url)
+#       sp["status"] = resp.status_code
+#   run_metrics.set_counters("image_cache", IMAGE_CACHE_RGBA.report())
+#   run_metrics.write_report("/tmp/run_report.json")
+#
+# スパンは名前ごとに 件数/合計/最大 を集計し、個別のスパン（属性つき）も MAX_SPANS 件まで残す。
+import datetime
+import json
+import os
+import platform
+import threading
+import time
+
+MAX_SPANS = int(os.getenv("RUN_METRICS_MAX_SPANS", "2000"))
+REPORT_NAME = "run_report.json"
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "attrs", "t0")
+
+    def __init__(self, metrics, name, attrs):
+        self.metrics = metrics
+        self.name = name
+        self.attrs = attrs
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.metrics.record(self.name, self.t0, time.perf_counter(), self.attrs)
+        return False
+
+
+class RunMetrics:
+    """
+    1回の実行（run）の計測値。スレッドから同時に記録してよい。
+    """
+
+    def __init__(self, name="run"):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.datetime.now(datetime.timezone.utc)
+            self._t0 = time.perf_counter()
+            self.totals = {}
+            self.spans = []
+            self.dropped = 0
+            self.counters = {}
+            self.info = {}
+
+    def span(self, name, **attrs):
+        return _Span(self, name, attrs)
+
+    def record(self, name, t0, t1, attrs=None):
+        ms = (t1 - t0) * 1000.0
+        with self._lock:
+            tot = self.totals.get(name)
+            if tot is None:
+                tot = self.totals[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            tot["count"] += 1
+            tot["total_ms"] += ms
+            if ms > tot["max_ms"]:
+                tot["max_ms"] = ms
+
+            if len(self.spans) < MAX_SPANS:
+                item = {"name": name, "start_ms": round((t0 - self._t0) * 1000.0, 3), "ms": round(ms, 3)}
+                if attrs:
+                    item.update(attrs)
+                self.spans.append(item)
+            else:
+                self.dropped += 1
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counters(self, name, values):
+        with self._lock:
+            self.counters[name] = values
+
+    def set_info(self, **values):
+        with self._lock:
+            self.info.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            totals = {
+                k: {"count": v["count"], "total_ms": round(v["total_ms"], 3), "max_ms": round(v["max_ms"], 3)}
+                for k, v in sorted(self.totals.items())
+            }
+            return {
+                "name": self.name,
+                "startedAt": self.started_at.isoformat(timespec="milliseconds"),
+                "elapsedMs": round((time.perf_counter() - self._t0) * 1000.0, 3),
+                "python": platform.python_version(),
+                "info": dict(self.info),
+                "totals": totals,
+                "counters": dict(self.counters),
+                "spans": list(self.spans),
+                "droppedSpans": self.dropped,
+            }
+
+    def write_report(self, path):
+        """
+        path に JSON で書き出す（一時ファイル → rename）。失敗しても本処理は止めない。
+        """
+        try:
+            data = self.snapshot()
+            out_dir = os.path.dirname(path)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+            print(f"[INFO] run report: {path} ({data['elapsedMs']:.0f}ms, spans={len(data['spans'])})")
+            return data
+        except Exception as e:
+            print(f"[WARN] run report write failed: {path} err={e}")
+            return None
+
+
+def report_path(schedule_json_path, suffix=""):
+    """
+    schedule.json と同じディレクトリの run_report.json（suffix があれば run_report_<suffix>.json）
+    """
+    name = REPORT_NAME if not suffix else f"run_report_{suffix}.json"
+    return os.path.join(os.path.dirname(schedule_json_path) or ".", name)
+
+
+# ==========================
+# ★ 既定の計測先（画像生成側）
+# ==========================
+METRICS = RunMetrics("schedule")
+span = METRICS.span
+incr = METRICS.incr
+set_counters = METRICS.set_counters
+set_info = METRICS.set_info
+write_report = METRICS.write_report
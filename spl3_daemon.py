@@ -0,0 +1,204 @@
+# spl3_daemon.py (常駐版：ローテーション境界に合わせて 取得→描画→投稿 まで一気にやる)
+#
+#   python spl3_daemon.py                     # 常駐（境界ごとに投稿）
+#   python spl3_daemon.py --once --no-post    # 1回だけ描画して終了（動作確認用）
+#
+# フォント/テンプレート/asset pack/画像キャッシュ/HTTP 接続はプロセス内で使い回すので、
+# 境界から投稿までにコールドスタート（import・フォント読み込み・デコード）が挟まらない。
+import argparse
+import datetime
+import json
+import os
+import time
+
+import image_encode
+import post_all
+import run_metrics
+import spl3_schedule_ver0 as gen
+
+
+# ==========================
+# ★ 設定
+# ==========================
+DAEMON_POSTERS = os.getenv("DAEMON_POSTERS", "x,bluesky,misskey")
+
+PREFETCH_LEAD_SEC = float(os.getenv("DAEMON_PREFETCH_LEAD_SEC", "60"))   # 境界の何秒前に先読みするか
+POLL_INTERVAL_SEC = float(os.getenv("DAEMON_POLL_INTERVAL_SEC", "5"))    # API が切り替わるまでの確認間隔
+POLL_TIMEOUT_SEC = float(os.getenv("DAEMON_POLL_TIMEOUT_SEC", "600"))    # これを過ぎたら古いデータのまま描く
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default="Thumbnail/Thumbnail.png", help="Output image path")
+    parser.add_argument(
+        "--schedule-json",
+        type=str,
+        default=os.getenv("SCHEDULE_JSON", "/tmp/schedule.json"),
+        help="Output schedule.json path (passed to the posters)",
+    )
+    parser.add_argument("--posters", type=str, default=DAEMON_POSTERS, help="Comma separated: x,bluesky,misskey")
+    parser.add_argument("--no-post", action="store_true", help="Render only (do not post)")
+    parser.add_argument("--once", action="store_true", help="Render (and post) the current rotation once and exit")
+    parser.add_argument("--render-workers", type=int, default=gen.RENDER_WORKERS)
+    parser.add_argument("--asset-pack", type=str, default=gen.asset_pack.ASSET_PACK_PATH)
+    return parser.parse_args()
+
+
+def _sleep_until(when):
+    while True:
+        left = (when - datetime.datetime.now(gen.JST)).total_seconds()
+        if left <= 0:
+            return
+        time.sleep(min(left, 60))
+
+
+def _log_time(msg):
+    print(f"[INFO] {datetime.datetime.now(gen.JST).strftime('%H:%M:%S')} {msg}")
+
+
+# ==========================
+# ★ 取得（境界の API 切り替わり待ち）
+# ==========================
+def fetch_rotation(boundary=None):
+    """
+    schedule / now をまとめて取得する。boundary を渡した場合は、regular の now 枠が
+    その時刻から始まる（= API が切り替わった）まで POLL_INTERVAL_SEC 間隔で取り直す。
+    """
+    deadline = time.monotonic() + POLL_TIMEOUT_SEC
+    polls = 0
+
+    while True:
+        polls += 1
+        gen.REQUEST_MEMO.reset()
+        fetched = gen.prefetch_all(now_keys=["regular"])
+
+        if boundary is None:
+            return fetched
+
+        start = gen._parse_iso((fetched["now"].get("regular") or {}).get("start_time"))
+        if start is not None and start >= boundary:
+            _log_time(f"API 切り替わり確認（{polls} 回目）")
+            return fetched
+
+        if time.monotonic() >= deadline:
+            print(f"[WARN] {POLL_TIMEOUT_SEC:.0f} 秒待っても API が切り替わらないので、そのまま描画します")
+            return fetched
+
+        print(f"[INFO] API まだ切り替わっていません（{polls} 回目 now={start}）→ {POLL_INTERVAL_SEC:g} 秒後に再取得")
+        time.sleep(POLL_INTERVAL_SEC)
+
+
+def prefetch_warm(fetched):
+    """
+    境界前の先読み：次の枠で使う画像を画像キャッシュに入れておく（接続も温まる）
+    """
+    shifted = gen.shift_schedules(fetched["schedule"], fetched["now"], 1)
+    if shifted is None:
+        return
+    sched_k, nows_k, _ = shifted
+    try:
+        fest_slots = gen.check_fest_slots(sched_k["fest_open"])
+        plan = gen.build_render_plan(sched_k, nows_k, fest_slots)
+        gen.render_plan(gen.FEST_BASE_CACHE.get(fest_slots), plan)
+    except Exception as e:
+        print(f"[WARN] 先読み描画に失敗: {e}")
+
+
+# ==========================
+# ★ 描画・投稿
+# ==========================
+def render_rotation(args, fetched, variants=()):
+    """
+    描画して 本体画像 + 投稿先ごとの版（variants）+ schedule.json を書く
+    """
+    with run_metrics.span("render", workers=args.render_workers):
+        fest_slots, now_items, base = gen.render_schedule(
+            fetched["schedule"], fetched["now"], render_workers=args.render_workers
+        )
+    payload = gen.build_schedule_payload(fest_slots, now_items)
+
+    with run_metrics.span("encode", path=args.output, variants=len(variants)) as sp:
+        infos = image_encode.save_outputs(base, args.output, variants)
+        sp.update(infos["main"])
+    if variants:
+        payload["imageVariants"] = image_encode.variants_manifest(infos)
+
+    with open(args.schedule_json, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    gen.LABEL_CACHE.save()
+    run_metrics.set_info(output=args.output, festMask=gen.fest_slot_mask(fest_slots))
+    _log_time(f"描画完了: {args.output} / {args.schedule_json}")
+
+
+def post_rotation(posters, args):
+    """
+    post_all と同じく各投稿先に並列で投稿する（失敗/タイムアウトしても他は続ける）
+    """
+    with run_metrics.span("post", posters=",".join(posters)):
+        results = post_all.run_posters(posters, args.output, args.schedule_json)
+    run_metrics.set_info(posts=results)
+    post_all.print_summary(results)
+    return results
+
+
+# ==========================
+# ★ メインループ
+# ==========================
+def main():
+    args = parse_args()
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    gen.OUTPUT_PATH = args.output
+    gen.init_asset_pack(args.asset_pack)
+    posters = {} if args.no_post else post_all.load_posters(args.posters)
+    # 投稿先ごとの版は描画と同じパスで作る（投稿側で PNG を開き直して再エンコードしない）
+    variants = image_encode.parse_variants(",".join(posters))
+
+    if args.once:
+        run_metrics.METRICS.reset()
+        with run_metrics.span("prefetch"):
+            fetched = fetch_rotation()
+        render_rotation(args, fetched, variants)
+        if posters:
+            post_rotation(posters, args)
+        gen.collect_run_counters()
+        run_metrics.write_report(run_metrics.report_path(args.schedule_json))
+        return
+
+    while True:
+        boundary = gen.next_rotation_boundary()
+        _log_time(f"次の境界: {boundary.strftime('%m/%d %H:%M')}")
+
+        # ① 境界の少し前に先読み（接続・画像キャッシュを温める）
+        _sleep_until(boundary - datetime.timedelta(seconds=PREFETCH_LEAD_SEC))
+        try:
+            prefetch_warm(fetch_rotation())
+            _log_time("先読み完了")
+        except Exception as e:
+            print(f"[WARN] 先読みに失敗: {e}")
+
+        # ② 境界を過ぎたら API が切り替わるまで取り直して描画 → 投稿
+        _sleep_until(boundary)
+        run_metrics.METRICS.reset()
+        try:
+            with run_metrics.span("prefetch"):
+                fetched = fetch_rotation(boundary)
+            render_rotation(args, fetched, variants)
+            if posters:
+                post_rotation(posters, args)
+            lag = (datetime.datetime.now(gen.JST) - boundary).total_seconds()
+            run_metrics.set_info(boundary=boundary.isoformat(), boundaryToPostSec=round(lag, 3))
+            _log_time(f"境界から投稿完了まで {lag:.1f} 秒")
+        except Exception as e:
+            print(f"[ERR] 境界 {boundary.strftime('%H:%M')} の処理に失敗: {e}")
+
+        # 境界ごとに run_report.json を上書き（キャッシュのカウンタはプロセス起動からの累計）
+        gen.collect_run_counters()
+        run_metrics.write_report(run_metrics.report_path(args.schedule_json))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
 from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 import datetime
+import hashlib
 import os
 import json
+import math
+import shutil
+import threading
 import time
 
+import asset_pack
+import image_encode
+import http_cassette
+import run_metrics
+
 # ==========================
 # ★ サーモン難易度評価（A案）
 # ==========================
@@ -89,10 +101,36 @@ API_NOW_URLS = {
     "fest_challenge": "https://spla3.yuu26.com/api/fest-challenge/now",
 }
 
+# ★全モードまとめたスケジュール（1リクエストで regular〜fest を取れる）
+API_ALL_URL = "https://spla3.yuu26.com/api/schedule"
+
+# 統合スケジュール(result)のキー → API_URLS のキー
+# ※サーモン(coop-grouping)は統合スケジュールに含まれないので個別取得のまま
+API_ALL_KEYS = {
+    "regular": "regular",
+    "bankara_open": "open",
+    "bankara_challenge": "challenge",
+    "x": "xmatch",
+    "fest": "fest_open",
+    "fest_challenge": "fest_challenge",
+}
+
+# aggregate: 統合スケジュール + サーモンだけ個別 / per-mode: 従来どおりモードごとに取得
+FETCH_BACKENDS = ("aggregate", "per-mode")
+FETCH_BACKEND = os.getenv("FETCH_BACKEND", "aggregate")
+
+API_HEADERS = {
+    "User-Agent": "Spla3StageBot/1.0",
+    # ★CDN/プロキシ/ブラウザキャッシュ回避を強めに
+    "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
 # ==========================
 # ★ 引数 --output 対応
 # ==========================
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--output",
@@ -100,7 +138,122 @@ def parse_args():
         default="Thumbnail/Thumbnail.png",
         help="Output image path",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--verify-now",
+        action="store_true",
+        default=os.getenv("SCHEDULE_VERIFY_NOW", "") == "1",
+        help="Cross-check schedule.json against the /now endpoints (extra requests)",
+    )
+    parser.add_argument(
+        "--fetch-backend",
+        choices=FETCH_BACKENDS,
+        default=FETCH_BACKEND,
+        help="aggregate: one all-modes schedule request (+ salmon); per-mode: one request per mode",
+    )
+    parser.add_argument(
+        "--asset-pack",
+        type=str,
+        default=asset_pack.ASSET_PACK_PATH,
+        help="Raw RGBA asset pack path (rebuilt when a source asset changes; empty = decode PNGs)",
+    )
+    parser.add_argument(
+        "--build-asset-pack",
+        action="store_true",
+        help="Build the asset pack and exit",
+    )
+    parser.add_argument(
+        "--incremental",
+        type=str,
+        default=os.getenv("INCREMENTAL_STATE_DIR", ""),
+        help="State dir for incremental rendering (re-render only slots whose inputs changed; empty = full render)",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=RENDER_WORKERS,
+        help="Render the mode columns in parallel with this many threads (1 = sequential)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=0,
+        help="Also render the next N rotations in advance (each as if it were now)",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        type=str,
+        default="",
+        help="Output dir for --batch (default: <output dir>/batch)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(image_encode.PIL_FORMATS),
+        default=None,
+        help="Output image format (default: from the --output extension)",
+    )
+    parser.add_argument(
+        "--alpha",
+        choices=image_encode.ALPHA_MODES,
+        default=None,
+        help="keep: RGBA as rendered / drop: write RGB (translucent pixels are flattened onto OUTPUT_BACKGROUND)",
+    )
+    parser.add_argument(
+        "--colors",
+        type=int,
+        default=None,
+        help="PNG: quantize to an adaptive palette with this many colours (0 = off)",
+    )
+    parser.add_argument(
+        "--min-psnr",
+        type=float,
+        default=None,
+        help="PNG: keep full colour when the palette image is below this PSNR (dB)",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=None,
+        help="PNG zlib compression level 0-9",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=None,
+        help="WebP / JPEG quality",
+    )
+    parser.add_argument(
+        "--variants",
+        type=str,
+        default=image_encode.OUTPUT_VARIANTS,
+        help="Also write per-platform variants in the same pass (comma separated: x,bluesky,misskey)",
+    )
+    parser.add_argument(
+        "--variants-dir",
+        type=str,
+        default="",
+        help="Output dir for --variants (default: next to --output)",
+    )
+    parser.add_argument(
+        "--render-cache",
+        type=str,
+        default=RENDER_CACHE_DIR,
+        help="Render cache dir: reuse the stored image + schedule.json when the inputs are unchanged (empty = off)",
+    )
+    return parser.parse_args(argv)
+
+
+def encode_options(args):
+    """
+    コマンドライン指定分だけの encode オプション（未指定は image_encode.DEFAULT_OPTIONS）
+    """
+    return {
+        "format": args.format,
+        "alpha": args.alpha,
+        "colors": args.colors,
+        "min_psnr": args.min_psnr,
+        "compress_level": args.compress_level,
+        "quality": args.quality,
+    }
 
 # ==========================
 # ★ パス設定
@@ -118,28 +271,169 @@ os.makedirs("Thumbnail", exist_ok=True)
 # ==========================
 session = requests.Session()
 
+# ★並列フェッチ用：スレッド数と同じだけ keep-alive 接続を持てるようにする
+#   （requests の既定 pool_maxsize=10 を超えると接続が使い捨てになる）
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "14"))
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_WORKERS)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+# ★HTTP_CASSETTE_MODE=record/replay のときはカセット（記録/再生）経由にする
+session = http_cassette.wrap_session(session)
+
+
+def http_get(url, headers=None, params=None, timeout=10):
+    """
+    session.get を計測つきで呼ぶ（URL/ステータス/バイト数を fetch スパンに残す）
+    """
+    with run_metrics.span("fetch", url=url) as sp:
+        resp = session.get(url, headers=headers, params=params, timeout=timeout)
+        sp["status"] = resp.status_code
+        sp["bytes"] = len(resp.content)
+    return resp
+
+class ImageCache:
+    """
+    デコード済み画像の LRU キャッシュ（メモリ上限はバイト数で指定）。
+    上限を超えたら最後に使われたのが一番古いものから捨てる。
+    hits / misses / evictions はレポート用のカウンタ。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def sizeof(img: Image.Image) -> int:
+        w, h = img.size
+        return w * h * len(img.getbands())
+
+    def get(self, key, count=True):
+        """
+        count=False なら hits / misses を数えない（同じ取得の中での確認し直し用）
+        """
+        with self._lock:
+            img = self._items.get(key)
+            if img is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            if count:
+                self.hits += 1
+            return img
+
+    def put(self, key, img: Image.Image):
+        size = self.sizeof(img)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= self.sizeof(old)
+
+            self._items[key] = img
+            self.bytes += size
+
+            while self.bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def report(self, name="image cache"):
+        print(
+            f"[INFO] {name}: hits={self.hits} misses={self.misses} evictions={self.evictions} "
+            f"items={len(self)} bytes={self.bytes}/{self.max_bytes}"
+        )
+        return {
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "items": len(self), "bytes": self.bytes, "maxBytes": self.max_bytes,
+        }
+
+
 # ★重要：すべてRGBAで扱う（Open/Challenge/Xの描画崩れ防止）
-IMAGE_CACHE_RGBA = {}
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+IMAGE_CACHE_RGBA = ImageCache(IMAGE_CACHE_MAX_BYTES)
+_IMAGE_INFLIGHT = {}
+_IMAGE_INFLIGHT_LOCK = threading.Lock()
 
 def fetch_image_rgba(url: str) -> Image.Image:
-    if url not in IMAGE_CACHE_RGBA:
-        resp = session.get(url, headers={"User-Agent": "Spla3Img/1.0"}, timeout=10)
+    """
+    URL の画像を RGBA で返す。
+    ★キャッシュ上の画像をそのまま返す（コピーしない）ので、呼び出し側は
+      resize() などで新しい画像を作ってから使うこと（直接書き換えない）。
+    """
+    img = IMAGE_CACHE_RGBA.get(url)
+    if img is not None:
+        return img
+
+    # ★並列描画で同じ画像を複数スレッドが同時に取りに行かないよう、取得中のものは待つ
+    with _IMAGE_INFLIGHT_LOCK:
+        fut = _IMAGE_INFLIGHT.get(url)
+        owner = fut is None
+        if owner:
+            # 上の get() の後に別スレッドが取得を終えている（put 済み・Future は片付け済み）ことがある
+            img = IMAGE_CACHE_RGBA.get(url, count=False)
+            if img is not None:
+                return img
+            fut = Future()
+            _IMAGE_INFLIGHT[url] = fut
+
+    if not owner:
+        return fut.result()
+
+    try:
+        resp = http_get(url, headers={"User-Agent": "Spla3Img/1.0"}, timeout=10)
         resp.raise_for_status()
-        IMAGE_CACHE_RGBA[url] = Image.open(BytesIO(resp.content)).convert("RGBA")
-    return IMAGE_CACHE_RGBA[url].copy()
+        with run_metrics.span("decode", url=url):
+            img = Image.open(BytesIO(resp.content)).convert("RGBA")
+        IMAGE_CACHE_RGBA.put(url, img)
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(img)
+    finally:
+        with _IMAGE_INFLIGHT_LOCK:
+            _IMAGE_INFLIGHT.pop(url, None)
+    return img
+
+def load_sprite(url: str, size) -> Image.Image:
+    """
+    URL の画像を size(w, h) にリサイズした新しい画像を返す（貼り付け用）
+    """
+    img = fetch_image_rgba(url)
+    with run_metrics.span("resize"):
+        return img.resize(size)
 
 # ==========================
 # ★ フェス開催中判定（スロット別）
 # ==========================
-def check_fest_slots():
+def check_fest_slots(fest_results=None):
     """
     fest/schedule を見て、now/next/next2/next3/next4 がフェス枠かを判定して返す
     判定条件：そのスロットの stages が None ではない（=フェスのステージ情報がある）
+    fest_results を渡した場合はそれを使い、API は叩かない（並列プリフェッチ済み用）
     """
     slots = {"now": False, "next": False, "next2": False, "next3": False, "next4": False}
 
     try:
-        fest_results = fetch_schedule(API_URLS["fest_open"])
+        if fest_results is None:
+            fest_results = fetch_schedule(API_URLS["fest_open"])
         for idx, slot in enumerate(["now", "next", "next2", "next3", "next4"]):
             if idx >= len(fest_results):
                 continue
@@ -214,28 +508,216 @@ def format_salmon_datetime(iso_str: str) -> str:
     weekday = "月火水木金土日"[dt.weekday()]
     return dt.strftime(f"%m/%d({weekday}) %H:%M")
 
+# ==========================
+# ★ 高速化:文字ラベルのスプライトキャッシュ
+# ==========================
+LABEL_CACHE_PATH = os.getenv("LABEL_CACHE_PATH", ".cache/labels.pack")
+# サーモンの日時など実行ごとに新しい文字が増えるので、使われていないものから捨てる（1実行 ≒ 200枚）
+LABEL_CACHE_MAX_TILES = int(os.getenv("LABEL_CACHE_MAX_TILES", "1024"))
+
+
+def _freetype_version() -> str:
+    try:
+        return ImageFont.core.freetype2_version
+    except Exception:
+        return "?"
+
+
+class LabelCache:
+    """
+    「背景矩形＋文字」のラベルを、ラスタライズ済みタイルとしてキャッシュする。
+    - color: 矩形と文字を描いた RGBA（矩形の外は文字色・alpha=255）
+    - mask : どこをどれだけ塗るか（矩形=255、矩形の外は文字のアンチエイリアス値）
+    base.paste(color, pos, mask) は draw.rectangle → draw.text と同じ合成式になるので、
+    直接描いた場合とピクセル単位で一致する。
+    FreeType は描画位置の小数部でグリフが変わるため、キーには小数部も含める。
+    ファイル（asset pack と同じ形式）に保存して、次の実行でも使い回す。
+    タイルは max_tiles 枚までの LRU（保存するのも残っている分だけ）。
+    """
+
+    def __init__(self, path="", max_tiles=LABEL_CACHE_MAX_TILES):
+        self.path = path
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._metrics = OrderedDict()
+        # FreeType のフェイスはスレッド間で共有できないので、getbbox / text もこのロック内で呼ぶ
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _version(self):
+        return f"pillow={Image.__version__};freetype={_freetype_version()}"
+
+    @staticmethod
+    def _font_id(font):
+        return [os.path.basename(getattr(font, "path", "") or ""), getattr(font, "size", 0)]
+
+    def _key(self, text, font, bg_fill, text_fill, padding, fx, fy):
+        return json.dumps(
+            [text, self._font_id(font), list(bg_fill), list(text_fill), padding, fx, fy],
+            ensure_ascii=False,
+        )
+
+    def _load(self):
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            pack = asset_pack.AssetPack(self.path)
+        except Exception as e:
+            print(f"[WARN] label cache open failed: {self.path} err={e}")
+            return
+
+        try:
+            meta = pack.manifest.get("labels") or {}
+            if pack.manifest.get("labelVersion") != self._version():
+                print("[INFO] label cache version changed (discard)")
+                return
+            for key, info in list(meta.items())[-self.max_tiles:]:
+                color = pack.image(info["color"]).copy()
+                mask = pack.image(info["mask"]).copy()
+                self._tiles[key] = (color, mask, tuple(info["origin"]))
+        except Exception as e:
+            print(f"[WARN] label cache load failed: {self.path} err={e}")
+            self._tiles.clear()
+        finally:
+            pack.close()
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            images = {}
+            labels = {}
+            for i, (key, (color, mask, origin)) in enumerate(self._tiles.items()):
+                images[f"{i}c"] = color
+                images[f"{i}m"] = mask
+                labels[key] = {"color": f"{i}c", "mask": f"{i}m", "origin": list(origin)}
+            try:
+                asset_pack.write_raw_pack(self.path, images, {
+                    "labelVersion": self._version(),
+                    "labels": labels,
+                })
+                self._dirty = False
+            except Exception as e:
+                print(f"[WARN] label cache write failed: {self.path} err={e}")
+
+    def metrics(self, text, font):
+        """
+        draw.textbbox((0, 0), text, font) の幅/高さ（フォントモード L 前提）
+        """
+        key = (text, id(font))
+        with self._lock:
+            m = self._metrics.get(key)
+            if m is None:
+                bbox = font.getbbox(text, "L")
+                m = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+                self._metrics[key] = m
+                if len(self._metrics) > self.max_tiles:
+                    self._metrics.popitem(last=False)
+            else:
+                self._metrics.move_to_end(key)
+        return m
+
+    @staticmethod
+    def _render(text, font, bg_fill, text_fill, padding, fx, fy, tw, th):
+        left, top, right, bottom = font.getbbox(text, "L")
+        # 矩形とインクの両方が入る範囲（描画位置 (fx, fy) 基準）＋アンチエイリアス分の余白
+        x0 = math.floor(min(-padding, left)) - 2
+        y0 = math.floor(min(-padding, top)) - 2
+        x1 = math.ceil(max(tw + padding, right)) + 3
+        y1 = math.ceil(max(th + padding, bottom)) + 3
+        size = (x1 - x0, y1 - y0)
+
+        # タイル内での描画位置（整数シフトだけなので小数部はそのまま）
+        tx = fx - x0
+        ty = fy - y0
+        rect = [tx - padding, ty - padding, tx + tw + padding, ty + th + padding]
+
+        color = Image.new("RGBA", size, tuple(text_fill) + (255,))
+        cd = ImageDraw.Draw(color)
+        cd.rectangle(rect, fill=bg_fill)
+        cd.text((tx, ty), text, font=font, fill=text_fill)
+
+        mask = Image.new("L", size, 0)
+        md = ImageDraw.Draw(mask)
+        md.rectangle(rect, fill=255)
+        md.text((tx, ty), text, font=font, fill=255)
+
+        return color, mask, (x0, y0)
+
+    def draw(self, draw, x, y, text, font, bg_fill, text_fill=(0, 0, 0), padding=2, base=None):
+        """
+        (x, y) を文字の描画位置として、背景矩形つきラベルを貼る。
+        base（draw の描画先の画像）があればタイルを貼り、無ければ draw に直接描く。
+        """
+        with run_metrics.span("text"):
+            self._draw(draw, x, y, text, font, bg_fill, text_fill, padding, base)
+
+    def _draw(self, draw, x, y, text, font, bg_fill, text_fill, padding, base):
+        if base is None or x < 0 or y < 0:
+            with self._lock:
+                tw, th = self.metrics(text, font)
+                draw.rectangle([x - padding, y - padding, x + tw + padding, y + th + padding], fill=bg_fill)
+                draw.text((x, y), text, font=font, fill=text_fill)
+                ink = draw.textbbox((x, y), text, font=font)
+            _track_box(tuple(int(v) for v in ink))
+            _track_box((int(x - padding), int(y - padding), int(x + tw + padding) + 1, int(y + th + padding) + 1))
+            return
+
+        ix, iy = int(x), int(y)
+        fx, fy = x - ix, y - iy
+        key = self._key(text, font, bg_fill, text_fill, padding, fx, fy)
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            tile = self._tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                tw, th = self.metrics(text, font)
+                tile = self._render(text, font, bg_fill, text_fill, padding, fx, fy, tw, th)
+                self._tiles[key] = tile
+                self._dirty = True
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.hits += 1
+                self._tiles.move_to_end(key)
+
+        color, mask, (ox, oy) = tile
+        base.paste(color, (ix + ox, iy + oy), mask)
+        _track_box((ix + ox, iy + oy, ix + ox + color.size[0], iy + oy + color.size[1]))
+
+    def report(self):
+        print(f"[INFO] label cache: hits={self.hits} misses={self.misses} evictions={self.evictions} "
+              f"tiles={len(self._tiles)}")
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "tiles": len(self._tiles)}
+
+
+LABEL_CACHE = LabelCache(LABEL_CACHE_PATH)
+
+
 # ==========================
 # ★ テキスト描画ユーティリティ
 # ==========================
-def draw_text_left(draw, box, text, font, bg_fill, text_fill=(0, 0, 0), padding=2):
+def draw_text_left(draw, box, text, font, bg_fill, text_fill=(0, 0, 0), padding=2, base=None):
     x, y, w, h = box
-    bbox = draw.textbbox((0, 0), text, font=font)
-    tw = bbox[2] - bbox[0]
-    th = bbox[3] - bbox[1]
+    tw, th = LABEL_CACHE.metrics(text, font)
     tx = x
     ty = y + (h - th) / 2
-    draw.rectangle([tx - padding, ty - padding, tx + tw + padding, ty + th + padding], fill=bg_fill)
-    draw.text((tx, ty), text, font=font, fill=text_fill)
+    LABEL_CACHE.draw(draw, tx, ty, text, font, bg_fill, text_fill=text_fill, padding=padding, base=base)
 
-def draw_text_with_bg(draw, box, text, font, bg_fill, text_fill=(0, 0, 0), padding=2):
+def draw_text_with_bg(draw, box, text, font, bg_fill, text_fill=(0, 0, 0), padding=2, base=None):
     x, y, w, h = box
-    bbox = draw.textbbox((0, 0), text, font=font)
-    tw = bbox[2] - bbox[0]
-    th = bbox[3] - bbox[1]
+    tw, th = LABEL_CACHE.metrics(text, font)
     cx = x + (w - tw) / 2
     cy = y + (h - th) / 2
-    draw.rectangle([cx - padding, cy - padding, cx + tw + padding, cy + th + padding], fill=bg_fill)
-    draw.text((cx, cy), text, font=font, fill=text_fill)
+    LABEL_CACHE.draw(draw, cx, cy, text, font, bg_fill, text_fill=text_fill, padding=padding, base=base)
 
 # ==========================
 # ★ ルールアイコン座標
@@ -271,12 +753,11 @@ def draw_rule_icon(base, mode, slot, rule_key):
         return
 
     x, y, w, h = RULE_ICON_COORDS[mode][slot]
-    icon_path = os.path.join(ICON_DIR, f"{rule_key}.png")
-    if not os.path.exists(icon_path):
+    icon = ICON_REGISTRY.get(os.path.join(ICON_DIR, f"{rule_key}.png"), (int(w), int(h)))
+    if icon is None:
         return
 
-    icon = Image.open(icon_path).convert("RGBA").resize((int(w), int(h)))
-    base.paste(icon, (int(x), int(y)), icon)
+    paste_sprite(base, icon, (int(x), int(y)))
 
 # ==========================
 # ★ ステージ座標
@@ -504,6 +985,7 @@ BIG_RUN_COORDS = {
     "next3": (990, 501, 70, 35),
     "next4": (990, 581, 70, 35),
 }
+BIG_RUN_ICON = "big_run.png"
 
 def draw_big_run(base, slot, is_big_run):
     if not is_big_run:
@@ -512,12 +994,11 @@ def draw_big_run(base, slot, is_big_run):
         return
 
     x, y, w, h = BIG_RUN_COORDS[slot]
-    icon_path = os.path.join(ICON_DIR, "big_run.png")
-    if not os.path.exists(icon_path):
+    img = ICON_REGISTRY.get(os.path.join(ICON_DIR, BIG_RUN_ICON), (int(w), int(h)))
+    if img is None:
         return
 
-    img = Image.open(icon_path).convert("RGBA").resize((int(w), int(h)))
-    base.paste(img, (int(x), int(y)), img)
+    paste_sprite(base, img, (int(x), int(y)))
 
 # ==========================
 # ★ BOSS（オカシラ）
@@ -537,20 +1018,19 @@ BOSS_SIZES = {
     "next3":(30, 30),
     "next4":(30, 30),
 }
+BOSS_ICON_PREFIX = "Q29vcEVuZW15"  # オカシラの id（base64 の "CoopEnemy-..."）。icon/<id>.png
 
 def draw_boss_icon(base, slot, boss_id):
     if not boss_id or slot not in BOSS_COORDS:
         return
 
-    icon_file = boss_id + ".png"
-    icon_path = os.path.join(ICON_DIR, icon_file)
-    if not os.path.exists(icon_path):
-        return
-
     x, y = BOSS_COORDS[slot]
     w, h = BOSS_SIZES[slot]
-    icon = Image.open(icon_path).convert("RGBA").resize((int(w), int(h)))
-    base.paste(icon, (int(x), int(y)), icon)
+    icon = ICON_REGISTRY.get(os.path.join(ICON_DIR, boss_id + ".png"), (int(w), int(h)))
+    if icon is None:
+        return
+
+    paste_sprite(base, icon, (int(x), int(y)))
 
 # ==========================
 # ★ サーモン武器（RGBA合成）
@@ -571,60 +1051,210 @@ def draw_salmon_weapons(base, slot, weapons):
 
         wx, wy = cslot[key]
         try:
-            img = fetch_image_rgba(weapons[i]["image"]).resize(size)
-            base.paste(img, (int(wx), int(wy)), img)
+            img = load_sprite(weapons[i]["image"], size)
+            paste_sprite(base, img, (int(wx), int(wy)))
         except Exception as e:
             print(f"[WARN] weapon paste failed slot={slot} i={i}: {e}")
+            _track_asset_error()
 
 # ==========================
-# ★ API 共通（最新版を拾いやすい強化版）
+# ★ 高速化:1実行内のリクエストメモ化（single-flight）
 # ==========================
+class RequestMemo:
+    """
+    1回の実行（run）の中で、同じリクエストを1回だけ送るためのメモ化レイヤ。
+    - 取得済みなら結果をそのまま返す
+    - 同じリクエストが実行中なら、新しく送らずにその結果を待つ（single-flight）
+    saved は「メモのおかげで送らずに済んだ回数」。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = {}
+        self._inflight = {}
+        self.requested = 0
+        self.saved = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._done:
+                self.saved += 1
+                return self._done[key]
+
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.saved += 1
+                owner = False
+            else:
+                fut = Future()
+                self._inflight[key] = fut
+                self.requested += 1
+                owner = True
+
+        if not owner:
+            return fut.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+
+        with self._lock:
+            self._done[key] = value
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+        return value
+
+    def seed(self, key, value):
+        """
+        別経路で取得済みの結果をメモに入れる（取得済み/取得中なら何もしない）
+        """
+        with self._lock:
+            if key not in self._done and key not in self._inflight:
+                self._done[key] = value
+
+    def reset(self):
+        with self._lock:
+            self._done.clear()
+            self._inflight.clear()
+            self.requested = 0
+            self.saved = 0
+
+    def report(self):
+        print(f"[INFO] request memo: requested={self.requested} saved={self.saved}")
+        return {"requested": self.requested, "saved": self.saved}
+
+
+REQUEST_MEMO = RequestMemo()
+
+
 def fetch_schedule(url: str):
+    """
+    schedule API の results(list) を返す（1実行内でメモ化）。
+    """
+    return REQUEST_MEMO.get(("schedule", url), lambda: _fetch_schedule_uncached(url))
+
+
+def fetch_now(url: str):
+    """
+    now API の now枠(dict) を返す（1実行内でメモ化）。
+    """
+    return REQUEST_MEMO.get(("now", url), lambda: _fetch_now_uncached(url))
+
+
+def fetch_all_schedules():
+    """
+    統合スケジュール API を1回だけ取得し、{API_URLS のキー: results} に分割して返す（メモ化）。
+    分割した結果は fetch_schedule 側のメモにも入れておくので、
+    後から fetch_schedule(API_URLS[...]) を呼んでも追加のリクエストは発生しない。
+    """
+    split = REQUEST_MEMO.get(("all", API_ALL_URL), _fetch_all_uncached)
+    for mode, results in split.items():
+        REQUEST_MEMO.seed(("schedule", API_URLS[mode]), results)
+    return split
+
+
+# ==========================
+# ★ 鮮度チェック付き取得（境界直後に CDN の古いキャッシュを掴む対策）
+# ==========================
+#   時計から「今のローテーション境界」を出し、先頭の枠がそれより前に終わっていたら古いデータとみなす。
+#   新しければ1回で返し、古い間だけ指数バックオフ（上限あり）で取り直す。
+FETCH_POLL_INITIAL_SEC = float(os.getenv("FETCH_POLL_INITIAL_SEC", "0.25"))
+FETCH_POLL_MAX_SEC = float(os.getenv("FETCH_POLL_MAX_SEC", "4"))
+FETCH_POLL_BUDGET_SEC = float(os.getenv("FETCH_POLL_BUDGET_SEC", "20"))
+MIN_SCHEDULE_RESULTS = 5
+
+
+def _api_time(v):
+    if not isinstance(v, str) or not v:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(v.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def results_freshness(results, min_results=0, now=None):
+    """
+    results の先頭枠が「今」のものかを判定して (状態, 説明) を返す。状態は "fresh" / "stale" / "short"。
+    - バトル系: 先頭の start_time が今の境界以降なら fresh
+    - サーモン等（境界と周期が違うもの）: 先頭枠が今を含んでいれば fresh
+    - 件数が min_results 未満なら short（取り直し対象）
+    """
+    now = now or now_jst()
+    boundary = current_rotation_boundary(now)
+
+    if not isinstance(results, list) or len(results) < min_results:
+        return "short", f"results={len(results) if isinstance(results, list) else 0}"
+    if not results:
+        return "fresh", "results=0"
+
+    first = results[0] if isinstance(results[0], dict) else {}
+    start = _api_time(first.get("start_time"))
+    end = _api_time(first.get("end_time"))
+    desc = f"first={first.get('start_time')} boundary={boundary.isoformat()}"
+
+    if start is None:
+        return "fresh", desc
+    if start >= boundary or (end is not None and start <= now < end):
+        return "fresh", desc
+    return "stale", desc
+
+
+def poll_until_fresh(label, get, check):
+    """
+    get() で取得 → check(結果) が fresh を返したらすぐ返す。
+    stale/short の間は FETCH_POLL_INITIAL_SEC から倍々（上限 FETCH_POLL_MAX_SEC）で待って取り直し、
+    FETCH_POLL_BUDGET_SEC を使い切ったら最後の結果を返す。毎回の判定をログに出す。
+    """
+    deadline = time.monotonic() + FETCH_POLL_BUDGET_SEC
+    delay = FETCH_POLL_INITIAL_SEC
+    poll = 0
+
+    while True:
+        poll += 1
+        value = get()
+        state, desc = check(value)
+
+        if state == "fresh":
+            print(f"[DEBUG] poll#{poll} {label} fresh {desc}")
+            return value
+
+        left = deadline - time.monotonic()
+        if left <= 0:
+            print(f"[WARN] poll#{poll} {label} {state} {desc} → 待ち時間切れ（このまま使う）")
+            return value
+
+        wait = min(delay, FETCH_POLL_MAX_SEC, left)
+        print(f"[WARN] poll#{poll} {label} {state} {desc} → {wait:.2f}s 後に再取得")
+        time.sleep(wait)
+        delay *= 2
+
+
+# ==========================
+# ★ API 共通（最新版を拾いやすい強化版）
+# ==========================
+def _fetch_schedule_uncached(url: str):
     """
     schedule API を取得して results(list) を返す。
     ★重要：境界直後(例: 03:00)にCDNキャッシュで古いスケジュールを掴むことがあるため、
-            常に cache-bust を付けて取得する。
+            常に cache-bust を付けて取得し、先頭の枠が古い間だけ取り直す。
     """
     try:
-        headers = {
-            "User-Agent": "Spla3StageBot/1.0",
-            # ★CDN/プロキシ/ブラウザキャッシュ回避を強めに
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0",
-        }
+        headers = API_HEADERS
 
-        def _get(u: str):
+        def _get():
             # ★常に cache-bust（Cloudflare等のキャッシュ回避）
             params = {"_": int(time.time() * 1000)}
-            resp = session.get(u, headers=headers, params=params, timeout=10)
+            resp = http_get(url, headers=headers, params=params, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             return data.get("results", []) or []
 
-        # 1回目
-        results = _get(url)
-
-        # ★境界直後の更新取りこぼし対策：短い間隔で2回目を打って新しい方を採用
-        #   （結果件数は変わらなくても中身が更新されているケースがある）
-        time.sleep(0.2)
-        results2 = _get(url)
-
-        # 2回目が取れていれば優先（基本は上書き）
-        if isinstance(results2, list) and len(results2) >= len(results):
-            results = results2
-
-        # 念のため：空や短すぎる場合だけ追加リトライ
-        if len(results) < 5:
-            print(f"[WARN] {url} results={len(results)} (<5). retry...")
-            for retry in range(3):
-                time.sleep(0.3)
-                results_retry = _get(url)
-                print(f"[DEBUG] retry#{retry+1} {url} results={len(results_retry)}")
-                if len(results_retry) >= 5:
-                    results = results_retry
-                    break
-
+        results = poll_until_fresh(url, _get, lambda r: results_freshness(r, MIN_SCHEDULE_RESULTS))
         print(f"[DEBUG] {url} final results={len(results)}")
         return results
 
@@ -635,28 +1265,27 @@ def fetch_schedule(url: str):
         return []
 
 
-def fetch_now(url: str):
+def _fetch_now_uncached(url: str):
     """
     now API を取得して now枠(dict) を返す。
-    ★重要：nowも念のため cache-bust + no-store で取得する。
+    ★重要：nowも念のため cache-bust + no-store で取得し、古い枠の間だけ取り直す。
     """
     try:
         print(f"[DEBUG] Fetching now: {url}")
-        headers = {
-            "User-Agent": "Spla3StageBot/1.0",
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0",
-        }
-        params = {"_": int(time.time() * 1000)}  # ★cache-bust
+        headers = API_HEADERS
 
-        resp = session.get(url, headers=headers, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        results = data.get("results")
-        if not results:
-            return {}
-        return results[0] if isinstance(results, list) else results
+        def _get():
+            params = {"_": int(time.time() * 1000)}  # ★cache-bust
+            resp = http_get(url, headers=headers, params=params, timeout=10)
+            resp.raise_for_status()
+            data = resp.json()
+            results = data.get("results")
+            if not results:
+                return []
+            return results if isinstance(results, list) else [results]
+
+        results = poll_until_fresh(url, _get, results_freshness)
+        return results[0] if results else {}
 
     except Exception as e:
         print(f"[ERR] fetch_now failed for {url}: {e}")
@@ -665,6 +1294,95 @@ def fetch_now(url: str):
         return {}
 
 
+# ==========================
+# ★ 高速化:全エンドポイントの並列プリフェッチ
+# ==========================
+def prefetch_all(schedule_keys=None, now_keys=None, backend=None):
+    """
+    API_URLS / API_NOW_URLS をスレッドプールで同時に取得し、
+    {"schedule": {key: results}, "now": {key: now_item}} を返す。
+    描画前に全部そろえておくことで、待ち時間が「往復の合計」から「最も遅い1本」になる。
+    backend="aggregate" のときは統合スケジュール1本で済ませ、取れなかったモードだけ個別取得する。
+    取得失敗時は fetch_schedule / fetch_now と同じく [] / {} が入る。
+    """
+    schedule_keys = list(API_URLS) if schedule_keys is None else list(schedule_keys)
+    now_keys = list(API_NOW_URLS) if now_keys is None else list(now_keys)
+    backend = backend or FETCH_BACKEND
+
+    if backend == "aggregate":
+        agg_keys = [k for k in schedule_keys if k in API_ALL_KEYS.values()]
+    else:
+        agg_keys = []
+
+    jobs = len(schedule_keys) - len(agg_keys) + len(now_keys) + (1 if agg_keys else 0)
+    if jobs == 0:
+        return {"schedule": {}, "now": {}}
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, jobs), thread_name_prefix="fetch") as ex:
+        all_future = ex.submit(fetch_all_schedules) if agg_keys else None
+        sched_futures = {k: ex.submit(fetch_schedule, API_URLS[k]) for k in schedule_keys if k not in agg_keys}
+        now_futures = {k: ex.submit(fetch_now, API_NOW_URLS[k]) for k in now_keys}
+
+        schedule = {}
+        if all_future is not None:
+            split = all_future.result()
+            for k in agg_keys:
+                if k in split:
+                    schedule[k] = split[k]
+                else:
+                    print(f"[WARN] 統合スケジュールに {k} が無いため個別取得にフォールバック")
+                    sched_futures[k] = ex.submit(fetch_schedule, API_URLS[k])
+
+        schedule.update({k: f.result() for k, f in sched_futures.items()})
+
+        fetched = {
+            "schedule": {k: schedule[k] for k in schedule_keys},
+            "now": {k: f.result() for k, f in now_futures.items()},
+        }
+
+    print(f"[INFO] prefetch_all({backend}): {jobs} requests in {time.perf_counter() - t0:.2f}s")
+    return fetched
+
+
+def _fetch_all_uncached():
+    """
+    統合スケジュール API を取得して、モードごとの results(list) に分割する。
+    中身の形は各モードの schedule API の results と同じなので、描画側はそのまま使える。
+    取れなかったモードは含めない（呼び出し側で per-mode にフォールバックする）。
+    """
+    try:
+        def _get():
+            params = {"_": int(time.time() * 1000)}  # ★cache-bust
+            resp = http_get(API_ALL_URL, headers=API_HEADERS, params=params, timeout=10)
+            resp.raise_for_status()
+            data = resp.json().get("result") or {}
+
+            split = {}
+            for src_key, mode in API_ALL_KEYS.items():
+                results = data.get(src_key)
+                if isinstance(results, list) and results:
+                    split[mode] = results
+            return split
+
+        def _check(split):
+            # 基準になる regular の先頭枠で判定（全モード同時に更新される）
+            if "regular" not in split:
+                return "short", f"modes={sorted(split)}"
+            return results_freshness(split["regular"], MIN_SCHEDULE_RESULTS)
+
+        split = poll_until_fresh(API_ALL_URL, _get, _check)
+
+        print(f"[DEBUG] {API_ALL_URL} modes={sorted(split)}")
+        return split
+
+    except Exception as e:
+        print(f"[ERR] fetch_all_schedules failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return {}
+
+
 def build_timeline_from_regular(regular_results):
     """
     regular の now〜next4 の (start_time, end_time) を基準タイムラインとして返す
@@ -718,209 +1436,529 @@ def normalize_to_now(results: list, now_item: dict) -> list:
 
 
 # ==========================
-# ★ バトル（regular / open / challenge / xmatch）
+# ★ ローテーション境界（バトルは JST の奇数時に切り替わる）
 # ==========================
-def render_versus_mode(base, mode, results, fest_slots=None):
-    print(f"[DEBUG] render_versus_mode: mode={mode}, results count={len(results) if results else 0}")
+JST = datetime.timezone(datetime.timedelta(hours=9))
+ROTATION_HOURS = 2
+SCHEDULE_NOW = os.getenv("SCHEDULE_NOW", "")  # 「今」を固定する（ISO8601。再現・計測用）
 
-    if not results:
-        print(f"[WARN] {mode} has no results")
-        return
 
-    coords_mode = COORDS_TABLE[mode]
-    draw = ImageDraw.Draw(base)
+def now_jst():
+    """
+    現在時刻（JST）。SCHEDULE_NOW があればその時刻、カセット再生中は記録した時刻に固定する。
+    """
+    if SCHEDULE_NOW:
+        return datetime.datetime.fromisoformat(SCHEDULE_NOW.replace("Z", "+00:00")).astimezone(JST)
+    if getattr(session, "mode", "") == "replay" and session.recorded_at is not None:
+        return session.recorded_at.astimezone(JST)
+    return datetime.datetime.now(JST)
 
-    for idx, slot in enumerate(["now", "next", "next2", "next3", "next4"]):
-        if slot not in coords_mode or idx >= len(results):
-            continue
 
-        info  = results[idx] or {}
-        cslot = coords_mode[slot]
+def current_rotation_boundary(now=None):
+    """
+    now（省略時は現在時刻）が属するローテーションの開始時刻（JST の奇数時ちょうど）
+    """
+    now = (now or now_jst()).astimezone(JST)
+    hour = now.hour - ((now.hour - 1) % ROTATION_HOURS)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(hours=hour)
 
-        # ★スロット別フェス判定（open/challengeだけ fest_slots を渡す運用）
-        is_fest_slot = bool(fest_slots and fest_slots.get(slot, False))
 
-        # 背景色決定（フェス枠だけ FEST_TEXT_BG を使う）
-        if is_fest_slot and mode in FEST_TEXT_BG:
-            bg_color = FEST_TEXT_BG[mode]
-        else:
-            bg_color = MODE_COLORS[mode]
-
-        # フォント
-        font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
-        font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
-
-        # 時刻表示
-        if "start_time" in cslot and info.get("start_time") and info.get("end_time"):
-            start = datetime.datetime.fromisoformat(info["start_time"].replace("Z", "+00:00"))
-            end   = datetime.datetime.fromisoformat(info["end_time"].replace("Z", "+00:00"))
-            time_text = f"{start.strftime('%H:%M')}~{end.strftime('%H:%M')}"
-            draw_text_with_bg(draw, cslot["start_time"], time_text, font_time, bg_fill=bg_color)
-
-        # ステージ描画（ここを「常にRGBA+mask貼り」に統一）
-        stages = info.get("stages") or []
-        for i in (0, 1):
-            if i >= len(stages):
-                continue
-            stg = stages[i] or {}
+def next_rotation_boundary(now=None):
+    return current_rotation_boundary(now) + datetime.timedelta(hours=ROTATION_HOURS)
 
-            if f"stage{i}_image" in cslot and stg.get("image"):
-                ix, iy, iw, ih = cslot[f"stage{i}_image"]
-                try:
-                    img = fetch_image_rgba(stg["image"]).resize((int(iw), int(ih)))
-                    base.paste(img, (int(ix), int(iy)), img)  # ★mask付き
-                except Exception as e:
-                    print(f"[WARN] stage image paste failed mode={mode} slot={slot} i={i}: {e}")
 
-            if f"stage{i}_name" in cslot and stg.get("name"):
-                draw_text_with_bg(draw, cslot[f"stage{i}_name"], stg["name"], font_stage, bg_fill=bg_color)
+# ==========================
+# ★ 描画範囲の記録（差分描画用）
+# ==========================
+_DRAW_TRACK = threading.local()
 
-        # ルールアイコン
-        rule_key = (info.get("rule") or {}).get("key")
-        draw_rule_icon(base, mode, slot, rule_key)
 
-def render_tricolor_in_xmatch(base, fest_results):
+class DrawTracker:
     """
-    フェスAPIの results を使って、トリカラ枠だけ Xマッチ欄(coords_xmatch)に描画
+    with DrawTracker() as t: の中で貼られた範囲の外接矩形を t.bbox に集める（スレッドごと）
+    ステージ/ブキ画像の取得・貼り付けに失敗した回数も t.asset_errors に数える（外側の tracker にも足す）
     """
-    if not fest_results:
-        print("[WARN] fest_results is empty (tricolor)")
-        return
 
-    coords_mode = COORDS_TABLE["xmatch"]
-    draw = ImageDraw.Draw(base)
+    def __init__(self):
+        self.bbox = None
+        self.asset_errors = 0
 
-    for idx, slot in enumerate(["now", "next", "next2", "next3", "next4"]):
-        if slot not in coords_mode or idx >= len(fest_results):
-            continue
+    def add(self, box):
+        x0, y0, x1, y1 = box
+        if self.bbox is None:
+            self.bbox = [x0, y0, x1, y1]
+        else:
+            b = self.bbox
+            b[0], b[1], b[2], b[3] = min(b[0], x0), min(b[1], y0), max(b[2], x1), max(b[3], y1)
 
-        info = fest_results[idx] or {}
-        if not info.get("is_tricolor"):
-            continue
+    def __enter__(self):
+        self._prev = getattr(_DRAW_TRACK, "tracker", None)
+        _DRAW_TRACK.tracker = self
+        return self
 
-        tri_stages = info.get("tricolor_stages") or []
-        if not tri_stages:
-            continue
+    def __exit__(self, *exc):
+        _DRAW_TRACK.tracker = self._prev
+        if self._prev is not None:
+            self._prev.asset_errors += self.asset_errors
+        return False
 
-        cslot = coords_mode[slot]
-        bg_color = FEST_TEXT_BG["xmatch"]
 
-        font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
-        font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
+def _track_box(box):
+    tracker = getattr(_DRAW_TRACK, "tracker", None)
+    if tracker is not None:
+        tracker.add(box)
 
-        if "start_time" in cslot and info.get("start_time") and info.get("end_time"):
-            start = datetime.datetime.fromisoformat(info["start_time"].replace("Z", "+00:00"))
-            end   = datetime.datetime.fromisoformat(info["end_time"].replace("Z", "+00:00"))
-            time_text = f"{start.strftime('%H:%M')}~{end.strftime('%H:%M')}"
-            draw_text_with_bg(draw, cslot["start_time"], time_text, font_time, bg_fill=bg_color)
 
-        for i in (0, 1):
-            if i >= len(tri_stages):
-                continue
-            stg = tri_stages[i] or {}
+def _track_asset_error():
+    """
+    画像が欠けたまま描いた（WARN で続行した）ことを記録する。
+    その枠は差分描画の状態や描画キャッシュに「描けた」として残さない。
+    """
+    tracker = getattr(_DRAW_TRACK, "tracker", None)
+    if tracker is not None:
+        tracker.asset_errors += 1
 
-            if f"stage{i}_image" in cslot and stg.get("image"):
-                ix, iy, iw, ih = cslot[f"stage{i}_image"]
-                try:
-                    img = fetch_image_rgba(stg["image"]).resize((int(iw), int(ih)))
-                    base.paste(img, (int(ix), int(iy)), img)  # ★mask付き
-                except Exception as e:
-                    print(f"[WARN] tricolor stage image failed slot={slot} i={i}: {e}")
 
-            if f"stage{i}_name" in cslot and stg.get("name"):
-                draw_text_with_bg(draw, cslot[f"stage{i}_name"], stg["name"], font_stage, bg_fill=bg_color)
+def note_asset_errors(plan, uid, tracker):
+    """
+    描画単位 uid の画像欠けの数を plan["asset_errors"] に残す（描き直したら上書き）
+    """
+    plan["asset_errors"][uid] = tracker.asset_errors
+
+
+def asset_error_count(plan):
+    return sum((plan or {}).get("asset_errors", {}).values())
+
+
+def paste_sprite(base, img, xy):
+    """
+    RGBA 画像を自身の alpha をマスクにして貼る（★mask付き）
+    """
+    with run_metrics.span("composite"):
+        base.paste(img, xy, img)
+    _track_box((xy[0], xy[1], xy[0] + img.size[0], xy[1] + img.size[1]))
+
 
 # ==========================
-# ★ サーモンラン
+# ★ バトル（regular / open / challenge / xmatch）
 # ==========================
-def render_salmon_mode(base, results):
-    print(f"[DEBUG] render_salmon_mode: results count={len(results) if results else 0}")
+SLOTS = ["now", "next", "next2", "next3", "next4"]
 
-    if not results:
-        print("[WARN] salmon has no results")
+
+def render_versus_slot(base, draw, mode, slot, info, fest_slots=None):
+    coords_mode = COORDS_TABLE[mode]
+    if slot not in coords_mode:
         return
 
-    coords_mode = COORDS_TABLE["salmon"]
-    draw = ImageDraw.Draw(base)
-    color = MODE_COLORS["salmon"]
-    # ★追加：武器Tier辞書をロード（1回だけ）
-    weapon_rank_dict = load_weapon_rank()
+    info  = info or {}
+    cslot = coords_mode[slot]
 
+    # ★スロット別フェス判定（open/challengeだけ fest_slots を渡す運用）
+    is_fest_slot = bool(fest_slots and fest_slots.get(slot, False))
 
-    for idx, slot in enumerate(["now", "next", "next2", "next3", "next4"]):
-        if slot not in coords_mode or idx >= len(results):
+    # 背景色決定（フェス枠だけ FEST_TEXT_BG を使う）
+    if is_fest_slot and mode in FEST_TEXT_BG:
+        bg_color = FEST_TEXT_BG[mode]
+    else:
+        bg_color = MODE_COLORS[mode]
+
+    # フォント
+    font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
+    font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
+
+    # 時刻表示
+    if "start_time" in cslot and info.get("start_time") and info.get("end_time"):
+        start = datetime.datetime.fromisoformat(info["start_time"].replace("Z", "+00:00"))
+        end   = datetime.datetime.fromisoformat(info["end_time"].replace("Z", "+00:00"))
+        time_text = f"{start.strftime('%H:%M')}~{end.strftime('%H:%M')}"
+        draw_text_with_bg(draw, cslot["start_time"], time_text, font_time, bg_fill=bg_color, base=base)
+
+    # ステージ描画（ここを「常にRGBA+mask貼り」に統一）
+    stages = info.get("stages") or []
+    for i in (0, 1):
+        if i >= len(stages):
             continue
+        stg = stages[i] or {}
 
-        info = results[idx] or {}
-        cslot = coords_mode[slot]
+        if f"stage{i}_image" in cslot and stg.get("image"):
+            ix, iy, iw, ih = cslot[f"stage{i}_image"]
+            try:
+                img = load_sprite(stg["image"], (int(iw), int(ih)))
+                paste_sprite(base, img, (int(ix), int(iy)))
+            except Exception as e:
+                print(f"[WARN] stage image paste failed mode={mode} slot={slot} i={i}: {e}")
+                _track_asset_error()
 
-        boss_id = (info.get("boss") or {}).get("id")
-        is_big_run = bool(info.get("is_big_run", False))
+        if f"stage{i}_name" in cslot and stg.get("name"):
+            draw_text_with_bg(draw, cslot[f"stage{i}_name"], stg["name"], font_stage, bg_fill=bg_color, base=base)
 
-        if info.get("start_time") and info.get("end_time"):
-            start_label = format_salmon_datetime(info["start_time"])
-            end_label   = "~" + format_salmon_datetime(info["end_time"])
-        else:
-            start_label = ""
-            end_label = ""
+    # ルールアイコン
+    rule_key = (info.get("rule") or {}).get("key")
+    draw_rule_icon(base, mode, slot, rule_key)
 
-        font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
-        font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
 
-        if "start_time" in cslot and start_label:
-            draw_text_left(draw, cslot["start_time"], start_label, font_time, bg_fill=color)
+def render_versus_mode(base, mode, results, fest_slots=None):
+    print(f"[DEBUG] render_versus_mode: mode={mode}, results count={len(results) if results else 0}")
+
+    if not results:
+        print(f"[WARN] {mode} has no results")
+        return
 
-        if "end_time" in cslot and end_label:
-            draw_text_left(draw, cslot["end_time"], end_label, font_time, bg_fill=color)
+    draw = ImageDraw.Draw(base)
 
-        stage = info.get("stage") or {}
-        if stage:
-            if "stage_image" in cslot and stage.get("image"):
-                ix, iy, iw, ih = cslot["stage_image"]
-                try:
-                    img = fetch_image_rgba(stage["image"]).resize((int(iw), int(ih)))
-                    base.paste(img, (int(ix), int(iy)), img)  # ★mask付き
-                except Exception as e:
-                    print(f"[WARN] salmon stage image paste failed slot={slot}: {e}")
-
-            if "stage_name" in cslot and stage.get("name"):
-                draw_text_with_bg(draw, cslot["stage_name"], stage["name"], font_stage, bg_fill=color)
-
-        draw_salmon_weapons(base, slot, info.get("weapons", []) or [])
-        # ★難易度評価→描画（追加）
-        weapons_list = info.get("weapons", []) or []
-        weapon_names = [w.get("name", "").strip() for w in weapons_list][:4]
-        rank = evaluate_salmon_rank(weapon_names, weapon_rank_dict)
-
-        if slot in SALMON_DIFFICULTY_COORDS:
-            x, y, w, h = SALMON_DIFFICULTY_COORDS[slot]
-            font_diff = FONT_SALMON_RANK_NOW if slot == "now" else FONT_SALMON_RANK_NEXT
-            # rank だけ表示（①の要望）
-            draw_text_with_bg(
-                draw,
-                (x, y, w, h),
-                rank,
-                font_diff,
-                bg_fill=SALMON_DIFFICULTY_COLOR,
-                text_fill=(0, 0, 0),
-                padding=2
-            )
+    for idx, slot in enumerate(SLOTS):
+        if idx >= len(results):
+            continue
+        render_versus_slot(base, draw, mode, slot, results[idx], fest_slots=fest_slots)
 
-        draw_boss_icon(base, slot, boss_id)
-        draw_big_run(base, slot, is_big_run)
 
-# ==========================
-# ★ 指定位置に貼る（RGBA合成）
-# ==========================
-def paste_overlay_rect(base: Image.Image, overlay_path: str, x: int, y: int, w: int, h: int):
-    if not os.path.exists(overlay_path):
-        print(f"[WARN] overlay not found: {overlay_path}")
+def render_tricolor_slot(base, draw, slot, info):
+    coords_mode = COORDS_TABLE["xmatch"]
+    if slot not in coords_mode:
         return
-    try:
-        ov = Image.open(overlay_path).convert("RGBA").resize((int(w), int(h)))
-        base.paste(ov, (int(x), int(y)), ov)
-    except Exception as e:
-        print(f"[WARN] overlay paste failed: {overlay_path} err={e}")
+
+    info = info or {}
+    if not info.get("is_tricolor"):
+        return
+
+    tri_stages = info.get("tricolor_stages") or []
+    if not tri_stages:
+        return
+
+    cslot = coords_mode[slot]
+    bg_color = FEST_TEXT_BG["xmatch"]
+
+    font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
+    font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
+
+    if "start_time" in cslot and info.get("start_time") and info.get("end_time"):
+        start = datetime.datetime.fromisoformat(info["start_time"].replace("Z", "+00:00"))
+        end   = datetime.datetime.fromisoformat(info["end_time"].replace("Z", "+00:00"))
+        time_text = f"{start.strftime('%H:%M')}~{end.strftime('%H:%M')}"
+        draw_text_with_bg(draw, cslot["start_time"], time_text, font_time, bg_fill=bg_color, base=base)
+
+    for i in (0, 1):
+        if i >= len(tri_stages):
+            continue
+        stg = tri_stages[i] or {}
+
+        if f"stage{i}_image" in cslot and stg.get("image"):
+            ix, iy, iw, ih = cslot[f"stage{i}_image"]
+            try:
+                img = load_sprite(stg["image"], (int(iw), int(ih)))
+                paste_sprite(base, img, (int(ix), int(iy)))
+            except Exception as e:
+                print(f"[WARN] tricolor stage image failed slot={slot} i={i}: {e}")
+                _track_asset_error()
+
+        if f"stage{i}_name" in cslot and stg.get("name"):
+            draw_text_with_bg(draw, cslot[f"stage{i}_name"], stg["name"], font_stage, bg_fill=bg_color, base=base)
+
+
+def render_tricolor_in_xmatch(base, fest_results):
+    """
+    フェスAPIの results を使って、トリカラ枠だけ Xマッチ欄(coords_xmatch)に描画
+    """
+    if not fest_results:
+        print("[WARN] fest_results is empty (tricolor)")
+        return
+
+    draw = ImageDraw.Draw(base)
+
+    for idx, slot in enumerate(SLOTS):
+        if idx >= len(fest_results):
+            continue
+        render_tricolor_slot(base, draw, slot, fest_results[idx])
+
+# ==========================
+# ★ サーモンラン
+# ==========================
+def render_salmon_slot(base, draw, slot, info, weapon_rank_dict):
+    coords_mode = COORDS_TABLE["salmon"]
+    if slot not in coords_mode:
+        return
+
+    info = info or {}
+    cslot = coords_mode[slot]
+    color = MODE_COLORS["salmon"]
+
+    boss_id = (info.get("boss") or {}).get("id")
+    is_big_run = bool(info.get("is_big_run", False))
+
+    if info.get("start_time") and info.get("end_time"):
+        start_label = format_salmon_datetime(info["start_time"])
+        end_label   = "~" + format_salmon_datetime(info["end_time"])
+    else:
+        start_label = ""
+        end_label = ""
+
+    font_time  = FONT_TIME_NOW if slot == "now" else FONT_TIME_SMALL
+    font_stage = FONT_STAGE_NOW if slot == "now" else FONT_STAGE_SMALL
+
+    if "start_time" in cslot and start_label:
+        draw_text_left(draw, cslot["start_time"], start_label, font_time, bg_fill=color, base=base)
+
+    if "end_time" in cslot and end_label:
+        draw_text_left(draw, cslot["end_time"], end_label, font_time, bg_fill=color, base=base)
+
+    stage = info.get("stage") or {}
+    if stage:
+        if "stage_image" in cslot and stage.get("image"):
+            ix, iy, iw, ih = cslot["stage_image"]
+            try:
+                img = load_sprite(stage["image"], (int(iw), int(ih)))
+                paste_sprite(base, img, (int(ix), int(iy)))
+            except Exception as e:
+                print(f"[WARN] salmon stage image paste failed slot={slot}: {e}")
+                _track_asset_error()
+
+        if "stage_name" in cslot and stage.get("name"):
+            draw_text_with_bg(draw, cslot["stage_name"], stage["name"], font_stage, bg_fill=color, base=base)
+
+    draw_salmon_weapons(base, slot, info.get("weapons", []) or [])
+    # ★難易度評価→描画（追加）
+    weapons_list = info.get("weapons", []) or []
+    weapon_names = [w.get("name", "").strip() for w in weapons_list][:4]
+    rank = evaluate_salmon_rank(weapon_names, weapon_rank_dict)
+
+    if slot in SALMON_DIFFICULTY_COORDS:
+        x, y, w, h = SALMON_DIFFICULTY_COORDS[slot]
+        font_diff = FONT_SALMON_RANK_NOW if slot == "now" else FONT_SALMON_RANK_NEXT
+        # rank だけ表示（①の要望）
+        draw_text_with_bg(
+            draw,
+            (x, y, w, h),
+            rank,
+            font_diff,
+            bg_fill=SALMON_DIFFICULTY_COLOR,
+            text_fill=(0, 0, 0),
+            padding=2,
+            base=base,
+        )
+
+    draw_boss_icon(base, slot, boss_id)
+    draw_big_run(base, slot, is_big_run)
+
+
+def render_salmon_mode(base, results, weapon_rank_dict=None):
+    print(f"[DEBUG] render_salmon_mode: results count={len(results) if results else 0}")
+
+    if not results:
+        print("[WARN] salmon has no results")
+        return
+
+    draw = ImageDraw.Draw(base)
+    # ★追加：武器Tier辞書をロード（1回だけ）
+    if weapon_rank_dict is None:
+        weapon_rank_dict = load_weapon_rank()
+
+    for idx, slot in enumerate(SLOTS):
+        if idx >= len(results):
+            continue
+        render_salmon_slot(base, draw, slot, results[idx], weapon_rank_dict)
+
+# ==========================
+# ★ 高速化:アイコンレジストリ（デコード＆リサイズは1プロセス1回）
+# ==========================
+FEST_OVERLAY_RECTS = {
+    "now":   (20, 10, 920, 310),
+    "next":  (20, 318, 920, 84),
+    "next2": (20, 398, 920, 84),
+    "next3": (20, 478, 920, 84),
+    "next4": (20, 558, 920, 84),
+}
+
+
+def _icon_slot_sizes(name):
+    """
+    icon/ の画像 name が貼られるサイズ一覧（BIG RUN / オカシラ / ルールで別々。他の種類のサイズは作らない）
+    """
+    if name == BIG_RUN_ICON:
+        rects = BIG_RUN_COORDS.values()
+    elif name.startswith(BOSS_ICON_PREFIX):
+        rects = [(0, 0, w, h) for (w, h) in BOSS_SIZES.values()]
+    else:
+        rects = [rect for mode_coords in RULE_ICON_COORDS.values() for rect in mode_coords.values()]
+    return sorted({(int(w), int(h)) for (_, _, w, h) in rects})
+
+
+def _fest_overlay_sizes(name):
+    """
+    fest/ のオーバーレイ name が貼られるサイズ一覧（now 用は now 枠、next 用は next〜next4 枠）
+    """
+    if name == os.path.basename(FEST_NOW_OVERLAY):
+        rects = [FEST_OVERLAY_RECTS["now"]]
+    elif name == os.path.basename(FEST_NEXT_OVERLAY):
+        rects = [rect for slot, rect in FEST_OVERLAY_RECTS.items() if slot != "now"]
+    else:
+        rects = []
+    return sorted({(int(w), int(h)) for (_, _, w, h) in rects})
+
+
+class IconRegistry:
+    """
+    ローカル素材（icon/ と fest/）を最初の利用時に1回だけデコードし、
+    描画で使うサイズにリサイズ済みの RGBA スプライトとして保持する。
+    asset pack があれば、そこからデコード無しでスプライトを取る。
+    get() が返す画像は共有なので、呼び出し側は貼り付けに使うだけにすること。
+    """
+
+    def __init__(self, dir_sizes):
+        # dir_sizes: {ディレクトリ: ファイル名から、その画像を事前に作っておくサイズ一覧を返す関数}
+        self.dir_sizes = dir_sizes
+        self._paths = set()
+        self._sources = {}
+        self._sprites = {}
+        self._pack = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def list_files(self):
+        """
+        レジストリ対象の (パス, 事前生成サイズ一覧) を返す（asset pack のビルドでも使う）
+        """
+        files = []
+        for d, sizes_fn in self.dir_sizes.items():
+            if not os.path.isdir(d):
+                continue
+            for name in sorted(os.listdir(d)):
+                if name.lower().endswith(".png"):
+                    files.append((os.path.normpath(os.path.join(d, name)), sizes_fn(name)))
+        return files
+
+    def attach_pack(self, pack):
+        with self._lock:
+            self._pack = pack
+            self._paths.clear()
+            self._sources.clear()
+            self._sprites.clear()
+            self._loaded = False
+
+    def _source(self, path):
+        src = self._sources.get(path)
+        if src is None:
+            with run_metrics.span("decode", path=path):
+                src = Image.open(path).convert("RGBA")
+            self._sources[path] = src
+        return src
+
+    def _load(self):
+        for path, sizes in self.list_files():
+            self._paths.add(path)
+            for size in sizes:
+                name = asset_pack.sprite_key(path, size)
+                if self._pack is not None and name in self._pack:
+                    self._sprites[(path, size)] = self._pack.image(name)
+                    continue
+                try:
+                    src = self._source(path)
+                    with run_metrics.span("resize"):
+                        self._sprites[(path, size)] = src.resize(size)
+                except Exception as e:
+                    print(f"[WARN] icon load failed: {path} err={e}")
+                    self._paths.discard(path)
+                    break
+        self._loaded = True
+        print(f"[INFO] icon registry: {len(self._paths)} files, {len(self._sprites)} sprites, "
+              f"decoded={len(self._sources)}")
+
+    def get(self, path: str, size):
+        """
+        path の画像を size(w, h) にしたスプライトを返す。ファイルが無ければ None。
+        事前に作っていないサイズはここで作ってキャッシュする。
+        """
+        key = (os.path.normpath(path), (int(size[0]), int(size[1])))
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+            sprite = self._sprites.get(key)
+            if sprite is None:
+                if key[0] not in self._paths:
+                    return None
+                src = self._source(key[0])
+                with run_metrics.span("resize"):
+                    sprite = src.resize(key[1])
+                self._sprites[key] = sprite
+            return sprite
+
+
+ICON_REGISTRY = IconRegistry({
+    ICON_DIR: _icon_slot_sizes,
+    os.path.dirname(FEST_NOW_OVERLAY): _fest_overlay_sizes,
+})
+
+
+# ==========================
+# ★ 高速化:asset pack（テンプレート＋アイコンを生RGBAで mmap）
+# ==========================
+ASSET_PACK = None
+
+
+def asset_pack_spec():
+    """
+    asset pack に入れるもの：テンプレート（元サイズ）と、アイコン/フェスオーバーレイの各スロットサイズ
+    """
+    spec = {"template": (TEMPLATE_PATH, None)}
+    for path, sizes in ICON_REGISTRY.list_files():
+        for size in sizes:
+            spec[asset_pack.sprite_key(path, size)] = (path, size)
+    return spec
+
+
+def init_asset_pack(pack_path=None):
+    """
+    asset pack を開いて（古ければ作り直して）アイコンレジストリにつなぐ。
+    失敗しても PNG デコードで描画できるので WARN だけ出して続行する。
+    """
+    global ASSET_PACK
+
+    pack_path = asset_pack.ASSET_PACK_PATH if pack_path is None else pack_path
+    if not pack_path:
+        return None
+    if ASSET_PACK is not None and ASSET_PACK.path == pack_path:
+        return ASSET_PACK
+
+    try:
+        ASSET_PACK = asset_pack.ensure_pack(pack_path, asset_pack_spec())
+        ICON_REGISTRY.attach_pack(ASSET_PACK)
+        print(f"[INFO] asset pack: {pack_path} version={ASSET_PACK.version}")
+    except Exception as e:
+        print(f"[WARN] asset pack unavailable, decode PNGs instead: {e}")
+        ASSET_PACK = None
+    return ASSET_PACK
+
+
+def template_size():
+    if ASSET_PACK is not None and "template" in ASSET_PACK:
+        return tuple(ASSET_PACK.entries["template"]["size"])
+    with Image.open(TEMPLATE_PATH) as im:
+        return im.size
+
+
+def load_template_rgba() -> Image.Image:
+    """
+    ベーステンプレートを RGBA で返す（描画先なので毎回書き換え可能なコピー）
+    """
+    if ASSET_PACK is not None and "template" in ASSET_PACK:
+        return ASSET_PACK.image("template").copy()
+    # ★重要：ベースもRGBAに（合成のズレ/消えを防ぐ）
+    with run_metrics.span("decode", path=TEMPLATE_PATH):
+        return Image.open(TEMPLATE_PATH).convert("RGBA")
+
+
+# ==========================
+# ★ 指定位置に貼る（RGBA合成）
+# ==========================
+def paste_overlay_rect(base: Image.Image, overlay_path: str, x: int, y: int, w: int, h: int):
+    try:
+        ov = ICON_REGISTRY.get(overlay_path, (int(w), int(h)))
+        if ov is None:
+            print(f"[WARN] overlay not found: {overlay_path}")
+            return
+        base.paste(ov, (int(x), int(y)), ov)
+    except Exception as e:
+        print(f"[WARN] overlay paste failed: {overlay_path} err={e}")
 
 # ==========================
 # ★ フェスオーバーレイ適用
@@ -930,153 +1968,701 @@ def apply_fest_overlays(base, fest_slots):
         return
 
     if fest_slots.get("now"):
-        paste_overlay_rect(base, FEST_NOW_OVERLAY, 20, 10, 920, 310)
+        paste_overlay_rect(base, FEST_NOW_OVERLAY, *FEST_OVERLAY_RECTS["now"])
         print(f"[INFO] フェスnowオーバーレイ適用: {FEST_NOW_OVERLAY}")
 
-    next_rects = {
-        "next":  (20, 318, 920, 84),
-        "next2": (20, 398, 920, 84),
-        "next3": (20, 478, 920, 84),
-        "next4": (20, 558, 920, 84),
-    }
-
-    for slot, (x, y, w, h) in next_rects.items():
+    for slot, (x, y, w, h) in FEST_OVERLAY_RECTS.items():
+        if slot == "now":
+            continue
         if fest_slots.get(slot):
             paste_overlay_rect(base, FEST_NEXT_OVERLAY, x, y, w, h)
             print(f"[INFO] フェス{slot}オーバーレイ適用: {FEST_NEXT_OVERLAY}")
 
 # ==========================
-# ★ メイン
+# ★ 高速化:フェス下地キャッシュ（テンプレート＋オーバーレイ合成済み）
 # ==========================
-def main():
-    global OUTPUT_PATH
+FEST_SLOT_ORDER = ["now", "next", "next2", "next3", "next4"]
+FEST_BASE_CACHE_DIR = os.getenv("FEST_BASE_CACHE_DIR", ".cache/fest_base")
 
-    args = parse_args()
-    OUTPUT_PATH = args.output
 
-    out_dir = os.path.dirname(OUTPUT_PATH)
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
+def fest_slot_mask(fest_slots) -> int:
+    """
+    fest_slots を now=bit0 … next4=bit4 のビットマスクにする（0〜31）
+    """
+    mask = 0
+    for i, slot in enumerate(FEST_SLOT_ORDER):
+        if (fest_slots or {}).get(slot):
+            mask |= 1 << i
+    return mask
 
-    if not os.path.exists(TEMPLATE_PATH):
-        print(f"[ERROR] テンプレートが見つかりません: {TEMPLATE_PATH}")
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def base_assets_version() -> str:
+    """
+    下地の元になる素材（テンプレート＋フェスオーバーレイ）のバージョン。
+    asset pack があればその version、無ければファイルの中身から作る（mtime は checkout で変わるので使わない）。
+    """
+    if ASSET_PACK is not None:
+        return ASSET_PACK.version
+
+    h = hashlib.sha256()
+    for path in (TEMPLATE_PATH, FEST_NOW_OVERLAY, FEST_NEXT_OVERLAY):
+        try:
+            h.update(f"{path}:{_file_digest(path)};".encode("utf-8"))
+        except OSError:
+            h.update(f"{path}:missing;".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class FestBaseCache:
+    """
+    フェス枠の組み合わせ（32通り）ごとに、オーバーレイ合成済みの下地をキャッシュする。
+    メモリに持つのに加えて、disk_dir があれば生RGBAでファイルにも保存する（mask=0 は保存しない）。
+    get() は描画先として書き換えてよいコピーを返す。
+    """
+
+    def __init__(self, disk_dir=""):
+        self.disk_dir = disk_dir
+        self._mem = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, version, mask, size):
+        return os.path.join(self.disk_dir, f"{version}_{mask:02d}_{size[0]}x{size[1]}.rgba")
+
+    def _load_disk(self, version, mask, size):
+        if not self.disk_dir or mask == 0:
+            return None
+        path = self._disk_path(version, mask, size)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return Image.frombytes("RGBA", size, f.read())
+        except Exception as e:
+            print(f"[WARN] fest base cache read failed: {path} err={e}")
+            return None
+
+    def _save_disk(self, version, mask, img):
+        if not self.disk_dir or mask == 0:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._disk_path(version, mask, img.size)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                f.write(img.tobytes())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[WARN] fest base cache write failed: {e}")
+
+    def get(self, fest_slots) -> Image.Image:
+        mask = fest_slot_mask(fest_slots)
+        version = base_assets_version()
+        key = (version, mask)
+
+        with self._lock:
+            canvas = self._mem.get(key)
+            if canvas is not None:
+                self.hits += 1
+                return canvas.copy()
+
+        canvas = self._load_disk(version, mask, template_size())
+        if canvas is not None:
+            self.disk_hits += 1
+            print(f"[INFO] フェス下地キャッシュ(disk) mask={mask:05b}")
+        else:
+            self.misses += 1
+            canvas = load_template_rgba()
+            apply_fest_overlays(canvas, fest_slots)
+            self._save_disk(version, mask, canvas)
+
+        with self._lock:
+            self._mem[key] = canvas
+        return canvas.copy()
+
+    def report(self):
+        print(f"[INFO] fest base cache: hits={self.hits} disk_hits={self.disk_hits} misses={self.misses}")
+        return {"hits": self.hits, "diskHits": self.disk_hits, "misses": self.misses}
+
+
+FEST_BASE_CACHE = FestBaseCache(FEST_BASE_CACHE_DIR)
+
+# ==========================
+# ★ 描画プラン（取得結果 → 各モードの5枠）
+# ==========================
+def _has_usable_stages(item):
+    if not isinstance(item, dict):
+        return False
+    stages = item.get("stages")
+    return isinstance(stages, list) and len(stages) > 0
+
+
+def merge_by_fest_slot(normal_results, fest_results, fest_slots_dict):
+    merged = []
+
+    for idx, slot in enumerate(SLOTS):
+        normal_item = normal_results[idx] if idx < len(normal_results) else {}
+        fest_item   = fest_results[idx]   if idx < len(fest_results) else {}
+
+        first = fest_item if fest_slots_dict.get(slot) else normal_item
+        second = normal_item if first is fest_item else fest_item
+
+        if _has_usable_stages(first):
+            picked = first
+        elif _has_usable_stages(second):
+            picked = second
+        else:
+            picked = first or {}
+
+        merged.append(picked)
+
+    return merged
+
+
+def build_render_plan(sched, nows, fest_slots):
+    """
+    取得結果から「どの枠に何を描くか」を決める（描画はしない）。
+    regular の now を起点にタイムラインを作り、open/challenge はフェス枠と通常枠をマージする。
+    """
+    # regular（基準）：★先に now を取って、schedule を now 起点に並び替える
+    regular_results = normalize_to_now(sched["regular"], nows["regular"])
+
+    # ★基準タイムライン（regular の now〜next4 に合わせる）
+    timeline = build_timeline_from_regular(regular_results)
+
+    # open/challenge：取得して「タイムラインに整列」
+    open_normal = align_results_to_timeline(sched["open"], timeline)
+    chal_normal = align_results_to_timeline(sched["challenge"], timeline)
+    open_fest   = align_results_to_timeline(sched["fest_open"], timeline)
+    chal_fest   = align_results_to_timeline(sched["fest_challenge"], timeline)
+
+    return {
+        "fest_slots": fest_slots,
+        "regular": regular_results,
+        "open": merge_by_fest_slot(open_normal, open_fest, fest_slots),
+        "challenge": merge_by_fest_slot(chal_normal, chal_fest, fest_slots),
+        "xmatch": sched["xmatch"],
+        # フェス中は通常Xの上から「トリカラ枠だけ」上書きする
+        "tricolor": sched["fest_open"] if fest_slots.get("now") else None,
+        "salmon": sched["salmon"],
+        "weapon_rank": load_weapon_rank(),
+        # 描画単位 → 画像が欠けた数（描画時に埋める。"*" は描画単位に分けずに描いた分）
+        "asset_errors": {},
+    }
+
+
+def plan_now_items(plan):
+    """
+    JSON 用：実際に描画した各モードの now 枠（= results[0]）
+    """
+    return {
+        "regular": _first_item(plan["regular"]),
+        "open": _first_item(plan["open"]),
+        "challenge": _first_item(plan["challenge"]),
+        "xmatch": _first_item(plan["tricolor"] if plan["tricolor"] is not None else plan["xmatch"]),
+        "salmon": _first_item(plan["salmon"]),
+    }
+
+
+def render_plan(base, plan, workers=1):
+    if workers > 1 and render_plan_parallel(base, plan, workers) is not None:
         return
 
-    print(f"[INFO] ベーステンプレートを使用: {TEMPLATE_PATH}")
-    # ★重要：ベースもRGBAに（合成のズレ/消えを防ぐ）
-    base = Image.open(TEMPLATE_PATH).convert("RGBA")
+    fest_slots = plan["fest_slots"]
 
-    # フェス枠判定→オーバーレイ適用（下地）
-    fest_slots = check_fest_slots()
-    apply_fest_overlays(base, fest_slots)
+    # 並列描画を諦めた場合はその分を数え直す
+    plan["asset_errors"].clear()
+    with DrawTracker() as t:
+        render_versus_mode(base, "regular", plan["regular"], fest_slots=None)
+        render_versus_mode(base, "open", plan["open"], fest_slots=fest_slots)
+        render_versus_mode(base, "challenge", plan["challenge"], fest_slots=fest_slots)
+        render_versus_mode(base, "xmatch", plan["xmatch"], fest_slots=None)
+        if plan["tricolor"] is not None:
+            render_tricolor_in_xmatch(base, plan["tricolor"])
+        render_salmon_mode(base, plan["salmon"], plan["weapon_rank"])
+    note_asset_errors(plan, "*", t)
 
-    try:
-        # regular（基準）：★先に now を取って、schedule を now 起点に並び替える
-        reg_now_for_align = fetch_now(API_NOW_URLS["regular"])
-        regular_results_raw = fetch_schedule(API_URLS["regular"])
-        regular_results = normalize_to_now(regular_results_raw, reg_now_for_align)
 
-        render_versus_mode(base, "regular", regular_results, fest_slots=None)
+# ==========================
+# ★ 列ごとの並列描画
+# ==========================
+#   regular / open / challenge / xmatch(+トリカラ) / salmon の5列は描画範囲が重ならないので、
+#   列ごとに下地のコピーへ別スレッドで描き、描いた範囲だけを固定の順番で base に戻す。
+#   （透明レイヤーに描いて alpha_composite すると合成式が変わって1ピクセル単位で一致しないため、
+#     各列も本番と同じ下地の上に描く）
+#   Pillow の resize / paste / 文字タイル貼りは GIL を離すので、列数ぶん並列に進む。
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+RENDER_COLUMNS = ["regular", "open", "challenge", "xmatch", "salmon"]
+
+
+def _render_column(base, plan, col_units):
+    canvas = base.copy()
+    boxes = {}
+    for uid, mode, slot, info in col_units:
+        with DrawTracker() as t:
+            render_unit(canvas, plan, mode, slot, info)
+        boxes[uid] = t.bbox
+        note_asset_errors(plan, uid, t)
+    return canvas, boxes
+
+
+def render_units_parallel(base, plan, units, workers):
+    """
+    units を列ごとに並列描画して base に書き戻す。描画単位ごとの bbox を返す。
+    列どうしの描画範囲が重なった場合は base を変更せずに None を返す（呼び出し側で逐次描画）。
+    """
+    columns = {col: [] for col in RENDER_COLUMNS}
+    for unit in units:
+        columns[RENDER_UNIT_COORDS.get(unit[1], unit[1])].append(unit)
+    columns = [(col, cu) for col, cu in columns.items() if cu]
 
-        # ★基準タイムライン（regular の now〜next4 に合わせる）
-        timeline = build_timeline_from_regular(regular_results)
+    with ThreadPoolExecutor(max_workers=min(workers, len(columns)) or 1) as ex:
+        results = list(ex.map(lambda item: _render_column(base, plan, item[1]), columns))
 
-        # open/challenge：取得して「タイムラインに整列」
-        open_normal_raw = fetch_schedule(API_URLS["open"])
-        chal_normal_raw = fetch_schedule(API_URLS["challenge"])
+    col_boxes = []
+    for canvas, boxes in results:
+        box = None
+        for b in boxes.values():
+            if b:
+                box = list(b) if box is None else [min(box[0], b[0]), min(box[1], b[1]),
+                                                   max(box[2], b[2]), max(box[3], b[3])]
+        if box:
+            box = [max(box[0], 0), max(box[1], 0), min(box[2], base.size[0]), min(box[3], base.size[1])]
+        col_boxes.append(box)
 
-        open_fest_raw   = fetch_schedule(API_URLS["fest_open"])
-        chal_fest_raw   = fetch_schedule(API_URLS["fest_challenge"])
+    for i in range(len(col_boxes)):
+        for j in range(i + 1, len(col_boxes)):
+            if _boxes_overlap(col_boxes[i], col_boxes[j]):
+                print(f"[WARN] 並列描画: {columns[i][0]} と {columns[j][0]} の描画範囲が重なるため逐次描画")
+                return None
 
-        open_normal = align_results_to_timeline(open_normal_raw, timeline)
-        chal_normal = align_results_to_timeline(chal_normal_raw, timeline)
+    all_boxes = {}
+    for (canvas, boxes), box in zip(results, col_boxes):
+        if box and box[0] < box[2] and box[1] < box[3]:
+            with run_metrics.span("composite"):
+                base.paste(canvas.crop(tuple(box)), (box[0], box[1]))
+        all_boxes.update(boxes)
+    return all_boxes
 
-        open_fest   = align_results_to_timeline(open_fest_raw, timeline)
-        chal_fest   = align_results_to_timeline(chal_fest_raw, timeline)
 
-        # --- ここから下は、あなたの merge ロジックをそのまま使用 ---
-        def _has_usable_stages(item):
-            if not isinstance(item, dict):
-                return False
-            stages = item.get("stages")
-            return isinstance(stages, list) and len(stages) > 0
+def render_plan_parallel(base, plan, workers):
+    return render_units_parallel(base, plan, render_units(plan), workers)
 
-        def merge_by_fest_slot(normal_results, fest_results, fest_slots_dict):
-            merged = []
-            slots = ["now", "next", "next2", "next3", "next4"]
 
-            for idx, slot in enumerate(slots):
-                normal_item = normal_results[idx] if idx < len(normal_results) else {}
-                fest_item   = fest_results[idx]   if idx < len(fest_results) else {}
+def _boxes_overlap(a, b):
+    return bool(a and b) and a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
 
-                first = fest_item if fest_slots_dict.get(slot) else normal_item
-                second = normal_item if first is fest_item else fest_item
 
-                if _has_usable_stages(first):
-                    picked = first
-                elif _has_usable_stages(second):
-                    picked = second
-                else:
-                    picked = first or {}
+# ==========================
+# ★ 差分描画（前回フレームから変わった枠だけ描き直す）
+# ==========================
+#   描画単位 = (モード, 枠)。render_plan と同じ順番（モード順 → 枠順、トリカラは xmatch の後）。
+#   state.json に「単位ごとの入力フィンガープリント」と「実際に描いた範囲(bbox)」、
+#   frame.rgba に前回の完成画像を置いておき、入力が変わった単位の範囲だけ
+#   下地に戻して描き直す。範囲が他の単位と重なる場合は、重なった単位も一緒に描き直す。
+RENDER_UNIT_MODES = ["regular", "open", "challenge", "xmatch", "tricolor", "salmon"]
+RENDER_UNIT_COORDS = {"tricolor": "xmatch"}  # トリカラは Xマッチ欄に描く
+INCREMENTAL_STATE_VERSION = 1
 
-                merged.append(picked)
 
-            return merged
+def render_units(plan):
+    """
+    plan を描画単位に分解する: [(unit_id, mode, slot, info), ...]（描画順）
+    """
+    units = []
+    for mode in RENDER_UNIT_MODES:
+        results = plan.get(mode)
+        if not results:
+            continue
+        for idx, slot in enumerate(SLOTS):
+            if idx >= len(results) or slot not in COORDS_TABLE[RENDER_UNIT_COORDS.get(mode, mode)]:
+                continue
+            units.append((f"{mode}/{slot}", mode, slot, results[idx]))
+    return units
 
-        open_merged = merge_by_fest_slot(open_normal, open_fest, fest_slots)
-        chal_merged = merge_by_fest_slot(chal_normal, chal_fest, fest_slots)
 
-        render_versus_mode(base, "open", open_merged, fest_slots=fest_slots)
-        render_versus_mode(base, "challenge", chal_merged, fest_slots=fest_slots)
+def _unit_fingerprint(plan, mode, slot, info):
+    fest_slots = plan["fest_slots"]
+    key = [mode, slot, info]
+    if mode in ("open", "challenge"):
+        key.append(bool(fest_slots.get(slot)))
+    if mode == "salmon":
+        key.append(plan["weapon_rank"])
+    raw = json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
 
 
-        # xmatch / salmon
-        if fest_slots.get("now"):
-            fest_for_tricolor = fetch_schedule(API_URLS["fest_open"])
-            x_normal = fetch_schedule(API_URLS["xmatch"])
+def _frame_fingerprint(plan, size):
+    """
+    これが変わったら前回フレームは使えない（下地/フォント/描画コード/サイズ）
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([
+        INCREMENTAL_STATE_VERSION,
+        base_assets_version(),
+        fest_slot_mask(plan["fest_slots"]),
+        list(size),
+        Image.__version__,
+        _freetype_version(),
+    ]).encode("utf-8"))
+    # asset pack が無い場合に備えて、アイコン素材の更新も拾う
+    # （mtime は checkout のたびに変わるので中身で見る。pack があれば version に含まれている）
+    if ASSET_PACK is None:
+        for path, _ in ICON_REGISTRY.list_files():
+            try:
+                h.update(f"{path}:{_file_digest(path)};".encode("utf-8"))
+            except OSError:
+                pass
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()[:24]
+
+
+def render_unit(base, plan, mode, slot, info):
+    draw = ImageDraw.Draw(base)
+    if mode == "tricolor":
+        render_tricolor_slot(base, draw, slot, info)
+    elif mode == "salmon":
+        render_salmon_slot(base, draw, slot, info, plan["weapon_rank"])
+    elif mode in ("open", "challenge"):
+        render_versus_slot(base, draw, mode, slot, info, fest_slots=plan["fest_slots"])
+    else:
+        render_versus_slot(base, draw, mode, slot, info, fest_slots=None)
 
-            # まず通常Xを全部描く（ベース）
-            render_versus_mode(base, "xmatch", x_normal, fest_slots=None)
 
-            # その上から「トリカラ枠だけ」上書き
-            render_tricolor_in_xmatch(base, fest_for_tricolor)
+class IncrementalRenderer:
+    """
+    state_dir/state.json + state_dir/frame.rgba を使って、変わった枠だけ描き直す。
+    出力は全体描画と同じ画像になる（重なる単位は同じ描画順でまとめて描き直す）。
+    """
+
+    def __init__(self, state_dir, workers=1):
+        self.state_dir = state_dir
+        self.workers = workers
+        self.state_path = os.path.join(state_dir, "state.json")
+        self.frame_path = os.path.join(state_dir, "frame.rgba")
+        self.last_stats = {}
+
+    def _load(self, frame_fp, size):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if state.get("frame") != frame_fp:
+            return None, None
+        try:
+            with open(self.frame_path, "rb") as f:
+                frame = Image.frombytes("RGBA", size, f.read())
+        except Exception as e:
+            print(f"[WARN] 差分描画: 前回フレームの読み込み失敗: {e}")
+            return None, None
+        return state, frame
+
+    def _save(self, frame_fp, fingerprints, boxes, frame):
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_frame = f"{self.frame_path}.tmp{os.getpid()}"
+            with open(tmp_frame, "wb") as f:
+                f.write(frame.tobytes())
+            os.replace(tmp_frame, self.frame_path)
+
+            tmp_state = f"{self.state_path}.tmp{os.getpid()}"
+            with open(tmp_state, "w", encoding="utf-8") as f:
+                json.dump({"frame": frame_fp, "units": {
+                    uid: {"fp": fingerprints[uid], "bbox": boxes.get(uid)} for uid in fingerprints
+                }}, f)
+            os.replace(tmp_state, self.state_path)
+        except Exception as e:
+            print(f"[WARN] 差分描画: 状態の保存失敗: {e}")
+
+    def _render_full(self, plan, units):
+        base = FEST_BASE_CACHE.get(plan["fest_slots"])
+        if self.workers > 1:
+            boxes = render_units_parallel(base, plan, units, self.workers)
+            if boxes is not None:
+                return base, boxes
+
+        boxes = {}
+        for uid, mode, slot, info in units:
+            with DrawTracker() as t:
+                render_unit(base, plan, mode, slot, info)
+            boxes[uid] = t.bbox
+            note_asset_errors(plan, uid, t)
+        return base, boxes
+
+    def render(self, plan):
+        """
+        plan を描画して完成画像を返す（state_dir の状態も更新する）
+        """
+        size = template_size()
+        units = render_units(plan)
+        fingerprints = {uid: _unit_fingerprint(plan, mode, slot, info) for uid, mode, slot, info in units}
+        frame_fp = _frame_fingerprint(plan, size)
+
+        state, frame = self._load(frame_fp, size)
+        result = None
+
+        if state is not None:
+            result = self._render_dirty(plan, units, fingerprints, state, frame)
+
+        if result is None:
+            base, boxes = self._render_full(plan, units)
+            self.last_stats = {"mode": "full", "units": len(units), "rendered": len(units)}
         else:
-            render_versus_mode(base, "xmatch", fetch_schedule(API_URLS["xmatch"]), fest_slots=None)
+            base, boxes = result
+
+        # 画像が欠けた単位は指紋を残さない（次の実行で必ず描き直す）
+        failed = sorted(uid for uid, n in plan["asset_errors"].items() if n)
+        if failed:
+            print(f"[WARN] 差分描画: 画像が欠けた枠は次回描き直します: {failed}")
+            fingerprints = dict(fingerprints, **{uid: None for uid in failed})
+            self.last_stats["asset_errors"] = len(failed)
+
+        print(f"[INFO] 差分描画: {self.last_stats}")
+        self._save(frame_fp, fingerprints, boxes, base)
+        return base
+
+    def _render_dirty(self, plan, units, fingerprints, state, frame):
+        old_units = state.get("units") or {}
+        if set(old_units) != set(fingerprints):
+            # 枠の構成が変わった（結果件数の増減など）→ 全体描画
+            return None
+
+        old_boxes = {uid: old_units[uid].get("bbox") for uid in fingerprints}
+        dirty = {uid for uid in fingerprints if old_units[uid].get("fp") != fingerprints[uid]}
+
+        if not dirty:
+            self.last_stats = {"mode": "reuse", "units": len(units), "rendered": 0}
+            return frame, old_boxes
+
+        clean = FEST_BASE_CACHE.get(plan["fest_slots"])
+
+        # 描き直した範囲が描き直していない単位に掛かったら、その単位も加えてやり直す
+        # （トリカラ枠は同じ Xマッチ枠の上に描くので、ここで一緒に描き直しになる）
+        while True:
+            # 消す範囲が他の単位に掛かっていたら、その単位も描き直す
+            changed = True
+            while changed:
+                changed = False
+                for uid in fingerprints:
+                    if uid not in dirty and any(_boxes_overlap(old_boxes[uid], old_boxes[d]) for d in dirty):
+                        dirty.add(uid)
+                        changed = True
+
+            # 変わった単位の範囲を下地に戻してから、描画順どおりに描き直す
+            out = frame.copy()
+            for uid in dirty:
+                box = old_boxes[uid]
+                if box:
+                    out.paste(clean.crop(tuple(box)), (box[0], box[1]))
+
+            boxes = dict(old_boxes)
+            for uid, mode, slot, info in units:
+                if uid not in dirty:
+                    continue
+                with DrawTracker() as t:
+                    render_unit(out, plan, mode, slot, info)
+                boxes[uid] = t.bbox
+                note_asset_errors(plan, uid, t)
+
+            touched = {o for o in fingerprints if o not in dirty
+                       and any(_boxes_overlap(boxes[d], boxes[o]) for d in dirty)}
+            if not touched:
+                break
+            dirty |= touched
+
+        self.last_stats = {"mode": "incremental", "units": len(units), "rendered": len(dirty)}
+        return out, boxes
 
 
-        render_salmon_mode(base, fetch_schedule(API_URLS["salmon"]))
+# ==========================
+# ★ 描画結果キャッシュ（入力が同じなら描かずに前回の画像 + schedule.json を使う）
+# ==========================
+#   キー = 描画に効く入力（整列済みの各枠・フェス枠・素材/フォント/コード）+ 出力オプション（形式・版）
+#   同じ時間帯を複数のワークフローが描く / ローテーション内で毎時描き直す場合に描画とエンコードを丸ごと省く。
+#   PNG/JPEG/WebP の出力に時刻などは入らないので、同じ入力なら同じバイト列になる。
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", ".cache/render")
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "24"))
+# 実行ごとに変わる / 出力先で変わるので、キャッシュには入れず毎回作るもの
+RENDER_CACHE_VOLATILE_KEYS = ("updatedHour", "imageVariants")
+RENDER_CACHE = None  # main() で --render-cache から作る
 
-    except Exception as e:
-        print(f"[ERR] レンダリングエラー: {e}")
 
-    # ==========================
-    # ✅ JSON出力（nowスロットの情報を優先）
-    # ==========================
-    schedule_json_path = os.getenv("SCHEDULE_JSON", "/tmp/schedule.json")
+def render_fingerprint(plan, size):
+    """
+    描画結果を決める入力のハッシュ（差分描画と同じ単位ごとの指紋 + フレームの指紋）
+    """
+    units = render_units(plan)
+    h = hashlib.sha256(_frame_fingerprint(plan, size).encode("utf-8"))
+    for uid, mode, slot, info in units:
+        h.update(f"{uid}={_unit_fingerprint(plan, mode, slot, info)};".encode("utf-8"))
+    return h.hexdigest()
 
-    if fest_slots.get("now"):
-        open_now = fetch_now(API_NOW_URLS["fest_open"])
-        chal_now = fetch_now(API_NOW_URLS["fest_challenge"])
-    else:
-        open_now = fetch_now(API_NOW_URLS["open"])
-        chal_now = fetch_now(API_NOW_URLS["challenge"])
 
-    reg_now = fetch_now(API_NOW_URLS["regular"])
+class RenderCache:
+    """
+    cache_dir/<key>/ に 出力画像（本体 + 版）と meta.json（schedule.json の中身・各画像の info）を置く。
+    古いものから RENDER_CACHE_MAX_ENTRIES 件を超えた分を消す。
+    """
+
+    def __init__(self, cache_dir, max_entries=RENDER_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def key(plan, encode=None, variants=()):
+        opts = dict(image_encode.DEFAULT_OPTIONS)
+        opts.update({k: v for k, v in (encode or {}).items() if v is not None})
+        h = hashlib.sha256(render_fingerprint(plan, template_size()).encode("utf-8"))
+        h.update(json.dumps([
+            opts,
+            [[name, image_encode.VARIANT_PROFILES[name]] for name in variants],
+        ], sort_keys=True, default=str).encode("utf-8"))
+        with open(os.path.abspath(image_encode.__file__), "rb") as f:
+            h.update(f.read())
+        return h.hexdigest()[:32]
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        """
+        meta を返す（無い/壊れている/画像が欠けていれば None）
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            for info in meta["outputs"].values():
+                if os.path.getsize(os.path.join(entry_dir, info["file"])) != info["bytes"]:
+                    raise ValueError(f"size mismatch: {info['file']}")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"[WARN] 描画キャッシュ: 読み込み失敗（描き直します）: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return meta
+
+    def restore(self, key, meta, targets):
+        """
+        キャッシュの画像を targets（出力名 → パス）に書き、出力名 → info（path を差し替えたもの）を返す
+        """
+        entry_dir = self._entry_dir(key)
+        infos = {}
+        for name, path in targets.items():
+            info = dict(meta["outputs"][name])
+            with open(os.path.join(entry_dir, info.pop("file")), "rb") as f:
+                data = f.read()
+            target_dir = os.path.dirname(path)
+            if target_dir:
+                os.makedirs(target_dir, exist_ok=True)
+            image_encode._write_atomic(path, data)
+            info["path"] = path
+            infos[name] = info
+        return infos
+
+    def store(self, key, payload, infos):
+        """
+        出力済みの画像（infos の path）と payload を保存する（失敗しても WARN だけ）
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            outputs = {}
+            for name, info in infos.items():
+                file = f"{name}{os.path.splitext(info['path'])[1]}"
+                with open(info["path"], "rb") as src, open(os.path.join(tmp_dir, file), "wb") as dst:
+                    dst.write(src.read())
+                outputs[name] = dict({k: v for k, v in info.items() if k != "path"}, file=file)
+
+            meta = {
+                "payload": {k: v for k, v in payload.items() if k not in RENDER_CACHE_VOLATILE_KEYS},
+                "outputs": outputs,
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self.stores += 1
+            self._prune()
+        except Exception as e:
+            print(f"[WARN] 描画キャッシュ: 保存失敗: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and ".tmp" not in name:
+                entries.append((os.path.getmtime(path), path))
+        for _, path in sorted(entries)[:-self.max_entries or None]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def report(self):
+        stats = {"hits": self.hits, "misses": self.misses, "stores": self.stores}
+        print(f"[INFO] 描画キャッシュ: {stats}")
+        return stats
+
+
+# ==========================
+# ★ schedule.json（投稿文用）の組み立て
+# ==========================
+PAYLOAD_MODES = ["regular", "open", "challenge", "xmatch", "salmon"]
+
+
+def _first_item(results):
+    if isinstance(results, list) and results and isinstance(results[0], dict):
+        return results[0]
+    return {}
+
+
+def _stage_names(stages):
+    return [s.get("name") for s in (stages or [])][:2]
+
+
+def build_schedule_payload(fest_slots, now_items, updated_hour=None):
+    """
+    各モードの now 枠（dict）から schedule.json の中身を作る。
+    now_items: {"regular", "open", "challenge", "xmatch", "salmon"} -> now 枠
+      ※フェス中の xmatch はフェス(オープン)の now 枠（トリカラ判定に使う）
+    updated_hour: 先の枠を前もって描く場合の「その枠の時刻」（省略時は現在時刻）
+    """
+    if updated_hour is None:
+        updated_hour = now_jst().hour
+
+    reg_now = now_items.get("regular") or {}
+    open_now = now_items.get("open") or {}
+    chal_now = now_items.get("challenge") or {}
+    x_now = now_items.get("xmatch") or {}
+    coop_now = now_items.get("salmon") or {}
 
     if fest_slots.get("now"):
-        fest_open_now = fetch_now(API_NOW_URLS["fest_open"])
-        if fest_open_now.get("is_tricolor") and fest_open_now.get("tricolor_stages"):
+        if x_now.get("is_tricolor") and x_now.get("tricolor_stages"):
             x_rule_name = "トリカラマッチ"
-            x_stages_list = [s.get("name") for s in (fest_open_now.get("tricolor_stages") or [])][:2]
+            x_stages_list = _stage_names(x_now.get("tricolor_stages"))
         else:
             x_rule_name = "-"
             x_stages_list = []
     else:
-        x_now = fetch_now(API_NOW_URLS["xmatch"])
         x_rule_name = (x_now.get("rule") or {}).get("name", "不明")
-        x_stages_list = [s.get("name") for s in (x_now.get("stages") or [])][:2]
-
-    coop_now = fetch_now(API_NOW_URLS["salmon"])
+        x_stages_list = _stage_names(x_now.get("stages"))
 
     # ★追加：サーモン難易度ランク（画像化と同じロジックで now 武器から算出）
     weapon_rank_dict = load_weapon_rank()
@@ -1086,18 +2672,18 @@ def main():
         weapon_rank_dict
     )
 
-    payload = {
-        "updatedHour": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).hour,
+    return {
+        "updatedHour": updated_hour,
         "isFestActive": bool(fest_slots.get("now")),
         "festSlots": fest_slots,
 
-        "regularStages": [s.get("name") for s in (reg_now.get("stages") or [])][:2],
+        "regularStages": _stage_names(reg_now.get("stages")),
 
         "openRule": (open_now.get("rule") or {}).get("name", "不明"),
-        "openStages": [s.get("name") for s in (open_now.get("stages") or [])][:2],
+        "openStages": _stage_names(open_now.get("stages")),
 
         "challengeRule": (chal_now.get("rule") or {}).get("name", "不明"),
-        "challengeStages": [s.get("name") for s in (chal_now.get("stages") or [])][:2],
+        "challengeStages": _stage_names(chal_now.get("stages")),
 
         "xRule": x_rule_name,
         "xStages": x_stages_list,
@@ -1109,17 +2695,278 @@ def main():
         "salmonDifficulty": salmon_difficulty,
     }
 
+
+def verify_payload_against_now(payload, fest_slots):
+    """
+    （任意）now API から同じ payload を組み立てて突き合わせる整合性チェック。
+    食い違いは WARN を出すだけで、出力する JSON は描画側のものを使う。
+    """
+    if fest_slots.get("now"):
+        keys = {"regular": "regular", "open": "fest_open", "challenge": "fest_challenge",
+                "xmatch": "fest_open", "salmon": "salmon"}
+    else:
+        keys = {m: m for m in PAYLOAD_MODES}
+
+    nows = prefetch_all(schedule_keys=[], now_keys=sorted(set(keys.values())))["now"]
+    expected = build_schedule_payload(fest_slots, {m: nows[k] for m, k in keys.items()})
+
+    mismatched = [k for k in expected if k != "updatedHour" and expected[k] != payload.get(k)]
+    for k in mismatched:
+        print(f"[WARN] now API と不一致: {k} timeline={payload.get(k)} now={expected[k]}")
+    if not mismatched:
+        print("[INFO] now API との整合性チェック OK")
+    return mismatched
+
+# ==========================
+# ★ 1枚分の描画（取得結果 → 画像 + JSON 用の now 枠）
+# ==========================
+def plan_schedule(sched, nows):
+    """
+    取得済みの schedule / now から (fest_slots, plan) を作る（描画はしない。失敗したら plan は None）
+    """
+    # フェス枠判定→どの枠に何を描くか決める
+    fest_slots = check_fest_slots(sched["fest_open"])
+    try:
+        plan = build_render_plan(sched, nows, fest_slots)
+    except Exception as e:
+        print(f"[ERR] レンダリングエラー: {e}")
+        plan = None
+    return fest_slots, plan
+
+
+def render_schedule(sched, nows, render_workers=1, incremental="", planned=None):
+    """
+    取得済みの schedule / now から1枚描く。(fest_slots, now_items, base) を返す。
+    planned: plan_schedule() の結果（描画キャッシュの判定で先に作った場合）
+    描画に失敗したら plan["render_error"] に残す（その画像は描画キャッシュに入れない）
+    """
+    fest_slots, plan = planned or plan_schedule(sched, nows)
+    base = None
+    now_items = {}
+    if plan is None:
+        return fest_slots, now_items, FEST_BASE_CACHE.get(fest_slots)
+
+    try:
+        # ★JSON 用：実際に描画した各モードの now 枠（= results[0]）を控えておく
+        now_items = plan_now_items(plan)
+
+        if incremental:
+            base = IncrementalRenderer(incremental, render_workers).render(plan)
+        else:
+            # オーバーレイ適用済みの下地（キャッシュ）に全部描く
+            base = FEST_BASE_CACHE.get(fest_slots)
+            render_plan(base, plan, render_workers)
+
+    except Exception as e:
+        print(f"[ERR] レンダリングエラー: {e}")
+        plan["render_error"] = str(e)
+        if base is None:
+            base = FEST_BASE_CACHE.get(fest_slots)
+
+    return fest_slots, now_items, base
+
+
+# ==========================
+# ★ 先の枠のまとめ描画（--batch）
+# ==========================
+#   schedule API は先の枠まで返してくるので、「k 個先の枠が now になった時」の画像を
+#   同じプロセスでまとめて描いておく（フォント/キャッシュ/素材は共有）。
+#   出力: <batch_dir>/<画像名>_YYYYMMDDHH.png と schedule_YYYYMMDDHH.json（時刻は JST の枠開始）
+def _parse_iso(v):
+    if not isinstance(v, str) or not v:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(v.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _drop_ended(results, at):
+    """
+    at の時点で終わっている枠を落とす（at に始まる枠 or at を含む枠が先頭になる）
+    """
+    out = []
+    for r in results or []:
+        end = _parse_iso((r or {}).get("end_time"))
+        if end is not None and end <= at:
+            continue
+        out.append(r)
+    return out
+
+
+def shift_schedules(sched, nows, k):
+    """
+    regular の k 個先の枠を now とみなした schedule / now を作る。枠が足りなければ None。
+    """
+    regular = normalize_to_now(sched["regular"], nows["regular"])
+    if k >= len(regular) or not isinstance(regular[k], dict):
+        return None
+
+    at = _parse_iso(regular[k].get("start_time"))
+    if at is None:
+        return None
+
+    shifted = {key: _drop_ended(results, at) for key, results in sched.items() if key != "regular"}
+    shifted["regular"] = regular[k:]
+    return shifted, {"regular": regular[k]}, at
+
+
+def render_batch(sched, nows, count, batch_dir, render_workers=1, encode=None):
+    """
+    1〜count 個先の枠をそれぞれ now として描き、画像と schedule.json を batch_dir に書く。
+    画像は encode（image_encode のオプション）で書く。
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(OUTPUT_PATH))
+    written = []
+
+    for k in range(1, count + 1):
+        shifted = shift_schedules(sched, nows, k)
+        if shifted is None:
+            print(f"[WARN] --batch: {k} 個先の枠がありません（ここまで）")
+            break
+        sched_k, nows_k, at = shifted
+        at_jst = at.astimezone(JST)
+        tag = at_jst.strftime("%Y%m%d%H")
+
+        fest_slots, now_items, base = render_schedule(sched_k, nows_k, render_workers=render_workers)
+        payload = build_schedule_payload(fest_slots, now_items, updated_hour=at_jst.hour)
+
+        image_path = os.path.join(batch_dir, f"{stem}_{tag}{ext or '.png'}")
+        json_path = os.path.join(batch_dir, f"schedule_{tag}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        with run_metrics.span("encode", path=image_path) as sp:
+            sp.update(image_encode.save_image(base, image_path, **(encode or {})))
+        written.append(image_path)
+        print(f"[INFO] --batch: {at_jst.strftime('%m/%d %H:%M')} → {image_path}")
+
+    print(f"[INFO] --batch: {len(written)}/{count} 枚出力")
+    return written
+
+
+# ==========================
+# ★ メイン
+# ==========================
+def collect_run_counters(**info):
+    """
+    各キャッシュのヒット率などを run_metrics に集める（ログにも出す）
+    """
+    run_metrics.set_counters("request_memo", REQUEST_MEMO.report())
+    run_metrics.set_counters("image_cache", IMAGE_CACHE_RGBA.report())
+    run_metrics.set_counters("fest_base_cache", FEST_BASE_CACHE.report())
+    run_metrics.set_counters("label_cache", LABEL_CACHE.report())
+    if hasattr(session, "report"):
+        run_metrics.set_counters("http_cassette", session.report())
+    if RENDER_CACHE is not None:
+        run_metrics.set_counters("render_cache", RENDER_CACHE.report())
+    run_metrics.set_info(**info)
+
+
+def main(argv=None):
+    global OUTPUT_PATH, RENDER_CACHE
+
+    args = parse_args(argv)
+    OUTPUT_PATH = args.output
+
+    if args.build_asset_pack:
+        asset_pack.build_pack(args.asset_pack or asset_pack.ASSET_PACK_PATH, asset_pack_spec())
+        return
+
+    out_dir = os.path.dirname(OUTPUT_PATH)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+
+    if not os.path.exists(TEMPLATE_PATH):
+        print(f"[ERROR] テンプレートが見つかりません: {TEMPLATE_PATH}")
+        return
+
+    print(f"[INFO] ベーステンプレートを使用: {TEMPLATE_PATH}")
+    init_asset_pack(args.asset_pack)
+
+    # ★描画前に schedule / now を全部まとめて並列取得（メモは実行ごとにリセット）
+    REQUEST_MEMO.reset()
+    run_metrics.METRICS.reset()
+    with run_metrics.span("prefetch", backend=args.fetch_backend):
+        fetched = prefetch_all(now_keys=["regular"], backend=args.fetch_backend)
+    sched = fetched["schedule"]
+    nows = fetched["now"]
+
+    # ★入力（整列済みの各枠など）が前回と同じなら、描かずに描画キャッシュの画像 + JSON を使う
+    RENDER_CACHE = RenderCache(args.render_cache) if args.render_cache else None
+    variants = image_encode.parse_variants(args.variants)
+    cache_key = cached = None
+
+    with run_metrics.span("render", workers=args.render_workers, incremental=bool(args.incremental)) as sp:
+        planned = plan_schedule(sched, nows)
+        fest_slots, plan = planned
+        if RENDER_CACHE is not None and plan is not None:
+            cache_key = RENDER_CACHE.key(plan, encode_options(args), variants)
+            cached = RENDER_CACHE.load(cache_key)
+        sp["cached"] = cached is not None
+
+        if cached is None:
+            fest_slots, now_items, base = render_schedule(
+                sched, nows, render_workers=args.render_workers, incremental=args.incremental, planned=planned
+            )
+        else:
+            print(f"[INFO] 描画キャッシュ: ヒット（描画を省略）: {cache_key}")
+
+    # ==========================
+    # ✅ JSON出力（描画済みタイムラインの now スロットから組み立て）
+    # ==========================
+    schedule_json_path = os.getenv("SCHEDULE_JSON", "/tmp/schedule.json")
+
+    if cached is None:
+        payload = build_schedule_payload(fest_slots, now_items)
+    else:
+        # updatedHour は実行時刻なので毎回入れ直す（並びも描画時と同じにする）
+        payload = {"updatedHour": now_jst().hour, **cached["payload"]}
+
+    if args.verify_now:
+        verify_payload_against_now(payload, fest_slots)
+
+    # ✅画像を保存（本体 + 投稿先ごとの版を同じキャンバスから並列に）
+    with run_metrics.span("encode", path=OUTPUT_PATH, variants=len(variants), cached=cached is not None) as sp:
+        if cached is None:
+            infos = image_encode.save_outputs(
+                base, OUTPUT_PATH, variants, out_dir=args.variants_dir or None, **encode_options(args)
+            )
+        else:
+            targets = {"main": OUTPUT_PATH}
+            for name in variants:
+                targets[name] = image_encode.variant_path(OUTPUT_PATH, name, args.variants_dir or None)
+            infos = RENDER_CACHE.restore(cache_key, cached, targets)
+        sp.update(infos["main"])
+    for key, info in infos.items():
+        if key != "main":
+            run_metrics.set_info(**{f"variant_{key}": info})
+    print(f"[INFO] 画像出力完了: {OUTPUT_PATH}")
+
+    # 投稿側が自分用の版を選べるように、版の一覧を schedule.json に入れる
+    if variants:
+        payload["imageVariants"] = image_encode.variants_manifest(infos)
+
     with open(schedule_json_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
     print(f"[INFO] JSON出力完了: {schedule_json_path}")
 
-        # ✅最後に画像を保存（これが無いと Thumbnail.png が更新されない）
-    base.save(OUTPUT_PATH)
-    print(f"[INFO] 画像出力完了: {OUTPUT_PATH}")
+    # 描画に失敗した / 画像が欠けた画像はキャッシュしない（次の実行で描き直す）
+    asset_errors = asset_error_count(plan)
+    if asset_errors:
+        print(f"[WARN] 画像が欠けた枠があります（{asset_errors} 件）: 描画キャッシュに保存しません")
+    if cached is None and cache_key is not None and not plan.get("render_error") and not asset_errors:
+        RENDER_CACHE.store(cache_key, payload, infos)
 
+    if args.batch > 0:
+        render_batch(sched, nows, args.batch, args.batch_dir or os.path.join(out_dir or ".", "batch"),
+                     render_workers=args.render_workers, encode=encode_options(args))
 
-if __name__ == "__main__":
-    main()
-
+    LABEL_CACHE.save()
+    collect_run_counters(output=OUTPUT_PATH, festMask=fest_slot_mask(fest_slots), backend=args.fetch_backend,
+                         assetErrors=asset_errors, renderError=(plan or {}).get("render_error"))
+    run_metrics.write_report(run_metrics.report_path(schedule_json_path))
 
 
+if __name__ == "__main__":
+    main()